@@ -0,0 +1,89 @@
+# bench_mix_engine.py
+# Measures the NumPy mix engine without an audio device: all players play synthetic tracks
+# with pan and chain them with equal-power crossfades, and the mix is rendered block by
+# block as the device callback would.
+# The render time per block is compared against the block's real-time budget.
+# With --stream the tracks are written to temporary WAV files and streamed from disk through
+# reader threads and ring buffers (mix_engine.StreamSound), as very long tracks are in the app.
+#
+# Usage: python benchmarks/bench_mix_engine.py [--players 6] [--seconds 60] [--block 512] [--stream] [--out mix.wav]
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mix_engine # noqa: E402
+
+def make_track(seconds, samplerate, channels, rng):
+    """Synthetic int16 track (noise), read-only like the PCM cache entries."""
+    pcm = (rng.standard_normal((int(seconds * samplerate), channels)) * 3000).astype(np.int16)
+    pcm.setflags(write=False)
+    return pcm
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NumPy mix engine headless.")
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--seconds", type=float, default=60.0, help="Length of mix to render")
+    parser.add_argument("--samplerate", type=int, default=44100)
+    parser.add_argument("--block", type=int, default=mix_engine.DEFAULT_BLOCK_FRAMES, help="Frames per block")
+    parser.add_argument("--fade-ms", type=int, default=2000, help="Crossfade length between tracks")
+    parser.add_argument("--out", help="Also write the mix to this WAV file (file output, unpaced)")
+    parser.add_argument("--stream", action="store_true", help="Stream the tracks from temporary WAV files")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    tracks = [make_track(7.5 + i, args.samplerate, 1 + i % 2, rng) for i in range(args.players)] # Mixed lengths and mono/stereo
+    temp_dir = tempfile.TemporaryDirectory()
+    if args.stream:
+        paths = [os.path.join(temp_dir.name, f"track_{i}.wav") for i in range(len(tracks))]
+        for path, pcm in zip(paths, tracks): sf.write(path, pcm, args.samplerate)
+        sounds = [mix_engine.open_stream(path) for path in paths] # Each play of a stream opens a fresh one
+    else:
+        sounds = [mix_engine.make_sound(pcm, args.samplerate) for pcm in tracks]
+    output = "file" if args.out else "manual"
+    mix_engine.start_engine(args.samplerate, voices=2 * args.players, block_frames=args.block, output=output,
+                            file_path=args.out, realtime=False)
+    channels = [mix_engine.EngineChannel(i, args.players + i) for i in range(args.players)]
+    fade_frames = args.fade_ms * args.samplerate // 1000
+
+    def arm_next(i, current):
+        """Crossfades player i to the following synthetic track fade_frames before the current one ends."""
+        channels[i].arm_crossfade(sounds[(current + 1) % len(sounds)], sounds[current].frames - fade_frames, args.fade_ms)
+        return (current + 1) % len(sounds)
+
+    playing = []
+    for i, channel in enumerate(channels):
+        channel.set_volume(0.7, 0.3 + 0.1 * i)
+        channel.play(sounds[i], fade_ms=500)
+        playing.append(i)
+    upcoming = [arm_next(i, playing[i]) for i in range(args.players)]
+
+    total_frames = int(args.seconds * args.samplerate)
+    start = time.perf_counter()
+    while mix_engine.get_engine_stats()["frames"] < total_frames:
+        if output == "manual": mix_engine.render(args.block * 16)
+        else: time.sleep(0.01)
+        for i in mix_engine.poll_crossfades(): # Keep every player busy, as prefetching does in the app
+            playing[i] = upcoming[i]
+            upcoming[i] = arm_next(i, playing[i])
+    elapsed = time.perf_counter() - start
+    stats = mix_engine.get_engine_stats()
+    mix_engine.stop_engine()
+    sounds.clear() # Streams stop their readers before their files are deleted
+    temp_dir.cleanup()
+
+    print(f"{args.players} players, {args.block}-frame blocks at {args.samplerate} Hz, {stats['frames'] / args.samplerate:.1f} s of mix "
+          f"({stats['crossfades']} crossfades of {args.fade_ms} ms{', streamed' if args.stream else ''})")
+    print(f"  per block: avg {stats['avg_render_ms']:.4f} ms, max {stats['max_render_ms']:.4f} ms "
+          f"(budget {stats['block_budget_ms']:.2f} ms, avg load {stats['avg_render_ms'] / stats['block_budget_ms']:.1%})")
+    print(f"  {stats['frames'] / args.samplerate / elapsed:.0f}x real time overall")
+    if args.stream: print(f"  stream underruns: {stats['stream_underruns']} (unpaced, so readers race the mixer)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# bench_peaks.py
+# Compares waveform peak extraction: the original per-segment Python loop over a full
+# float32 read, against the peak pyramid built by streaming the file (as for streamed tracks)
+# and from the in-memory int16 playback buffer (as for decoded tracks), rendered at the width.
+#
+# The pyramid's pixel edges are the exact N/width edges rounded down to a pyramid bucket (at
+# least PYRAMID_BUCKETS_PER_PIXEL per pixel), while the old loop used ceil(N/width) spans. On
+# noisy audio that moves some per-pixel maxima, so the pyramids are checked against a direct
+# max over their own spans (which must match to float rounding); the difference to the old
+# loop is printed for information only.
+#
+# Usage: python benchmarks/bench_peaks.py [--seconds 600] [--width 400] [--file some.wav]
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import waveform_peaks # noqa: E402
+
+PEAK_TOLERANCE = 1e-6 # float32 rounding of the normalized display peaks
+
+def legacy_peaks(track_path, width):
+    """The loop randomizer.py used before: full float32 read, then one Python iteration per pixel."""
+    data, samplerate = sf.read(track_path, dtype='float32')
+    if data.ndim > 1: data = data.mean(axis=1) # Make mono
+    samples_per_pixel = math.ceil(len(data) / width)
+    if samples_per_pixel <= 0: samples_per_pixel = 1
+    processed_data = []
+    for i in range(width):
+        start = i * samples_per_pixel
+        end = min((i + 1) * samples_per_pixel, len(data))
+        if start >= end:
+            processed_data.append(processed_data[-1] if processed_data else 0)
+            continue
+        processed_data.append(np.max(np.abs(data[start:end])))
+    max_amp = max(processed_data) if processed_data else 1.0
+    if max_amp == 0: max_amp = 1.0
+    return [amp / max_amp for amp in processed_data]
+
+def streaming_peaks(track_path, width):
+    pyramid = waveform_peaks.build_peak_pyramid_streaming(track_path)
+    return waveform_peaks.summary_to_display_peaks(waveform_peaks.render_peaks(pyramid, width))
+
+def in_memory_peaks(pcm, width):
+    pyramid = waveform_peaks.build_peak_pyramid_from_pcm(pcm)
+    return waveform_peaks.summary_to_display_peaks(waveform_peaks.render_peaks(pyramid, width))
+
+def reference_peaks(pcm, pyramid, width):
+    """Direct per-pixel max of |mono| over the frame spans render_peaks uses, normalized like the display peaks."""
+    mono = pcm.astype(np.float64).sum(axis=1) / (32768.0 * pcm.shape[1])
+    _, spb, starts, end_bucket = waveform_peaks.pixel_buckets(pyramid, width)
+    edges = np.append(starts, end_bucket) * spb
+    peaks = np.array([np.abs(mono[start:max(end, start + spb)]).max() for start, end in zip(edges[:-1], edges[1:])])
+    max_amp = peaks.max() or 1.0
+    return peaks / max_amp
+
+def measure(label, func, *args):
+    """Runs func once, returning (result, seconds, peak traced MB)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"  {label:<28} {elapsed * 1000:9.1f} ms   peak alloc {peak / 1048576:8.1f} MB")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark waveform peak extraction.")
+    parser.add_argument("--seconds", type=float, default=600.0, help="Length of the generated test file")
+    parser.add_argument("--samplerate", type=int, default=44100)
+    parser.add_argument("--width", type=int, default=400, help="Number of peak buckets (WAVEFORM_WIDTH)")
+    parser.add_argument("--file", help="Benchmark an existing audio file instead of a generated one")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        track_path = args.file
+        if not track_path:
+            track_path = os.path.join(temp_dir, "bench.wav")
+            rng = np.random.default_rng(0)
+            frames = int(args.seconds * args.samplerate)
+            with sf.SoundFile(track_path, "w", samplerate=args.samplerate, channels=2, subtype="PCM_16") as f:
+                for start in range(0, frames, 1 << 20): # Write in chunks to keep the generator light
+                    n = min(1 << 20, frames - start)
+                    f.write((rng.standard_normal((n, 2)) * 0.2).astype(np.float32))
+        info = sf.info(track_path)
+        print(f"File: {track_path} ({info.frames / info.samplerate:.0f}s, {info.channels}ch, {info.samplerate}Hz), width={args.width}")
+
+        legacy = measure("legacy loop (float32 read)", legacy_peaks, track_path, args.width)
+        streamed = measure("streamed pyramid (sf.blocks)", streaming_peaks, track_path, args.width)
+        pcm, _ = sf.read(track_path, dtype="int16", always_2d=True) # The playback buffer, already in RAM
+        in_memory = measure("pyramid from int16 buffer", in_memory_peaks, pcm, args.width)
+
+        reference = reference_peaks(pcm, waveform_peaks.build_peak_pyramid_from_pcm(pcm), args.width)
+        streamed_error = np.max(np.abs(np.subtract(reference, streamed)))
+        in_memory_error = np.max(np.abs(np.subtract(reference, in_memory)))
+        print(f"Max difference vs direct max over the same spans: streaming {streamed_error:.2e}, in-memory {in_memory_error:.2e}")
+        assert streamed_error < PEAK_TOLERANCE and in_memory_error < PEAK_TOLERANCE, "pyramid peaks differ from the audio"
+        print(f"Max difference vs legacy loop (different pixel spans, informational): "
+              f"streaming {np.max(np.abs(np.subtract(legacy, streamed))):.2e}, in-memory {np.max(np.abs(np.subtract(legacy, in_memory))):.2e}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# bench_switch.py
+# Replays the track switches of a seeded session: every player picks its next track from
+# its own seeded stream with the app's history blocking, optionally decoding each pick.
+# The same --seed gives the same picks (and so the same decode workload) on every run;
+# compare the printed fingerprint to check that two runs did identical work.
+#
+# With --window, each pick decodes only that many seconds (from a seeded random offset),
+# as the app's "partial_decode": "random" mode does.
+#
+# Usage: python benchmarks/bench_switch.py [--seed 1234] [--players 6] [--switches 2000] [--folder some/dir [--decode [--window 9]]]
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import decoding # noqa: E402
+import library_index # noqa: E402
+import track_selection # noqa: E402
+
+MAX_HISTORY = 20 # Same as randomizer.py
+SUPPORTED_FORMATS = ('.wav', '.mp3', '.ogg', '.flac', '.aiff', '.aif')
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the track switches of a seeded session.")
+    parser.add_argument("--seed", type=int, help="Session seed (default: a new one, printed)")
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--switches", type=int, default=2000, help="Track switches per player")
+    parser.add_argument("--tracks", type=int, default=100000, help="Synthetic track count when no --folder is given")
+    parser.add_argument("--folder", help="Pick from the audio files in this folder instead of synthetic names")
+    parser.add_argument("--decode", action="store_true", help="Decode every picked track (needs --folder)")
+    parser.add_argument("--window", type=float, help="Decode only this many seconds of each pick (needs --decode)")
+    args = parser.parse_args()
+    if args.decode and not args.folder: parser.error("--decode needs --folder")
+    if args.window and not args.decode: parser.error("--window needs --decode")
+
+    seed = args.seed if args.seed is not None else track_selection.new_session_seed()
+    if args.folder: tracks = sorted(library_index.scan_folder(args.folder, SUPPORTED_FORMATS)) # Stable order for the seed
+    else: tracks = [f"track_{n:06d}.wav" for n in range(args.tracks)]
+    if not tracks: raise SystemExit("No tracks found.")
+    print(f"Seed {seed}: {args.players} players x {args.switches} switches over {len(tracks)} tracks"
+          + (", decoding each pick" if args.decode else ""))
+
+    fingerprint = hashlib.sha1()
+    pick_s = decode_s = 0.0
+    for player in range(args.players):
+        rng = track_selection.session_rng(seed, f"player:{player}")
+        offset_rng = track_selection.session_rng(seed, f"offsets:{player}") # Same streams as randomizer.py
+        bag = track_selection.new_bag(tracks)
+        history = []
+        for _ in range(args.switches):
+            start = time.perf_counter()
+            path = track_selection.pick(bag, rng)
+            if bag["current"] is not None: # Same history handling as push_history
+                if len(history) == MAX_HISTORY: track_selection.unblock(bag, history.pop(0))
+                history.append(bag["current"])
+                track_selection.block(bag, bag["current"])
+            track_selection.set_current(bag, path)
+            pick_s += time.perf_counter() - start
+            fingerprint.update(path.encode("utf-8", "surrogateescape") + b"\0")
+            if args.decode:
+                start = time.perf_counter()
+                try:
+                    if args.window: decoding.read_track_window(path, None, args.window, offset_rng.random())
+                    else: decoding.read_track_int16(path)
+                except Exception as e: print(f"  Decode failed: {path}: {e}")
+                decode_s += time.perf_counter() - start
+
+    switches = args.players * args.switches
+    print(f"  picks    {pick_s * 1e6 / switches:9.2f} us per switch")
+    if args.decode: print(f"  decodes  {decode_s * 1000 / switches:9.2f} ms per switch (PCM cache: {decoding.get_pcm_cache_stats()})")
+    if args.window: print(f"  windows  {decoding.window_stats}")
+    print(f"  workload fingerprint {fingerprint.hexdigest()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+# bench_waveform_render.py
+# Measures the cost of one waveform progress tick: the original delete-and-recreate of
+# every played line, against recoloring only the columns that changed since the last tick.
+#
+# The timed run needs a display (Tk canvas); on a headless machine use xvfb-run. --count-ops
+# runs without Tk and counts the canvas calls each tick makes instead, which is what the time
+# scales with.
+#
+# Usage: [xvfb-run] python benchmarks/bench_waveform_render.py [--players 6] [--width 400] [--ticks 2000] [--count-ops]
+
+import argparse
+import math
+import time
+import tkinter as tk
+
+WAVEFORM_HEIGHT = 60
+BG_COLOR = "grey50"
+PLAYED_COLOR = "#00FF00"
+
+def make_waveform(width):
+    """Synthetic normalized peaks, one per pixel."""
+    return [0.2 + 0.8 * abs(math.sin(i * 0.05)) for i in range(width)]
+
+def draw_background(canvas, waveform_data):
+    """Draws the grey lines once, returning their item ids (what redraw_waveform does)."""
+    center_y = half_height = WAVEFORM_HEIGHT / 2
+    line_ids = []
+    for x, amp in enumerate(waveform_data):
+        line_height = max(1, amp * half_height)
+        line_ids.append(canvas.create_line(x, center_y - line_height, x, center_y + line_height,
+                                           fill=BG_COLOR, width=1, tags="waveform_bg"))
+    return line_ids
+
+def legacy_tick(canvas, waveform_data, played_pixels, _state):
+    """The old update_waveform_progress body: delete all played lines, recreate them."""
+    canvas.delete("waveform_played")
+    center_y = half_height = WAVEFORM_HEIGHT / 2
+    for x in range(played_pixels):
+        line_height = max(1, waveform_data[x] * half_height)
+        canvas.create_line(x, center_y - line_height, x, center_y + line_height,
+                           fill=PLAYED_COLOR, width=1, tags="waveform_played")
+
+def incremental_tick(canvas, _waveform_data, played_pixels, state):
+    """The new body: recolor only the lines between the last and the current position."""
+    line_ids, drawn = state["line_ids"], state["drawn"]
+    if played_pixels < drawn:
+        for item_id in line_ids[played_pixels:drawn]: canvas.itemconfigure(item_id, fill=BG_COLOR)
+    else:
+        for item_id in line_ids[drawn:played_pixels]: canvas.itemconfigure(item_id, fill=PLAYED_COLOR)
+    state["drawn"] = played_pixels
+
+class CountingCanvas:
+    """Records canvas calls instead of drawing (--count-ops). Same call signatures as tk.Canvas."""
+
+    def __init__(self):
+        self.calls = {"create_line": 0, "delete": 0, "itemconfigure": 0}
+        self.items = 0
+
+    def create_line(self, *args, **kwargs):
+        self.calls["create_line"] += 1
+        self.items += 1
+        return self.items
+
+    def delete(self, *tags):
+        self.calls["delete"] += 1
+
+    def itemconfigure(self, item_id, **options):
+        self.calls["itemconfigure"] += 1
+
+def count_ops(tick_fn, players, width, ticks):
+    """Advances progress like run() on counting canvases; returns (avg calls per tick, max calls per tick)."""
+    canvases = [CountingCanvas() for _ in range(players)]
+    waveform_data = make_waveform(width)
+    states = [{"line_ids": draw_background(canvas, waveform_data), "drawn": 0} for canvas in canvases]
+    for canvas in canvases: canvas.calls = dict.fromkeys(canvas.calls, 0) # Background drawing is not part of a tick
+    total = worst = 0
+    for t in range(ticks):
+        played_pixels = int(width * t / ticks)
+        before = sum(sum(canvas.calls.values()) for canvas in canvases)
+        for canvas, state in zip(canvases, states):
+            tick_fn(canvas, waveform_data, played_pixels, state)
+        calls = sum(sum(canvas.calls.values()) for canvas in canvases) - before
+        total += calls
+        worst = max(worst, calls)
+    return total / ticks, worst
+
+def run(tick_fn, root, players, width, ticks):
+    """Advances every player's progress from 0 to width over `ticks` ticks; returns per-tick ms (avg, max)."""
+    canvases, states = [], []
+    waveform_data = make_waveform(width)
+    for _ in range(players):
+        canvas = tk.Canvas(root, width=width, height=WAVEFORM_HEIGHT)
+        canvas.pack()
+        states.append({"line_ids": draw_background(canvas, waveform_data), "drawn": 0})
+        canvases.append(canvas)
+    root.update()
+
+    total = worst = 0.0
+    for t in range(ticks):
+        played_pixels = int(width * t / ticks)
+        start = time.perf_counter()
+        for canvas, state in zip(canvases, states):
+            tick_fn(canvas, waveform_data, played_pixels, state)
+        root.update_idletasks() # Include Tk's redraw of the changed items
+        elapsed = time.perf_counter() - start
+        total += elapsed
+        worst = max(worst, elapsed)
+
+    for canvas in canvases: canvas.destroy()
+    return total / ticks * 1000, worst * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--width", type=int, default=400)
+    parser.add_argument("--ticks", type=int, default=2000, help="Ticks per simulated track (2000 x 50 ms = 100 s)")
+    parser.add_argument("--count-ops", action="store_true", help="Count canvas calls per tick instead of timing Tk (no display needed)")
+    args = parser.parse_args()
+    ticks_fns = (("legacy delete+recreate", legacy_tick), ("incremental recolor", incremental_tick))
+
+    if args.count_ops:
+        print(f"{args.players} players, {args.width} px, {args.ticks} ticks; canvas calls per tick for all players")
+        for name, tick_fn in ticks_fns:
+            avg_calls, max_calls = count_ops(tick_fn, args.players, args.width, args.ticks)
+            print(f"  {name:<24} avg {avg_calls:8.1f} calls   max {max_calls:6d} calls")
+        return
+
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        raise SystemExit(f"Tk is not available (no display?): {e}")
+    print(f"{args.players} players, {args.width} px, {args.ticks} ticks; time per tick for all players")
+    for name, tick_fn in ticks_fns:
+        avg_ms, max_ms = run(tick_fn, root, args.players, args.width, args.ticks)
+        print(f"  {name:<24} avg {avg_ms:8.3f} ms   max {max_ms:8.3f} ms")
+    root.destroy()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# cache_files.py
+# On-disk cache file handling shared by the peak cache (waveform_peaks.py) and the resample
+# cache (decoding.py): hashed file names, atomic writes, dropping unreadable entries and
+# pruning the oldest files. No Tkinter/Pygame, so it runs on the background pools.
+
+import hashlib
+import os
+import threading
+
+def cache_path(directory, version, key, suffix):
+    """Returns the cache file path for a key (a tuple such as decoding.get_file_key) under a format version."""
+    digest = hashlib.sha1(repr((version,) + tuple(key)).encode("utf-8")).hexdigest()
+    return os.path.join(directory, digest + suffix)
+
+def load_cache_file(path, reader, label):
+    """Returns reader(path), or None if the file doesn't exist. A corrupt or partial file is deleted
+    (so it is rebuilt) and None returned; label prefixes the message."""
+    try:
+        return reader(path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"{label}: Ignoring unreadable entry {path}: {e}")
+        try: os.remove(path)
+        except OSError: pass
+        return None
+
+def save_cache_file(path, writer, label):
+    """Calls writer(binary file) on a temporary file and renames it into place, so readers never see half a file."""
+    temp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp" # Unique per worker thread
+    try:
+        with open(temp_path, "wb") as f:
+            writer(f)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"{label}: Could not write {path}: {e}")
+        try: os.remove(temp_path)
+        except OSError: pass
+
+def prune_cache_dir(directory, suffixes, label, max_files=None, max_bytes=None):
+    """Deletes the least recently written files ending in suffixes until at most max_files remain and
+    they total at most max_bytes (either limit may be None). Returns the number of files removed."""
+    try:
+        with os.scandir(directory) as it:
+            entries = [(st.st_mtime, st.st_size, e.path) for e in it if e.name.endswith(suffixes) for st in (e.stat(),)]
+    except OSError as e:
+        print(f"{label}: Could not scan {directory}: {e}")
+        return 0
+    entries.sort()
+    count, total = len(entries), sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in entries:
+        if (max_files is None or count <= max_files) and (max_bytes is None or total <= max_bytes): break
+        try: os.remove(path)
+        except OSError: continue
+        removed += 1; count -= 1; total -= size
+    if removed: print(f"{label}: Pruned {removed} old entries.")
+    return removed
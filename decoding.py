@@ -0,0 +1,277 @@
+# decoding.py
+# Audio decoding helpers shared by all players. Nothing in here touches Tkinter or
+# Pygame, so these functions are safe to call from the background decode pool.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import soundfile as sf
+
+import cache_files
+
+# --- Constants ---
+DEFAULT_PCM_CACHE_MB = 512 # Default memory budget for decoded tracks (shared by all players)
+PROBE_CACHE_MAX_ENTRIES = 20000 # Header probes kept in memory (a few hundred bytes each)
+RESAMPLE_QUALITIES = {"fast": "polyphase", "high": "soxr_hq"} # Quality setting -> librosa res_type
+DEFAULT_RESAMPLE_QUALITY = "high"
+RESAMPLE_CACHE_VERSION = 1 # Bump when the stored format changes (old files are then ignored)
+RESAMPLE_CACHE_MAX_MB = 2048 # prune_resample_cache keeps the on-disk resampled PCM below this
+SF_ERR_SYSTEM = 2 # libsndfile error code for an OS-level failure (missing file, read error), not a bad file
+
+class UndecodableTrackError(Exception):
+    """A file soundfile opens but that holds no playable audio (e.g. zero frames). Persistent, like a parse error."""
+
+# --- Decoded-PCM Cache State ---
+# Process-wide LRU of decoded int16 PCM, keyed by (path, mtime, size) so an edited
+# file is never served stale. Entries are read-only NumPy arrays shared by all players.
+pcm_cache = OrderedDict() # key -> {"data": ndarray, "samplerate": int, "nbytes": int}
+pcm_cache_lock = threading.Lock()
+pcm_cache_budget_bytes = DEFAULT_PCM_CACHE_MB * 1024 * 1024
+pcm_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "rejected": 0, "bytes": 0}
+
+# --- Probe Cache State ---
+# Header-only metadata per file version, so durations and formats are known without decoding.
+probe_cache = OrderedDict() # key -> probe dict (see probe_track)
+probe_cache_lock = threading.Lock()
+
+# --- Resample Cache State ---
+# Tracks whose sample rate differs from the output are converted once on load. The result
+# is kept in the PCM cache under the file key plus (target rate, quality), and as one .npy
+# per track on disk so later sessions skip the conversion too.
+resample_cache_dir = None # Set by set_resample_cache_dir; None disables the on-disk cache
+resample_stats = {"resampled": 0, "disk_hits": 0, "resample_s": 0.0}
+
+# --- Partial Decode State ---
+# With a short switch interval only a window of each track is ever heard, so only that
+# window is decoded (see read_track_window). Counts show how much reading was skipped.
+window_stats = {"windows": 0, "frames_read": 0, "frames_total": 0}
+
+# --- File Key Helper ---
+
+def get_file_key(path):
+    """Returns (absolute path, mtime_ns, size) identifying the current contents of a file."""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+def is_persistent_decode_error(error):
+    """True if a failed probe/decode means the file itself is bad: soundfile could not parse it, or it is empty.
+
+    I/O trouble (a dropped network share, a file still being copied), memory pressure and errors on
+    the playback side (e.g. a ValueError from pygame.sndarray) are not, so callers should only skip
+    such files for the session."""
+    if isinstance(error, sf.LibsndfileError) and error.code == SF_ERR_SYSTEM: return False
+    return isinstance(error, (sf.SoundFileError, UndecodableTrackError))
+
+def match_channels(audio_data, channels):
+    """Upmixes mono (frames, 1) PCM to the mixer's channel count, which pygame.sndarray requires.
+
+    Other layouts are returned unchanged. The result is a new array; the cached one is not touched."""
+    if audio_data.shape[1] != 1 or channels <= 1: return audio_data
+    return np.repeat(audio_data, channels, axis=1)
+
+# --- PCM Cache Functions ---
+
+def _evict_over_budget():
+    """Drops least recently used entries until the cache fits its budget. Caller holds the lock."""
+    while pcm_cache and pcm_cache_stats["bytes"] > pcm_cache_budget_bytes:
+        key, entry = pcm_cache.popitem(last=False)
+        pcm_cache_stats["bytes"] -= entry["nbytes"]
+        pcm_cache_stats["evictions"] += 1
+        print(f"PCM cache: Evicted '{os.path.basename(key[0])}' ({entry['nbytes'] / 1048576:.1f} MB)")
+
+def set_pcm_cache_budget(budget_bytes):
+    """Sets the cache's total byte budget (0 disables caching) and evicts down to it."""
+    global pcm_cache_budget_bytes
+    with pcm_cache_lock:
+        pcm_cache_budget_bytes = max(0, int(budget_bytes))
+        _evict_over_budget()
+    print(f"PCM cache: Budget set to {pcm_cache_budget_bytes / 1048576:.0f} MB")
+
+def pcm_cache_get(key):
+    """Returns the cached entry for key (marking it most recently used), or None."""
+    with pcm_cache_lock:
+        entry = pcm_cache.get(key)
+        if entry is None:
+            pcm_cache_stats["misses"] += 1
+            return None
+        pcm_cache.move_to_end(key)
+        pcm_cache_stats["hits"] += 1
+        return entry
+
+def pcm_cache_put(key, data, samplerate):
+    """Stores decoded PCM under key, evicting old entries if over budget. data is made read-only even
+    when it isn't stored (budget 0 or larger than the budget), so callers see the same array either way."""
+    nbytes = data.nbytes
+    data.setflags(write=False) # Shared between players - nobody may modify it, cached or not
+    with pcm_cache_lock:
+        if pcm_cache_budget_bytes == 0: return # Cache disabled - nothing is offered, nothing is rejected
+        if nbytes > pcm_cache_budget_bytes:
+            pcm_cache_stats["rejected"] += 1 # Larger than the whole budget, never cache it
+            return
+        old_entry = pcm_cache.pop(key, None)
+        if old_entry: pcm_cache_stats["bytes"] -= old_entry["nbytes"]
+        pcm_cache[key] = {"data": data, "samplerate": samplerate, "nbytes": nbytes}
+        pcm_cache_stats["bytes"] += nbytes
+        _evict_over_budget()
+
+def clear_pcm_cache():
+    """Empties the cache (counters are kept)."""
+    with pcm_cache_lock:
+        pcm_cache.clear()
+        pcm_cache_stats["bytes"] = 0
+
+def get_pcm_cache_stats():
+    """Returns a snapshot of the cache counters plus current size, entry count and budget."""
+    with pcm_cache_lock:
+        stats = dict(pcm_cache_stats)
+        stats["entries"] = len(pcm_cache)
+        stats["budget_bytes"] = pcm_cache_budget_bytes
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+# --- Probe Functions ---
+
+def probe_track(track_path, key=None):
+    """Reads a track's header (no audio is decoded) and returns its metadata, cached per file version.
+
+    key is the file's get_file_key result if the caller already has it.
+    Returns a dict with samplerate, channels, frames, duration_s, format and subtype."""
+    if key is None: key = get_file_key(track_path)
+    with probe_cache_lock:
+        probe = probe_cache.get(key)
+        if probe is not None:
+            probe_cache.move_to_end(key)
+            return probe
+    info = sf.info(track_path)
+    probe = {"samplerate": info.samplerate, "channels": info.channels, "frames": info.frames,
+             "duration_s": info.frames / info.samplerate if info.samplerate > 0 else 0.0,
+             "format": info.format, "subtype": info.subtype}
+    with probe_cache_lock:
+        probe_cache[key] = probe
+        while len(probe_cache) > PROBE_CACHE_MAX_ENTRIES: probe_cache.popitem(last=False)
+    return probe
+
+def get_samplerate_mismatch(probe, mixer_init):
+    """Returns a warning string if the probed track won't play at the right speed on this mixer, else None.
+
+    mixer_init is pygame.mixer.get_init() (frequency, format, channels), or None if the mixer is down."""
+    if not mixer_init: return None
+    mixer_freq = mixer_init[0]
+    if probe["samplerate"] == mixer_freq: return None
+    return f"Track sample rate ({probe['samplerate']}Hz) differs from mixer ({mixer_freq}Hz). Playback speed may be incorrect."
+
+# --- Resampling ---
+
+def set_resample_cache_dir(path):
+    """Sets (and creates) the directory for resampled PCM. Pass None to disable the on-disk cache."""
+    global resample_cache_dir
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+    resample_cache_dir = path
+
+def _load_resampled(cache_key):
+    """Returns resampled PCM from the disk cache, or None if not cached (or unreadable, then it is converted again)."""
+    if resample_cache_dir is None: return None
+    path = cache_files.cache_path(resample_cache_dir, RESAMPLE_CACHE_VERSION, cache_key, ".npy")
+    data = cache_files.load_cache_file(path, lambda p: np.load(p, allow_pickle=False), "Resample cache")
+    if data is None or data.dtype != np.int16 or data.ndim != 2: return None
+    return data
+
+def _save_resampled(cache_key, data):
+    """Writes resampled PCM to the disk cache."""
+    if resample_cache_dir is None: return
+    path = cache_files.cache_path(resample_cache_dir, RESAMPLE_CACHE_VERSION, cache_key, ".npy")
+    cache_files.save_cache_file(path, lambda f: np.save(f, data, allow_pickle=False), "Resample cache")
+
+def prune_resample_cache(max_bytes=RESAMPLE_CACHE_MAX_MB * 1024 * 1024):
+    """Deletes the least recently written resampled tracks until the cache fits max_bytes."""
+    if resample_cache_dir is None: return 0
+    return cache_files.prune_cache_dir(resample_cache_dir, ".npy", "Resample cache", max_bytes=max_bytes)
+
+def resample_int16(audio_data, orig_sr, target_sr, quality=DEFAULT_RESAMPLE_QUALITY):
+    """Converts int16 PCM of shape (frames, channels) to target_sr with librosa. Returns a new int16 array."""
+    import librosa # Heavy import, only paid once a track actually needs converting
+    samples = audio_data.T.astype(np.float32) / 32768.0
+    converted = librosa.resample(samples, orig_sr=orig_sr, target_sr=target_sr, res_type=RESAMPLE_QUALITIES[quality])
+    np.clip(converted * 32768.0, -32768, 32767, out=converted)
+    return np.ascontiguousarray(converted.T.astype(np.int16))
+
+def _read_resampled(track_path, key, orig_sr, target_sr, quality):
+    """read_track_int16 for a track that needs converting: PCM cache, then disk cache, then decode + resample."""
+    cache_key = tuple(key) + (target_sr, quality)
+    entry = pcm_cache_get(cache_key)
+    if entry is not None:
+        return entry["data"], entry["samplerate"], True
+    audio_data = _load_resampled(cache_key)
+    if audio_data is not None:
+        resample_stats["disk_hits"] += 1
+        pcm_cache_put(cache_key, audio_data, target_sr)
+        return audio_data, target_sr, True
+    original, _ = sf.read(track_path, dtype='int16', always_2d=True)
+    start = time.perf_counter()
+    audio_data = resample_int16(original, orig_sr, target_sr, quality)
+    elapsed = time.perf_counter() - start
+    resample_stats["resampled"] += 1
+    resample_stats["resample_s"] += elapsed
+    print(f"Resampled '{os.path.basename(track_path)}' {orig_sr} -> {target_sr} Hz ({quality}) in {elapsed:.2f}s")
+    _save_resampled(cache_key, audio_data)
+    pcm_cache_put(cache_key, audio_data, target_sr)
+    return audio_data, target_sr, False
+
+# --- Decode Functions ---
+
+def read_track_int16(track_path, key=None, target_samplerate=None, quality=DEFAULT_RESAMPLE_QUALITY):
+    """Decodes a track to a 2D int16 array, served from the shared PCM cache when possible.
+
+    key is the file's get_file_key result if the caller already has it. With target_samplerate,
+    a track at another rate is resampled on load (quality "fast" or "high", see RESAMPLE_QUALITIES).
+    Returns (audio_data, samplerate, from_cache). The returned array is read-only."""
+    if key is None: key = get_file_key(track_path)
+    if target_samplerate:
+        orig_sr = probe_track(track_path, key)["samplerate"]
+        if orig_sr != target_samplerate: return _read_resampled(track_path, key, orig_sr, target_samplerate, quality)
+    entry = pcm_cache_get(key)
+    if entry is not None:
+        return entry["data"], entry["samplerate"], True
+    # Read as int16, ensure 2D array for sndarray
+    audio_data, samplerate = sf.read(track_path, dtype='int16', always_2d=True)
+    if len(audio_data) == 0: raise UndecodableTrackError(f"'{os.path.basename(track_path)}' contains no audio frames")
+    pcm_cache_put(key, audio_data, samplerate)
+    return audio_data, samplerate, False
+
+def read_track_window(track_path, key=None, length_s=None, offset=0.0, target_samplerate=None, quality=DEFAULT_RESAMPLE_QUALITY):
+    """Decodes only length_s seconds of a track, seeking past the rest instead of decoding it.
+
+    offset (0..1) places the window within the track: 0 starts at the beginning, 1 ends at the end.
+    Tracks no longer than the window are read whole through read_track_int16. Windows are cached
+    in the PCM cache like whole tracks, and resampled like them when target_samplerate differs.
+    Returns (audio_data, samplerate, from_cache, start_s), start_s being None for a whole-track read."""
+    if key is None: key = get_file_key(track_path)
+    probe = probe_track(track_path, key)
+    orig_sr = probe["samplerate"]
+    frames = int(length_s * orig_sr) if length_s else 0
+    if frames <= 0 or probe["frames"] <= frames:
+        return read_track_int16(track_path, key, target_samplerate, quality) + (None,)
+    start = int(min(1.0, max(0.0, offset)) * (probe["frames"] - frames))
+    resample = bool(target_samplerate) and orig_sr != target_samplerate
+    cache_key = tuple(key) + ("window", start, frames) + ((target_samplerate, quality) if resample else ())
+    entry = pcm_cache_get(cache_key)
+    if entry is not None:
+        return entry["data"], entry["samplerate"], True, start / orig_sr
+    with sf.SoundFile(track_path) as f:
+        f.seek(start)
+        audio_data = f.read(frames, dtype='int16', always_2d=True)
+    window_stats["windows"] += 1
+    window_stats["frames_read"] += len(audio_data)
+    window_stats["frames_total"] += probe["frames"]
+    samplerate = orig_sr
+    if resample: # Short, so converted on the spot without the on-disk cache
+        audio_data = resample_int16(audio_data, orig_sr, target_samplerate, quality)
+        resample_stats["resampled"] += 1
+        samplerate = target_samplerate
+    pcm_cache_put(cache_key, audio_data, samplerate)
+    return audio_data, samplerate, False, start / orig_sr
@@ -0,0 +1,418 @@
+# library_index.py
+# Persistent index of the audio files in preset folders (SQLite, in the user data dir).
+# Folders are scanned recursively; a directory is only listed again when its mtime changes,
+# so reloading presets on slow network shares costs one stat per directory instead of a full listing.
+
+import fnmatch
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+import decoding
+
+# --- Constants ---
+LIBRARY_INDEX_VERSION = 4 # Bump when the schema changes; older databases are rebuilt
+SCAN_BATCH_SIZE = 256 # Files per on_batch call while scanning
+PROBE_WRITE_BATCH = 200 # Probe results written to the database per transaction
+PROBE_PROGRESS_S = 0.25 # Minimum time between on_progress calls while probing
+SELECTION_QUERY_CHUNK = 500 # Paths per query in get_selection_info (stays below SQLite's variable limit)
+DIR_NOT_SCANNED = -1 # dirs.mtime_ns of a directory seen in its parent's listing but never listed itself
+HEALTH_UNKNOWN = "unknown" # Not probed or decoded yet
+HEALTH_OK = "ok"
+HEALTH_ERROR = "error" # Header probe or decode failed for this file version
+
+# --- Index State ---
+library_db = None # sqlite3.Connection, or None when the index is disabled (folders are then listed directly)
+library_db_lock = threading.Lock() # One connection shared by the Tk thread and workers
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    duration_s REAL,
+    samplerate INTEGER,
+    channels INTEGER,
+    health TEXT NOT NULL DEFAULT 'unknown',
+    error TEXT,
+    checked_at REAL,
+    last_played_at REAL,
+    play_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS quarantine (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    reason TEXT,
+    failures INTEGER NOT NULL DEFAULT 1,
+    first_failed_at REAL NOT NULL,
+    last_failed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+"""
+
+# --- Setup ---
+
+def open_library_index(db_path):
+    """Opens (creating or rebuilding if needed) the index database. Returns True if the index is usable."""
+    global library_db
+    try:
+        connection = sqlite3.connect(str(db_path), check_same_thread=False, timeout=10)
+        connection.execute("PRAGMA journal_mode=WAL") # Readers don't block the writer
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.executescript(_SCHEMA)
+        row = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != str(LIBRARY_INDEX_VERSION):
+            print(f"Library index: Rebuilding (version {row[0] if row else 'none'} -> {LIBRARY_INDEX_VERSION})")
+            connection.executescript("DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS quarantine;")
+            connection.executescript(_SCHEMA)
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (str(LIBRARY_INDEX_VERSION),))
+            connection.commit()
+        with connection: # Mono tracks pygame.sndarray rejected were once quarantined as bad files; they play now
+            connection.execute("UPDATE files SET health = ?, error = NULL WHERE error LIKE 'Array depth must match%'", (HEALTH_UNKNOWN,))
+            connection.execute("DELETE FROM quarantine WHERE reason LIKE 'Array depth must match%'")
+    except sqlite3.Error as e:
+        print(f"Library index disabled, could not open {db_path}: {e}")
+        library_db = None
+        return False
+    library_db = connection
+    print(f"Library index: Using {db_path}")
+    return True
+
+def close_library_index():
+    """Closes the database (called on exit)."""
+    global library_db
+    with library_db_lock:
+        if library_db is not None:
+            library_db.close()
+            library_db = None
+
+# --- Scan Rules ---
+
+def _relative_path(path, root):
+    """Path relative to the scan root with '/' separators, for glob matching."""
+    return os.path.relpath(path, root).replace(os.sep, "/")
+
+def _matches_any(path, root, patterns):
+    """True if the path (relative to root) or its base name matches one of the glob patterns."""
+    relative = _relative_path(path, root)
+    name = os.path.basename(path)
+    return any(fnmatch.fnmatch(relative, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+def _is_wanted_file(path, root, include, exclude):
+    """Applies include/exclude globs to a file (no include patterns means everything is included)."""
+    if include and not _matches_any(path, root, include): return False
+    return not (exclude and _matches_any(path, root, exclude))
+
+# --- Folder Scan ---
+
+def _list_directory(directory, supported_formats, file_stats=None):
+    """Lists one directory with os.scandir. Returns (audio file names, subdirectory paths).
+
+    File/directory type comes from the directory entry itself, so no stat call is made per entry
+    unless file_stats (a dict) is given: it is then filled with name -> (size, mtime_ns) from
+    DirEntry.stat (free on Windows, one stat per audio file elsewhere).
+    Hidden entries are skipped; symlinked directories are not followed (avoids cycles)."""
+    file_names, subdirs = [], []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'): continue
+            try:
+                if entry.is_dir(follow_symlinks=False): subdirs.append(entry.path)
+                elif entry.name.lower().endswith(supported_formats) and entry.is_file():
+                    if file_stats is not None:
+                        st = entry.stat()
+                        file_stats[entry.name] = (st.st_size, st.st_mtime_ns)
+                    file_names.append(entry.name)
+            except OSError: continue # Vanished or unreadable, skip it
+    return file_names, subdirs
+
+def _delete_subtree(directory):
+    """Removes a directory and everything below it from the index. Caller holds the lock."""
+    low, high = directory + os.sep, directory + chr(ord(os.sep) + 1) # Range instead of LIKE ('%'/'_' are common in names)
+    library_db.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)", (directory, low, high))
+    library_db.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (directory, low, high))
+
+def _refresh_directory(directory, supported_formats):
+    """Brings one directory's own entries up to date. Returns (playable file paths, subdirectory paths).
+
+    Unchanged directories (same mtime as the last scan) are answered from the index without listing."""
+    directory_mtime_ns = os.stat(directory).st_mtime_ns
+    if library_db is None: # No index - plain listing
+        file_names, subdirs = _list_directory(directory, supported_formats)
+        return [os.path.join(directory, name) for name in file_names], subdirs
+
+    with library_db_lock:
+        row = library_db.execute("SELECT mtime_ns FROM dirs WHERE path = ?", (directory,)).fetchone()
+        if row is not None and row[0] == directory_mtime_ns:
+            return _query_directory(directory)
+
+    file_stats = {}
+    file_names, subdirs = _list_directory(directory, supported_formats, file_stats) # Listing happens outside the lock
+    found = {os.path.join(directory, name): file_stats[name] for name in file_names}
+    with library_db_lock, library_db:
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in
+                 library_db.execute("SELECT path, size, mtime_ns FROM files WHERE dir = ?", (directory,))}
+        removed = [(path,) for path in known.keys() - found.keys()]
+        new_rows = [(path, directory, size, mtime_ns) for path, (size, mtime_ns) in found.items() if path not in known]
+        # Replaced or rewritten files go back to unknown health (play history is kept). A quarantined one
+        # is let back in by release_changed_quarantine, which sees the same change.
+        changed_rows = [(size, mtime_ns, path) for path, (size, mtime_ns) in found.items()
+                        if path in known and known[path] != (size, mtime_ns)]
+        library_db.executemany("DELETE FROM files WHERE path = ?", removed)
+        library_db.executemany(
+            "INSERT OR REPLACE INTO files (path, dir, size, mtime_ns, health) VALUES (?, ?, ?, ?, 'unknown')", new_rows)
+        library_db.executemany("UPDATE files SET size = ?, mtime_ns = ?, duration_s = NULL, samplerate = NULL, channels = NULL,"
+                               " health = 'unknown', error = NULL, checked_at = NULL WHERE path = ?", changed_rows)
+        # Subdirectories: forget vanished ones, remember new ones so they are scanned below
+        known_subdirs = {path for (path,) in library_db.execute("SELECT path FROM dirs WHERE parent = ?", (directory,))}
+        for vanished in known_subdirs - set(subdirs): _delete_subtree(vanished)
+        library_db.executemany("INSERT OR IGNORE INTO dirs (path, parent, mtime_ns, scanned_at) VALUES (?, ?, ?, 0)",
+                               [(path, directory, DIR_NOT_SCANNED) for path in subdirs])
+        library_db.execute("INSERT OR REPLACE INTO dirs (path, parent, mtime_ns, scanned_at) VALUES "
+                           "(?, (SELECT parent FROM dirs WHERE path = ?), ?, ?)",
+                           (directory, directory, directory_mtime_ns, time.time()))
+        if new_rows or removed or changed_rows:
+            print(f"Library index: Rescanned '{directory}' ({len(found)} files, {len(new_rows)} new, "
+                  f"{len(changed_rows)} changed, {len(removed)} removed)")
+        return _query_directory(directory)
+
+def _query_directory(directory):
+    """Returns the indexed playable files and known subdirectories of one directory. Caller holds the lock."""
+    files = [path for (path,) in library_db.execute(
+        "SELECT path FROM files WHERE dir = ? AND health != ? ORDER BY path", (directory, HEALTH_ERROR))]
+    subdirs = [path for (path,) in library_db.execute("SELECT path FROM dirs WHERE parent = ? ORDER BY path", (directory,))]
+    return files, subdirs
+
+def folder_changed(folder, exclude=()):
+    """Cheap change check for an indexed folder tree: one stat per known directory, nothing is listed.
+
+    Returns True if any directory's mtime differs from the index (entries added, removed or renamed),
+    a directory vanished, or the folder was never fully indexed: a readable subfolder that the exclude
+    globs (the same ones scan_folder uses) allow but that was never listed itself."""
+    if library_db is None: return True
+    folder = os.path.abspath(folder)
+    low, high = folder + os.sep, folder + chr(ord(os.sep) + 1)
+    with library_db_lock:
+        known = library_db.execute("SELECT path, mtime_ns FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                                   (folder, low, high)).fetchall()
+    if not known: return True
+    for path, mtime_ns in known:
+        if mtime_ns == DIR_NOT_SCANNED:
+            if exclude and _matches_any(path, folder, exclude): continue # Excluded by the scan rules, not watched
+            if not os.access(path, os.R_OK | os.X_OK): continue # Unreadable; the scan skips it too
+            return True # Never reached (e.g. an interrupted scan)
+        try:
+            if os.stat(path).st_mtime_ns != mtime_ns: return True
+        except OSError:
+            return True
+    return False
+
+def scan_folder(folder, supported_formats, include=(), exclude=(), on_batch=None, batch_size=SCAN_BATCH_SIZE,
+                should_stop=None):
+    """Recursively scans a folder (refreshing the index) and returns its playable audio files.
+
+    include/exclude are glob patterns matched against the path relative to folder and against the
+    base name; excluded directories are not descended into. on_batch(list_of_paths) is called as
+    files are found so callers can start using them before the scan finishes. should_stop() is
+    polled between directories to abandon a scan early. Raises OSError if folder itself can't be read."""
+    folder = os.path.abspath(folder)
+    all_files, pending = [], []
+    stack = [folder]
+    while stack:
+        if should_stop and should_stop(): break
+        directory = stack.pop()
+        try:
+            files, subdirs = _refresh_directory(directory, supported_formats)
+        except OSError as e:
+            if directory == folder: raise
+            print(f"Library index: Skipping unreadable folder '{directory}': {e}")
+            continue
+        for path in files:
+            if _is_wanted_file(path, folder, include, exclude): pending.append(path)
+        stack.extend(sorted((d for d in subdirs if not (exclude and _matches_any(d, folder, exclude))), reverse=True))
+        if len(pending) >= batch_size:
+            all_files.extend(pending)
+            if on_batch: on_batch(pending)
+            pending = []
+    all_files.extend(pending)
+    if on_batch and pending: on_batch(pending)
+    return all_files
+
+# --- Per-File Metadata ---
+
+def record_probe(path, file_key, probe):
+    """Stores a successful header probe (see decoding.probe_track) for the file version in file_key."""
+    _, mtime_ns, size = file_key
+    with library_db_lock:
+        if library_db is None: return # Disabled, or closed on exit while a decode was still running
+        with library_db:
+            library_db.execute("UPDATE files SET size = ?, mtime_ns = ?, duration_s = ?, samplerate = ?, channels = ?, health = ?,"
+                               " error = NULL, checked_at = ? WHERE path = ?",
+                               (size, mtime_ns, probe["duration_s"], probe["samplerate"], probe["channels"], HEALTH_OK, time.time(), path))
+
+def _record_probe_results(results):
+    """Writes a batch of _probe_one results in one transaction."""
+    if library_db is None or not results: return
+    now = time.time()
+    ok_rows = [(key[2], key[1], probe["duration_s"], probe["samplerate"], probe["channels"], HEALTH_OK, now, path)
+               for path, key, probe, error, _ in results if error is None]
+    with library_db_lock, library_db:
+        library_db.executemany("UPDATE files SET size = ?, mtime_ns = ?, duration_s = ?, samplerate = ?, channels = ?, health = ?,"
+                               " error = NULL, checked_at = ? WHERE path = ?", ok_rows)
+        for path, key, probe, error, persistent in results: # Transient failures stay unknown and are probed again
+            if error is not None and persistent: _quarantine_locked(path, key[2], key[1], error, now)
+
+def get_index_stats():
+    """Returns counts of indexed folders and files (by health) for display."""
+    if library_db is None: return {"enabled": False}
+    with library_db_lock:
+        stats = {"enabled": True, "folders": library_db.execute("SELECT COUNT(*) FROM dirs").fetchone()[0]}
+        for health, count in library_db.execute("SELECT health, COUNT(*) FROM files GROUP BY health"):
+            stats[health] = count
+    return stats
+
+def record_played(path, played_at=None):
+    """Records that a file started playing (for the "least_recent" selection weighting). played_at defaults to now."""
+    with library_db_lock:
+        if library_db is None: return
+        with library_db:
+            library_db.execute("UPDATE files SET last_played_at = ?, play_count = play_count + 1 WHERE path = ?",
+                               (time.time() if played_at is None else played_at, path))
+
+def get_selection_info(paths):
+    """Returns {path: (duration_s, last_played_at)} for the given files that are indexed (values None if unknown)."""
+    if library_db is None: return {}
+    paths = list(paths)
+    info = {}
+    with library_db_lock:
+        for start in range(0, len(paths), SELECTION_QUERY_CHUNK):
+            chunk = paths[start:start + SELECTION_QUERY_CHUNK]
+            rows = library_db.execute("SELECT path, duration_s, last_played_at FROM files WHERE path IN"
+                                      f" ({','.join('?' * len(chunk))})", chunk)
+            for path, duration_s, last_played_at in rows: info[path] = (duration_s, last_played_at)
+    return info
+
+# --- Bulk Probing ---
+
+def get_unprobed_files(folder):
+    """Returns the indexed files below folder whose health is still unknown (never probed or changed since)."""
+    if library_db is None: return []
+    folder = os.path.abspath(folder)
+    low, high = folder + os.sep, folder + chr(ord(os.sep) + 1)
+    with library_db_lock:
+        rows = library_db.execute("SELECT path FROM files WHERE health = ? AND (dir = ? OR (dir >= ? AND dir < ?)) ORDER BY path",
+                                  (HEALTH_UNKNOWN, folder, low, high))
+        return [path for (path,) in rows]
+
+def _probe_one(path):
+    """Pool worker: probes one file's header. Returns (path, file_key, probe, error string or None, persistent).
+
+    file_key is None if the file could not even be stat'ed (it vanished). persistent tells whether the
+    error means a bad file (see decoding.is_persistent_decode_error). Module-level and free of shared
+    state so it can also run in a process pool."""
+    try:
+        key = decoding.get_file_key(path)
+    except OSError as e:
+        return path, None, None, f"{type(e).__name__}: {e}", False
+    try:
+        return path, key, decoding.probe_track(path, key), None, False
+    except Exception as e:
+        return path, key, None, f"{type(e).__name__}: {e}", decoding.is_persistent_decode_error(e)
+
+def probe_files(paths, workers=8, use_processes=False, on_progress=None, should_stop=None):
+    """Probes many files in parallel and records duration/format/health in the index.
+
+    Header reads are I/O bound, so a thread pool is the default; use_processes spreads them over
+    processes instead (useful when header parsing itself is slow). on_progress(done, total, failed)
+    is called at most every PROBE_PROGRESS_S and once at the end. should_stop() abandons the run.
+    Returns (probed, failed) counts."""
+    total = len(paths)
+    done = failed = 0
+    if not total: return 0, 0
+    pending_writes = []
+    last_progress = 0.0
+    pool_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    with pool_class(max_workers=max(1, workers)) as pool:
+        futures = [pool.submit(_probe_one, path) for path in paths]
+        for future in as_completed(futures):
+            if should_stop and should_stop():
+                for other in futures: other.cancel()
+                break
+            result = future.result()
+            done += 1
+            if result[3] is not None: failed += 1
+            pending_writes.append(result)
+            if len(pending_writes) >= PROBE_WRITE_BATCH:
+                _record_probe_results(pending_writes)
+                pending_writes = []
+            if on_progress and time.monotonic() - last_progress >= PROBE_PROGRESS_S:
+                last_progress = time.monotonic()
+                on_progress(done, total, failed)
+    _record_probe_results(pending_writes)
+    if on_progress: on_progress(done, total, failed)
+    return done - failed, failed
+
+# --- Quarantine ---
+# Files that failed to probe or decode, with the size/mtime they had at the time. They are left
+# out of folder listings until release_changed_quarantine, which stats each of them, sees a
+# different size or mtime. That also catches files rewritten in place, which leave the
+# directory mtime (and so the folder listing) untouched.
+
+def _quarantine_locked(path, size, mtime_ns, reason, now):
+    """Adds or refreshes a quarantine entry and marks the file's health. Caller holds the lock inside a transaction."""
+    reason = str(reason)[:500]
+    library_db.execute("INSERT INTO quarantine (path, size, mtime_ns, reason, failures, first_failed_at, last_failed_at)"
+                       " VALUES (?, ?, ?, ?, 1, ?, ?) ON CONFLICT(path) DO UPDATE SET size = excluded.size,"
+                       " mtime_ns = excluded.mtime_ns, reason = excluded.reason, failures = failures + 1,"
+                       " last_failed_at = excluded.last_failed_at", (path, size, mtime_ns, reason, now, now))
+    library_db.execute("UPDATE files SET health = ?, error = ?, checked_at = ? WHERE path = ?", (HEALTH_ERROR, reason, now, path))
+
+def quarantine_file(path, reason):
+    """Records a probe/decode failure for the file's current version. Returns False if the file no longer exists
+    (nothing to quarantine) or the index is disabled."""
+    if library_db is None: return False
+    try: st = os.stat(path)
+    except OSError: return False
+    with library_db_lock, library_db:
+        _quarantine_locked(path, st.st_size, st.st_mtime_ns, reason, time.time())
+    print(f"Library index: Quarantined '{os.path.basename(path)}': {reason}")
+    return True
+
+def get_quarantined_paths():
+    """Returns the set of quarantined file paths."""
+    if library_db is None: return set()
+    with library_db_lock:
+        return {path for (path,) in library_db.execute("SELECT path FROM quarantine")}
+
+def release_changed_quarantine():
+    """Releases quarantined files that changed on disk (or vanished) so they are tried again. Returns the released paths.
+
+    Released files that still exist go back to unknown health, so the next listing includes them."""
+    if library_db is None: return []
+    with library_db_lock:
+        entries = library_db.execute("SELECT path, size, mtime_ns FROM quarantine").fetchall()
+    released, gone = [], []
+    for path, size, mtime_ns in entries: # Stat outside the lock
+        try: st = os.stat(path)
+        except OSError:
+            gone.append((path,))
+            continue
+        if (st.st_size, st.st_mtime_ns) != (size, mtime_ns): released.append((st.st_size, st.st_mtime_ns, path))
+    if released or gone:
+        with library_db_lock, library_db:
+            library_db.executemany("DELETE FROM quarantine WHERE path = ?", gone + [(path,) for _, _, path in released])
+            library_db.executemany("UPDATE files SET size = ?, mtime_ns = ?, health = 'unknown', error = NULL WHERE path = ?", released)
+    for _, _, path in released: print(f"Library index: '{os.path.basename(path)}' changed on disk, released from quarantine.")
+    return [path for _, _, path in released]
@@ -0,0 +1,557 @@
+# mix_engine.py
+# Optional NumPy mixing engine used instead of pygame.mixer (config "audio_engine": "numpy").
+# All players are mixed block by block in the callback of a sounddevice OutputStream, into
+# preallocated float32 buffers. Gain, pan and fades are applied per sample, and a voice
+# that finishes is reported through a queue instead of Pygame end events.
+#
+# Voices play the int16 arrays of the decoding PCM cache directly (read-only, never copied).
+# EngineChannel wraps a voice in the part of the pygame.mixer.Channel API randomizer.py uses;
+# given a second (spare) voice it can also crossfade: the next track is armed in advance and
+# the engine starts it at an exact frame of the current one, overlapping them with an
+# equal-power curve, so transitions don't depend on Tk timer latency.
+# Very long tracks can be streamed instead (StreamSound): a reader thread decodes the open
+# file into a small ring buffer ahead of the mixer, so memory stays bounded per voice.
+# Besides the audio device, the mix can go to a WAV file or be pulled with render(), so the
+# engine can be tested and benchmarked without a sound card. Nothing here touches Tkinter.
+
+import queue
+import threading
+import time
+import weakref
+
+import numpy as np
+import soundfile as sf
+
+try:
+    import sounddevice as sd
+except (ImportError, OSError): # Not installed, or PortAudio missing - only the file/manual outputs work
+    sd = None
+
+# --- Constants ---
+DEFAULT_SAMPLERATE = 44100
+DEFAULT_BLOCK_FRAMES = 512 # Frames mixed per callback (about 11.6 ms at 44.1 kHz)
+OUTPUT_CHANNELS = 2
+INT16_SCALE = 1.0 / 32768.0
+OUTPUTS = ("device", "file", "manual") # Where the mix goes: sound card, WAV file, or render() calls
+FADE_CURVES = ("linear", "equal_power") # Plain fades are linear like pygame's; crossfades keep the summed power constant
+HALF_PI = np.float32(np.pi / 2)
+STREAM_RING_S = 4.0 # Audio a StreamSound decodes ahead of the mixer (its whole memory use)
+STREAM_READ_FRAMES = 8192 # Frames the reader thread decodes per read
+
+# --- Engine State ---
+engine = None # Dict while the engine runs (see start_engine)
+engine_lock = threading.Lock() # Guards voice changes against the mixing callback; held only briefly
+ended_voices = queue.Queue() # Channels (or bare voice indices) whose sound finished on its own, with end notification on
+crossfaded_channels = queue.Queue() # Channels whose armed crossfade has started
+
+def _new_voice():
+    """One mixer voice: the sound it plays, its position and gain/fade state."""
+    return {
+        "sound": None, # EngineSound being played, None when idle
+        "position": 0, # Next frame to mix
+        "loops": 0, # Extra repeats left (-1 = forever)
+        "paused": False,
+        "gain": np.full(OUTPUT_CHANNELS, INT16_SCALE, dtype=np.float32), # Left/right volume, int16 scaling folded in
+        "fade_level": 1.0, # Envelope value at the start of the next frame
+        "fade_step": 0.0, # Envelope change per frame (0 = no fade running)
+        "fade_target": 1.0,
+        "fade_curve": "linear", # One of FADE_CURVES, applied to the linear envelope
+        "stop_at_fade_end": False, # Fade-out: stop the voice when the envelope reaches 0
+        "notify_end": False, # Post to ended_voices when it finishes
+        "crossfade": None, # Armed crossfade: {"channel", "to", "sound", "at", "fade_frames"} (see voice_arm_crossfade)
+        "mixed_block": -1, # Block already mixed by a crossfade start (skipped by the main loop)
+    }
+
+# --- Sounds ---
+
+class EngineSound:
+    """Decoded track for the engine: a read-only int16 array of shape (frames, channels)."""
+
+    def __init__(self, pcm, samplerate):
+        self.pcm = pcm
+        self.samplerate = samplerate
+        self.frames = len(pcm)
+
+    def get_length(self):
+        """Length in seconds (like pygame.mixer.Sound.get_length)."""
+        return self.frames / self.samplerate
+
+    def view(self, position, n):
+        """Up to n frames from position, as a view. Called by the mixer with the lock held."""
+        return self.pcm[position:position + n]
+
+    def advance(self, n):
+        """Tells the sound the mixer used the frames it viewed (nothing to do for decoded PCM)."""
+
+def make_sound(pcm, samplerate):
+    """Wraps decoded int16 PCM for playback on the engine (no copy)."""
+    return EngineSound(pcm, samplerate)
+
+# --- Streamed Sounds ---
+# The ring holds frames in play order: serial frame s is file frame s % frames, and the
+# reader wraps to the start of the file at its end, so a looping voice continues without
+# a gap. The reader stays at most a ring ahead of the mixer and waits while a paused voice
+# isn't draining. An instance plays through once; _fresh_sound opens another for a replay.
+
+def _stream_fill(state):
+    """Decodes the next read into the ring if there is room. Returns False when the ring is full."""
+    ring = state["ring"]
+    position = state["written"] % len(ring)
+    n = min(STREAM_READ_FRAMES, len(ring) - (state["written"] - state["consumed"]), len(ring) - position,
+            state["frames"] - state["file_position"])
+    if n < min(STREAM_READ_FRAMES, len(ring) - position, state["frames"] - state["file_position"]): return False
+    got = len(state["file"].read(n, dtype="int16", always_2d=True, out=ring[position:position + n]))
+    if got < n: ring[position + got:position + n] = 0 # Header promised more frames than decoded - pad, keep in step
+    state["file_position"] += n
+    if state["file_position"] >= state["frames"]: # Wrap for looping (unused otherwise, at most a ring's worth)
+        state["file"].seek(0)
+        state["file_position"] = 0
+    state["written"] += n # Published last, so the mixer never sees a frame before it is in the ring
+    return True
+
+def _stream_reader(state):
+    """Reader thread: keeps the ring filled ahead of the mixer until the sound is closed or collected."""
+    try:
+        while not state["stop"].is_set():
+            state["space"].clear()
+            if not _stream_fill(state): state["space"].wait(0.1)
+    except Exception as e: # Unreadable mid-way: the voice ends once the mixer has drained the ring
+        state["failed"] = True
+        print(f"Mix engine: Streaming '{state['path']}' failed: {e}")
+    finally:
+        state["file"].close()
+
+class StreamSound:
+    """Track streamed from its file through a ring buffer of STREAM_RING_S seconds, for tracks too long to decode."""
+
+    def __init__(self, path):
+        sound_file = sf.SoundFile(path)
+        if sound_file.frames <= 0:
+            sound_file.close()
+            raise ValueError(f"Cannot stream '{path}': it has no frames")
+        self.path = path
+        self.samplerate = sound_file.samplerate
+        self.frames = sound_file.frames
+        self.channels = sound_file.channels
+        self.started = False # Set when a voice takes it (see _fresh_sound)
+        ring_frames = max(2 * STREAM_READ_FRAMES, int(STREAM_RING_S * self.samplerate))
+        self._state = {"path": path, "file": sound_file, "frames": self.frames, "file_position": 0,
+                       "ring": np.zeros((ring_frames, self.channels), dtype=np.int16),
+                       "written": 0, "consumed": 0, # Serial frame counts (they keep growing across loops)
+                       "space": threading.Event(), "stop": threading.Event(), "failed": False}
+        try:
+            while _stream_fill(self._state): pass # Prefilled here, so playback starts without an underrun
+        except Exception:
+            sound_file.close()
+            raise
+        weakref.finalize(self, self._state["stop"].set) # The reader stops once nothing plays the sound
+        threading.Thread(target=_stream_reader, args=(self._state,), name="mix-stream", daemon=True).start()
+
+    def get_length(self):
+        """Length in seconds (like pygame.mixer.Sound.get_length)."""
+        return self.frames / self.samplerate
+
+    def view(self, position, n):
+        """Up to n frames from position that the reader has decoded (empty on an underrun). Mixer only.
+
+        Returns None once the reader failed and the ring is drained: the stream can't go on."""
+        state = self._state
+        consumed = state["consumed"]
+        if state["failed"] and state["written"] == consumed: return None
+        if position != consumed % self.frames: return state["ring"][:0] # Not where this stream is - never seeks
+        start = consumed % len(state["ring"])
+        return state["ring"][start:start + min(n, state["written"] - consumed, len(state["ring"]) - start)]
+
+    def advance(self, n):
+        """Frees the n frames the mixer just used for the reader."""
+        self._state["consumed"] += n
+        self._state["space"].set()
+
+    def close(self):
+        """Stops the reader and closes the file (also happens when the sound is garbage collected)."""
+        self._state["stop"].set()
+
+def open_stream(path):
+    """Opens a track for streamed playback on the engine, with its first STREAM_RING_S seconds decoded."""
+    return StreamSound(path)
+
+def _fresh_sound(sound):
+    """Returns the sound to start on a voice: a stream that already played (or plays on another voice)
+    is replaced by a new stream of the same file. Called before taking the lock (it opens the file).
+
+    Callers on a UI thread should not rely on the reopen, which prefills the ring: open the new
+    stream off that thread instead (randomizer decodes it again in its pool)."""
+    if not isinstance(sound, StreamSound): return sound
+    if sound.started: sound = StreamSound(sound.path)
+    sound.started = True
+    return sound
+
+# --- Setup ---
+
+def start_engine(samplerate=DEFAULT_SAMPLERATE, voices=6, block_frames=DEFAULT_BLOCK_FRAMES, output="device",
+                 device=None, file_path=None, realtime=True):
+    """Starts mixing `voices` voices to the given output ("device", "file" or "manual").
+
+    "file" writes the mix to file_path as 16-bit WAV from a background thread, paced like a sound
+    card unless realtime is False. "manual" renders nothing by itself; call render(). Raises
+    RuntimeError if sounddevice is unavailable, or sounddevice/soundfile errors if the output can't be opened."""
+    global engine
+    if engine is not None: stop_engine()
+    if output not in OUTPUTS: raise ValueError(f"Unknown engine output '{output}' (expected one of {OUTPUTS})")
+    if output == "device" and sd is None: raise RuntimeError("sounddevice is not available, cannot open an audio device")
+    if output == "file" and not file_path: raise ValueError("The file output needs a file_path")
+    engine = {
+        "samplerate": samplerate,
+        "block_frames": block_frames,
+        "voices": [_new_voice() for _ in range(voices)],
+        "mix": np.zeros((block_frames, OUTPUT_CHANNELS), dtype=np.float32), # Sum of all voices
+        "scratch": np.zeros((block_frames, OUTPUT_CHANNELS), dtype=np.float32), # One voice's contribution
+        "envelope": np.zeros(block_frames, dtype=np.float32),
+        "curve": np.zeros(block_frames, dtype=np.float32), # Envelope after the fade curve
+        "ramp": np.arange(1, block_frames + 1, dtype=np.float32), # 1..n, for fade envelopes
+        "output": output,
+        "stream": None,
+        "sink_thread": None,
+        "sink_stop": threading.Event(),
+        "active_voice": {}, # EngineChannel index -> voice it currently plays on (switches at a crossfade)
+        "voice_channel": {}, # Voice index -> EngineChannel index owning it
+        "stats": {"blocks": 0, "frames": 0, "render_s": 0.0, "max_render_ms": 0.0, "underflows": 0, "crossfades": 0,
+                  "stream_underruns": 0},
+    }
+    if output == "device":
+        stream = sd.OutputStream(samplerate=samplerate, blocksize=block_frames, channels=OUTPUT_CHANNELS,
+                                 dtype="float32", device=device, callback=_stream_callback)
+        stream.start()
+        engine["stream"] = stream
+    elif output == "file":
+        sink_file = sf.SoundFile(file_path, "w", samplerate=samplerate, channels=OUTPUT_CHANNELS, subtype="PCM_16")
+        engine["sink_thread"] = threading.Thread(target=_file_sink_worker, args=(engine, sink_file, realtime),
+                                                 name="mix-file-sink", daemon=True)
+        engine["sink_thread"].start()
+    print(f"Mix engine: Started ({output}, {samplerate} Hz, {voices} voices, {block_frames} frames per block)")
+
+def stop_engine():
+    """Stops the output and silences all voices. Safe to call when the engine isn't running."""
+    global engine
+    if engine is None: return
+    if engine["stream"] is not None:
+        engine["stream"].stop()
+        engine["stream"].close()
+    if engine["sink_thread"] is not None:
+        engine["sink_stop"].set()
+        engine["sink_thread"].join()
+    print(f"Mix engine: Stopped. {get_engine_stats()}")
+    engine = None
+
+def get_init():
+    """Like pygame.mixer.get_init(): (samplerate, -16, channels) while running, else None."""
+    if engine is None: return None
+    return (engine["samplerate"], -16, OUTPUT_CHANNELS)
+
+def get_engine_stats():
+    """Returns the render counters: blocks, frames, average/max render time and device underflows."""
+    if engine is None: return {}
+    stats = dict(engine["stats"])
+    stats["avg_render_ms"] = stats["render_s"] / stats["blocks"] * 1000 if stats["blocks"] else 0.0
+    stats["block_budget_ms"] = engine["block_frames"] / engine["samplerate"] * 1000
+    return stats
+
+# --- Mixing ---
+
+def _end_voice(index, voice):
+    """Silences a voice that finished on its own and reports it if asked to. Caller holds the lock."""
+    voice["sound"] = None
+    voice["crossfade"] = None
+    if voice["notify_end"]: ended_voices.put(engine["voice_channel"].get(index, index))
+
+def _fade_gain(voice, n):
+    """Returns the per-frame fade gains for the next n frames and advances the fade. Caller holds the lock."""
+    envelope = engine["envelope"][:n]
+    np.multiply(engine["ramp"][:n], voice["fade_step"], out=envelope)
+    envelope += voice["fade_level"]
+    if voice["fade_step"] > 0: np.minimum(envelope, voice["fade_target"], out=envelope)
+    else: np.maximum(envelope, voice["fade_target"], out=envelope)
+    voice["fade_level"] = float(envelope[-1])
+    if voice["fade_curve"] != "equal_power": return envelope
+    curve = engine["curve"][:n]
+    np.multiply(envelope, HALF_PI, out=curve)
+    return np.sin(curve, out=curve) # Fade-in follows sin, fade-out (level falling) follows cos
+
+def _start_crossfade(index, voice, mix, frames):
+    """Starts the voice's armed crossfade at the first frame of mix and mixes the incoming voice's share. Caller holds the lock."""
+    crossfade = voice["crossfade"]
+    voice["crossfade"] = None
+    target_index = crossfade["to"]
+    target = engine["voices"][target_index]
+    target.update(sound=crossfade["sound"], position=0, loops=0, paused=False, stop_at_fade_end=False,
+                  notify_end=False, crossfade=None, fade_curve="equal_power")
+    target["gain"][:] = voice["gain"]
+    fade_frames = crossfade["fade_frames"]
+    if fade_frames > 0 and voice["fade_level"] > 0:
+        target.update(fade_level=0.0, fade_target=1.0, fade_step=1.0 / fade_frames)
+        voice.update(fade_target=0.0, fade_step=-voice["fade_level"] / fade_frames, fade_curve="equal_power",
+                     stop_at_fade_end=True, notify_end=False)
+    else: # A hard, gapless cut
+        target.update(fade_level=1.0, fade_target=1.0, fade_step=0.0)
+        voice["sound"] = None
+    engine["active_voice"][crossfade["channel"]] = target_index
+    engine["stats"]["crossfades"] += 1
+    crossfaded_channels.put(crossfade["channel"])
+    _mix_voice(target_index, target, mix, frames)
+    target["mixed_block"] = engine["stats"]["blocks"]
+
+def _mix_voice(index, voice, mix, frames):
+    """Adds up to `frames` frames of one voice into mix. Caller holds the lock."""
+    done = 0
+    while done < frames and voice["sound"] is not None:
+        sound = voice["sound"]
+        position = voice["position"]
+        crossfade = voice["crossfade"]
+        if crossfade is not None and position >= crossfade["at"]: # Exactly at the armed frame
+            _start_crossfade(index, voice, mix[done:], frames - done)
+            if voice["sound"] is None: return
+            crossfade = None
+        n = min(frames - done, sound.frames - position)
+        if crossfade is not None: n = min(n, crossfade["at"] - position) # Stop short of the crossfade frame
+        if n > 0:
+            samples = sound.view(position, n)
+            if samples is None: # A stream whose file failed: end it like a finished track, so transitions go on
+                if crossfade is not None: # Start the armed crossfade now, it would never be reached
+                    crossfade["at"] = position
+                    continue
+                _end_voice(index, voice)
+                return
+            if len(samples) == 0: # A stream's reader fell behind: this voice is silent for the rest of the block
+                engine["stats"]["stream_underruns"] += 1
+                return
+            n = len(samples)
+            scratch = engine["scratch"][:n]
+            np.multiply(samples[:, :OUTPUT_CHANNELS], voice["gain"], out=scratch) # Mono broadcasts to both sides
+            sound.advance(n)
+            if voice["fade_step"]:
+                scratch *= _fade_gain(voice, n)[:, None]
+                if voice["fade_level"] == voice["fade_target"]:
+                    voice["fade_step"] = 0.0
+                    if voice["stop_at_fade_end"]:
+                        mix[done:done + n] += scratch
+                        _end_voice(index, voice)
+                        return
+            elif voice["fade_level"] != 1.0:
+                level = voice["fade_level"]
+                scratch *= np.sin(level * HALF_PI) if voice["fade_curve"] == "equal_power" else level
+            mix[done:done + n] += scratch
+            voice["position"] = position + n
+            done += n
+        if voice["position"] >= sound.frames and voice["crossfade"] is None:
+            if voice["loops"] != 0 and sound.frames > 0:
+                voice["position"] = 0
+                if voice["loops"] > 0: voice["loops"] -= 1
+            else:
+                _end_voice(index, voice)
+
+def _render_block(out):
+    """Mixes all voices into out (float32, at most block_frames frames), clipped to [-1, 1]."""
+    start = time.perf_counter()
+    frames = len(out)
+    mix = engine["mix"][:frames]
+    mix.fill(0.0)
+    block = engine["stats"]["blocks"]
+    with engine_lock:
+        for index, voice in enumerate(engine["voices"]):
+            if voice["sound"] is None or voice["paused"] or voice["mixed_block"] == block: continue
+            _mix_voice(index, voice, mix, frames)
+    np.clip(mix, -1.0, 1.0, out=out)
+    elapsed = time.perf_counter() - start
+    stats = engine["stats"]
+    stats["blocks"] += 1
+    stats["frames"] += frames
+    stats["render_s"] += elapsed
+    if elapsed * 1000 > stats["max_render_ms"]: stats["max_render_ms"] = elapsed * 1000
+
+def render(frames):
+    """Renders the next `frames` frames of the mix and returns them as a new float32 array ("manual" output)."""
+    out = np.empty((frames, OUTPUT_CHANNELS), dtype=np.float32)
+    block_frames = engine["block_frames"]
+    for start in range(0, frames, block_frames): _render_block(out[start:start + block_frames])
+    return out
+
+def _stream_callback(outdata, frames, time_info, status):
+    """sounddevice callback (audio thread): fills the device buffer block by block."""
+    if status.output_underflow: engine["stats"]["underflows"] += 1
+    block_frames = engine["block_frames"]
+    for start in range(0, frames, block_frames): _render_block(outdata[start:start + block_frames])
+
+def _file_sink_worker(state, sink_file, realtime):
+    """Sink thread: renders blocks into the WAV file until stopped, paced to the wall clock if realtime."""
+    out = np.empty((state["block_frames"], OUTPUT_CHANNELS), dtype=np.float32)
+    started = time.monotonic()
+    try:
+        while not state["sink_stop"].is_set():
+            _render_block(out)
+            sink_file.write(out)
+            if realtime:
+                ahead_s = state["stats"]["frames"] / state["samplerate"] - (time.monotonic() - started)
+                if ahead_s > 0: state["sink_stop"].wait(ahead_s)
+    finally:
+        sink_file.close()
+
+# --- Voice Control ---
+# Called from the Tk thread; each change is applied between two mixed blocks.
+
+def voice_play(index, sound, loops=0, fade_ms=0):
+    """Starts a sound on a voice from its first frame, replacing whatever it played."""
+    sound = _fresh_sound(sound)
+    with engine_lock:
+        voice = engine["voices"][index]
+        voice.update(sound=sound, position=0, loops=loops, paused=False, stop_at_fade_end=False, crossfade=None,
+                     fade_curve="linear")
+        if fade_ms > 0:
+            voice.update(fade_level=0.0, fade_target=1.0, fade_step=1000.0 / (fade_ms * engine["samplerate"]))
+        else:
+            voice.update(fade_level=1.0, fade_target=1.0, fade_step=0.0)
+
+def voice_stop(index):
+    """Silences a voice at once (no end notification) and drops its armed crossfade."""
+    with engine_lock:
+        engine["voices"][index]["sound"] = None
+        engine["voices"][index]["crossfade"] = None
+
+def voice_fadeout(index, fade_ms):
+    """Fades a voice out from its current level over fade_ms, then stops it (with end notification)."""
+    with engine_lock:
+        voice = engine["voices"][index]
+        if voice["sound"] is None: return
+        if fade_ms <= 0 or voice["fade_level"] <= 0:
+            _end_voice(index, voice)
+            return
+        voice.update(fade_target=0.0, stop_at_fade_end=True, crossfade=None,
+                     fade_step=-voice["fade_level"] * 1000.0 / (fade_ms * engine["samplerate"]))
+
+def voice_arm_crossfade(channel, index, to_index, sound, at_position, fade_ms):
+    """Arms a crossfade: when voice `index` reaches frame at_position, `to_index` starts sound with an
+    equal-power fade-in while `index` fades out, both over fade_ms (0 = gapless cut).
+
+    at_position is clamped to the end of the current sound. Returns False if it was already passed."""
+    sound = _fresh_sound(sound)
+    with engine_lock:
+        voice = engine["voices"][index]
+        if voice["sound"] is None or voice["loops"] != 0: return False
+        at_position = min(at_position, voice["sound"].frames)
+        if at_position < voice["position"]: return False
+        voice["crossfade"] = {"channel": channel, "to": to_index, "sound": sound, "at": at_position,
+                              "fade_frames": int(fade_ms * engine["samplerate"] / 1000)}
+        return True
+
+def voice_cancel_crossfade(index):
+    """Drops a voice's armed crossfade if it hasn't started yet."""
+    with engine_lock:
+        engine["voices"][index]["crossfade"] = None
+
+def voice_pause(index, paused):
+    """Pauses or resumes a voice where it is."""
+    with engine_lock:
+        engine["voices"][index]["paused"] = paused
+
+def voice_set_volume(index, left, right):
+    """Sets a voice's left/right volume (0.0-1.0)."""
+    with engine_lock:
+        engine["voices"][index]["gain"][:] = (left * INT16_SCALE, right * INT16_SCALE)
+
+def voice_set_notify_end(index, notify):
+    """Turns end notification (via poll_ended_voices) on or off for a voice."""
+    with engine_lock:
+        engine["voices"][index]["notify_end"] = notify
+
+def voice_busy(index):
+    """True while the voice has a sound (paused voices count as busy, like pygame)."""
+    return engine is not None and engine["voices"][index]["sound"] is not None
+
+def voice_position(index):
+    """Frames of the current sound already mixed (sample-accurate playback position), or None if idle."""
+    voice = engine["voices"][index]
+    return voice["position"] if voice["sound"] is not None else None
+
+def _drain(events):
+    """Returns everything currently in a queue (oldest first)."""
+    items = []
+    while True:
+        try: items.append(events.get_nowait())
+        except queue.Empty: return items
+
+def poll_ended_channels():
+    """Returns the channels (voice indices for voices without one) whose sound ended since the last call."""
+    return _drain(ended_voices)
+
+def poll_crossfades():
+    """Returns the channels whose armed crossfade started since the last call (the next track now plays)."""
+    return _drain(crossfaded_channels)
+
+# --- Channel Adapter ---
+
+class EngineChannel:
+    """Stands in for pygame.mixer.Channel, playing on one engine voice (start the engine first).
+
+    End events are not posted to Pygame: with set_endevent(x) on, the channel index shows up in
+    poll_ended_channels() when the sound ends on its own or after a fadeout. With a spare voice,
+    arm_crossfade can hand over to the next sound; the channel then plays on the other voice."""
+
+    def __init__(self, index, spare_index=None):
+        self.index = index
+        self.voices = (index,) if spare_index is None else (index, spare_index)
+        self.endevent = None
+        engine["active_voice"][index] = index
+        for voice in self.voices: engine["voice_channel"][voice] = index
+
+    def _voice(self):
+        return engine["active_voice"][self.index]
+
+    def play(self, sound, loops=0, maxtime=0, fade_ms=0):
+        voice_play(self._voice(), sound, loops, fade_ms)
+
+    def stop(self):
+        for voice in self.voices: voice_stop(voice) # Including a crossfade's fading tail
+
+    def fadeout(self, time_ms):
+        voice_fadeout(self._voice(), time_ms)
+
+    def fadeout_to_spare(self, time_ms):
+        """Fades the current sound out and moves the channel to its spare voice, so the next play()
+        overlaps the fade. The fading tail's end is not reported (without a spare it is a plain fadeout)."""
+        current = self._voice()
+        voice_set_notify_end(current, False)
+        voice_fadeout(current, time_ms)
+        if len(self.voices) < 2: return
+        with engine_lock: engine["active_voice"][self.index] = self.voices[1] if current == self.voices[0] else self.voices[0]
+
+    def pause(self):
+        for voice in self.voices: voice_pause(voice, True)
+
+    def unpause(self):
+        for voice in self.voices: voice_pause(voice, False)
+
+    def set_volume(self, left, right=None):
+        for voice in self.voices: voice_set_volume(voice, left, left if right is None else right)
+
+    def get_busy(self):
+        return voice_busy(self._voice())
+
+    def get_position(self):
+        """Frames of the current sound already played, or None if idle."""
+        return voice_position(self._voice())
+
+    def set_endevent(self, event_type=None):
+        self.endevent = event_type
+        voice_set_notify_end(self._voice(), event_type is not None)
+
+    def get_endevent(self):
+        return self.endevent
+
+    def arm_crossfade(self, sound, at_position, fade_ms):
+        """Crossfades to sound at frame at_position of the current one (see voice_arm_crossfade). False if not possible."""
+        if len(self.voices) < 2: return False
+        current = self._voice()
+        spare = self.voices[1] if current == self.voices[0] else self.voices[0]
+        return voice_arm_crossfade(self.index, current, spare, sound, at_position, fade_ms)
+
+    def cancel_crossfade(self):
+        voice_cancel_crossfade(self._voice())
@@ -19,9 +19,18 @@ import librosa
 import shutil
 import sys
 import pathlib
+import queue
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import decoding
+import waveform_peaks
+import library_index
+import track_selection
+import mix_engine
 
 # --- Constants ---
 MAX_PLAYERS = 6
+AUDIO_ENGINES = ("pygame", "numpy") # pygame.mixer channels, or mix_engine on a sounddevice stream
 INITIAL_VOLUME = 0.7
 EVENT_CHECK_MS = 100
 MAX_HISTORY = 20
@@ -31,7 +40,9 @@ DEFAULT_SWITCH_INTERVAL_S = 7
 # CONFIG_FILENAME = "config.json" # <<< For saving settings
 WAVEFORM_HEIGHT = 60  # Adjusted height for rows
 WAVEFORM_WIDTH = 400 # Adjusted width estimate
-PROGRESS_UPDATE_MS = 50 # How often to update progress visual
+PROGRESS_UPDATE_MS = 50 # How often to update progress visual (UI frame interval while anything plays)
+WAVEFORM_MIN_ZOOM_FRAMES = 44100 # Deepest waveform zoom shows about this many samples across the canvas
+WAVEFORM_BG_COLOR = "grey50" # Unplayed part of the waveform
 RECORDING_SAMPLE_RATE = 44100 # Or 48000, match your system/virtual device
 RECORDING_CHANNELS = 2 # Usually stereo
 INITIAL_PAN = 0 # Center pan (-100 to +100)
@@ -40,6 +51,17 @@ EXPORT_CHANNELS = 2       # Target channels for export (stereo)
 DEFAULT_WAVEFORM_COLOR = "#90EE90" # Light green - a default color if none is set
 DEFAULT_FADE_MS = 0
 APP_NAME = "Randomizer" # Or whatever you prefer
+DECODE_WORKERS = 2 # Background threads shared by all players for decoding tracks
+DECODE_POLL_MS = 15 # How often the Tk thread collects finished decodes while any are in flight
+SCAN_POLL_MS = 250 # How often it collects folder scan/probe results while only those run (they can take minutes)
+PRESET_RESCAN_MS = 5 * 60 * 1000 # How often all preset folders are re-checked in the background
+WATCH_POLL_MS = 10 * 1000 # How often folders loaded into players are checked for added/removed files
+WATCH_COLLECT_MS = 250 # How often the watcher's own timer collects its results while checks are running
+MAX_CONSECUTIVE_DECODE_FAILURES = 5 # A player stops after skipping this many unreadable tracks in a row
+MAX_CLAIM_REDRAWS = 8 # Re-draws when a pick is held by another player (after that, the held track is shared)
+PARTIAL_DECODE_MODES = ("off", "start", "random") # Decode only the heard window: no, from the start, from a random offset
+DEFAULT_STREAM_MIN_DURATION_S = 1800 # NumPy engine: tracks at least this long are streamed from disk, not decoded
+PARTIAL_DECODE_MARGIN_MS = 2000 # Extra audio decoded past interval + fade, so a late timer never runs out of track
 
 # --- Pygame Custom Events ---
 PLAYER_END_EVENTS = [pygame.USEREVENT + 1 + i for i in range(MAX_PLAYERS)]
@@ -61,11 +83,29 @@ for i in range(MAX_PLAYERS):
         "total_paused_duration": 0.0, # Added state
         "pause_start_time": 0.0, # Added state
         "play_history": deque(maxlen=MAX_HISTORY),
+        "track_bag": track_selection.new_bag(), # audio_files + history blocks, for O(1) random picks
+        "rng": random, # This player's seeded random stream (set by start_session)
+        "offset_rng": random, # Seeded stream for random start offsets, kept apart so picks don't depend on it
+        "redraw_rng": random, # Seeded stream for re-drawing picks held by other players (see pick_next_track)
         "playback_timer_id": None,
         "waveform_data": None, # <<< Added for waveform
-        "progress_update_timer_id": None, # <<< Added for progress
+        "waveform_pyramid": None, # Multi-resolution peaks of the current track (see waveform_peaks)
+        "waveform_width": WAVEFORM_WIDTH, # Current canvas width in pixels (follows window resizes)
+        "waveform_view": None, # Zoomed region as (start, end) fractions of the track, None = whole track
+        "waveform_line_ids": [], # Canvas line item per waveform pixel, created once per redraw
+        "waveform_played_pixels": 0, # How many of those lines currently show the progress color
+        "waveform_played_color": None, # Color the played lines were drawn in
         "current_track_duration_s": 0.0, # <<< Added to store duration
         "current_waveform_color": DEFAULT_WAVEFORM_COLOR, # <<< initialize with default
+        "decode_job_id": None, # Id of the background decode this player is waiting for
+        "loading_header": None, # (path, settings, transition) planned from the header of the track being decoded
+        "scan_job_id": None, # Id of the folder scan feeding this player's audio_files (None when finished)
+        "decode_failures": 0, # Unreadable tracks skipped in a row (reset when a track starts)
+        "decode_future": None, # Future of that decode (cancelled if superseded)
+        "prefetch": None, # Next track picked and decoded ahead of time (see start_prefetch)
+        "claims": {}, # Role ("playing", "prefetch") -> path this player holds in the cross-player registry
+        "transition": (None, None), # (action, delay_ms) planned for the current track (see plan_next_transition)
+        "crossfade": None, # Engine crossfade armed for the prefetch: {"path", "action", "at_position"} (NumPy engine)
         # GUI Elements
         "gui": {
              "folder_label": None,
@@ -89,6 +129,7 @@ for i in range(MAX_PLAYERS):
              
         }
     })
+waveform_tick_stats = {"ticks": 0, "total_s": 0.0, "max_s": 0.0} # Cost of update_waveform_progress, printed on exit
 
 # --- NEW: Platform-Specific Data Path Functions ---
 
@@ -122,6 +163,20 @@ def get_config_path():
     os.makedirs(data_dir, exist_ok=True) # Ensure directory exists
     return data_dir / "config.json" # Use the old filename here
 
+def get_library_index_path():
+    """Gets the full path to the library index database, ensuring the directory exists."""
+    data_dir = get_user_data_dir()
+    os.makedirs(data_dir, exist_ok=True) # Ensure directory exists
+    return data_dir / "library_index.sqlite3"
+
+def get_resample_cache_dir():
+    """Gets the directory for resampled tracks (created by decoding.set_resample_cache_dir)."""
+    return get_user_data_dir() / "resample_cache"
+
+def get_waveform_cache_dir():
+    """Gets the directory for cached waveform peaks (created by waveform_peaks.set_peak_cache_dir)."""
+    return get_user_data_dir() / "waveform_cache"
+
 # --- End NEW Path Functions ---
 
 # --- Preset Handling Functions ---
@@ -239,6 +294,7 @@ def add_preset(name, path, color): # <<< ADD color parameter
     print(f"Added/Updated preset: '{name}' -> Path: '{path}', Color: '{color}'")
     save_presets()
     update_preset_dropdowns()
+    prescan_presets({path}) # Make the new preset instant to load
     return True
 
 def add_current_folder_as_preset(player_index):
@@ -566,20 +622,70 @@ recording_stream = None
 # recording_queue = queue.Queue() # Optional: For threaded writing later
 # --- NEW: Configuration State ---
 selected_recording_device = None # <<< Stores the user's chosen device name
+pcm_cache_budget_mb = decoding.DEFAULT_PCM_CACHE_MB # Memory budget for decoded tracks shared by all players
+scan_include_patterns = [] # Glob patterns a file must match to be used (empty = all supported files)
+scan_exclude_patterns = [] # Glob patterns for files/subfolders to skip while scanning
+probe_workers = 0 # Threads for bulk metadata probing (0 = automatic)
+selection_weighting = "uniform" # How next tracks are favoured: one of track_selection.WEIGHTING_MODES
+configured_session_seed = None # Seed from the config to replay a session (None = new seed every run)
+session_seed = None # Seed of the running session (printed at startup and exit)
+preset_rng = random # Seeded stream for random preset loading (set by start_session)
+configured_audio_engine = "pygame" # Playback backend from the config: one of AUDIO_ENGINES (read at startup)
+audio_engine = "pygame" # Backend actually running (pygame if the NumPy engine could not start)
+resample_quality = decoding.DEFAULT_RESAMPLE_QUALITY # "fast", "high" (see decoding.RESAMPLE_QUALITIES) or "off"
+output_samplerate = None # Rate of the running mixer/engine; tracks at other rates are resampled on load
+partial_decode = "off" # One of PARTIAL_DECODE_MODES: with an interval set, decode only the part that is heard
+stream_min_duration_s = DEFAULT_STREAM_MIN_DURATION_S # Longer tracks stream through a ring buffer (NumPy engine, 0 = never)
 shuffle_count_entry = None # <<< Added for shuffle count entry
 global_loop_button = None # <<< ADDED: To hold reference to the global loop button
 
 # --- Config Handling Functions ---
 
+def get_config_patterns(config_data, key):
+    """Returns a list of glob strings from the config, or [] (with a warning) if the value is invalid."""
+    patterns = config_data.get(key, [])
+    if isinstance(patterns, list) and all(isinstance(p, str) for p in patterns): return patterns
+    print(f"Invalid {key} '{patterns}' in config (expected a list of glob strings), ignoring.")
+    return []
+
 def load_config():
     """Loads configuration like the selected recording device from the user data directory."""
-    global selected_recording_device
+    global selected_recording_device, pcm_cache_budget_mb, scan_include_patterns, scan_exclude_patterns, probe_workers
+    global selection_weighting, configured_session_seed, configured_audio_engine, audio_engine, resample_quality, partial_decode, stream_min_duration_s
     config_file_path = get_config_path() # <<< Get the correct path
     try:
         if config_file_path.exists(): # <<< Use the path variable
             with open(config_file_path, 'r') as f: # <<< Use the path variable
                 config_data = json.load(f)
                 selected_recording_device = config_data.get("recording_device_name") # Get saved name
+                budget_mb = config_data.get("pcm_cache_budget_mb", decoding.DEFAULT_PCM_CACHE_MB)
+                if isinstance(budget_mb, (int, float)) and budget_mb >= 0:
+                    pcm_cache_budget_mb = budget_mb
+                else:
+                    print(f"Invalid pcm_cache_budget_mb '{budget_mb}' in config, using {decoding.DEFAULT_PCM_CACHE_MB} MB.")
+                scan_include_patterns = get_config_patterns(config_data, "scan_include_patterns")
+                scan_exclude_patterns = get_config_patterns(config_data, "scan_exclude_patterns")
+                workers = config_data.get("probe_workers", 0)
+                if isinstance(workers, int) and not isinstance(workers, bool) and workers >= 0: probe_workers = workers
+                else: print(f"Invalid probe_workers '{workers}' in config, using automatic.")
+                weighting = config_data.get("selection_weighting", "uniform")
+                if weighting in track_selection.WEIGHTING_MODES: selection_weighting = weighting
+                else: print(f"Invalid selection_weighting '{weighting}' in config, using uniform.")
+                engine_name = config_data.get("audio_engine", "pygame")
+                if engine_name in AUDIO_ENGINES: configured_audio_engine = audio_engine = engine_name
+                else: print(f"Invalid audio_engine '{engine_name}' in config, using pygame.")
+                quality = config_data.get("resample_quality", decoding.DEFAULT_RESAMPLE_QUALITY)
+                if quality == "off" or quality in decoding.RESAMPLE_QUALITIES: resample_quality = quality
+                else: print(f"Invalid resample_quality '{quality}' in config, using {decoding.DEFAULT_RESAMPLE_QUALITY}.")
+                partial_mode = config_data.get("partial_decode", "off")
+                if partial_mode in PARTIAL_DECODE_MODES: partial_decode = partial_mode
+                else: print(f"Invalid partial_decode '{partial_mode}' in config, using off.")
+                stream_s = config_data.get("stream_min_duration_s", DEFAULT_STREAM_MIN_DURATION_S)
+                if isinstance(stream_s, (int, float)) and not isinstance(stream_s, bool) and stream_s >= 0: stream_min_duration_s = stream_s
+                else: print(f"Invalid stream_min_duration_s '{stream_s}' in config, using {DEFAULT_STREAM_MIN_DURATION_S}.")
+                seed = config_data.get("session_seed")
+                if seed is None or (isinstance(seed, int) and not isinstance(seed, bool)): configured_session_seed = seed
+                else: print(f"Invalid session_seed '{seed}' in config (expected an integer or null), using a new seed.")
                 print(f"Loaded config from {config_file_path}. Recording device: '{selected_recording_device}'") # <<< Updated path in message
         else:
             selected_recording_device = None
@@ -590,6 +696,7 @@ def load_config():
     except Exception as e: # Catch other potential errors
         print(f"Unexpected error loading config from {config_file_path}: {e}") # <<< Updated path in message
         selected_recording_device = None
+    decoding.set_pcm_cache_budget(pcm_cache_budget_mb * 1024 * 1024)
 
 
 def save_config():
@@ -597,7 +704,17 @@ def save_config():
     global selected_recording_device
     config_file_path = get_config_path() # <<< Get the correct path
     config_data = {
-        "recording_device_name": selected_recording_device
+        "recording_device_name": selected_recording_device,
+        "pcm_cache_budget_mb": pcm_cache_budget_mb,
+        "scan_include_patterns": scan_include_patterns,
+        "scan_exclude_patterns": scan_exclude_patterns,
+        "probe_workers": probe_workers,
+        "selection_weighting": selection_weighting,
+        "session_seed": configured_session_seed,
+        "audio_engine": configured_audio_engine,
+        "resample_quality": resample_quality,
+        "partial_decode": partial_decode,
+        "stream_min_duration_s": stream_min_duration_s
     }
     try:
         with open(config_file_path, 'w') as f: # <<< Use the path variable
@@ -695,6 +812,22 @@ root.bind('<bracketright>', right_bracket_next_group)
 
 # --- Load Presets ---
 load_config()   # <<< Load config at startup
+
+# --- Session Seed ---
+# Every random choice (next tracks, random presets) comes from a stream derived from one
+# session seed, so a session can be replayed by putting its seed into the config.
+def start_session(seed=None):
+    """Seeds the per-player and preset random streams. None draws a new seed."""
+    global session_seed, preset_rng
+    session_seed = seed if seed is not None else track_selection.new_session_seed()
+    for player_state in players:
+        player_state["rng"] = track_selection.session_rng(session_seed, f"player:{player_state['id']}")
+        player_state["offset_rng"] = track_selection.session_rng(session_seed, f"offsets:{player_state['id']}")
+        player_state["redraw_rng"] = track_selection.session_rng(session_seed, f"redraws:{player_state['id']}")
+    preset_rng = track_selection.session_rng(session_seed, "presets")
+    print(f"Session seed: {session_seed} (set \"session_seed\": {session_seed} in {get_config_path()} to replay this session)")
+
+start_session(configured_session_seed)
 load_presets() # Load presets before creating GUI elements that use them
 
 # --- Settings Dialog Function ---
@@ -773,9 +906,20 @@ def open_settings_dialog():
 
     settings_win.wait_window() # Wait until dialog is closed
 
+def show_pcm_cache_stats():
+    """Shows the shared decoded-PCM cache counters (useful for sizing pcm_cache_budget_mb)."""
+    stats = decoding.get_pcm_cache_stats()
+    messagebox.showinfo("Decode Cache",
+                        f"Entries: {stats['entries']}\n"
+                        f"Size: {stats['bytes'] / 1048576:.1f} MB of {stats['budget_bytes'] / 1048576:.0f} MB\n"
+                        f"Hits: {stats['hits']}   Misses: {stats['misses']}   (hit rate {stats['hit_rate']:.0%})\n"
+                        f"Evictions: {stats['evictions']}   Too large to cache: {stats['rejected']}",
+                        parent=root)
+
 # --- Closing Function ---
 def on_closing():
     # ... (on_closing remains mostly the same, already calls stop_recording and save_presets) ...
+    global prescans_cancelled
     print("Closing application...")
     if is_recording: stop_recording()
     save_presets() # Save presets
@@ -786,7 +930,35 @@ def on_closing():
             try: root.after_cancel(player_state["playback_timer_id"])
             except tk.TclError: pass
         if player_state["channel"]: player_state["channel"].stop()
-    if mixer_initialized: print("Stopping Pygame mixer..."); pygame.mixer.stop()
+        cancel_pending_decode(i)
+        discard_prefetch(i)
+    if ui_tick_timer_id:
+        try: root.after_cancel(ui_tick_timer_id)
+        except tk.TclError: pass
+    prescans_cancelled = True # Running scans stop at the next folder, probes at the next file, peak passes at the next block
+    for player_state in players: player_state["scan_job_id"] = None
+    # Queued jobs are dropped; the running ones stop at their next check
+    decode_executor.shutdown(wait=False, cancel_futures=True) # A decode already reading can't be interrupted, it isn't waited for
+    peak_executor.shutdown(wait=False, cancel_futures=True)
+    for executor in (scan_executor, prescan_executor, probe_executor): # They use the index, which is closed below
+        executor.shutdown(wait=True, cancel_futures=True)
+    index_write_executor.shutdown(wait=True) # Queued play records are quick and kept
+    print(f"PCM cache stats: {decoding.get_pcm_cache_stats()}")
+    print(f"UI frames: {ui_frame_stats['ticks']}, dropped: {ui_frame_stats['dropped']}")
+    print(f"Library index: {library_index.get_index_stats()}")
+    print(f"Session seed: {session_seed}")
+    print(f"Decodes shared between players: {decode_share_stats['shared']}")
+    print(f"Resampling: {decoding.resample_stats}")
+    window_stats = decoding.window_stats
+    if audio_engine == "numpy": print(f"Streamed tracks: {stream_stats['streamed']}, reader underruns: {mix_engine.get_engine_stats().get('stream_underruns', 0)}")
+    if window_stats["windows"]: print(f"Partial decodes: {window_stats['windows']}, read {window_stats['frames_read'] / window_stats['frames_total']:.1%} of those tracks")
+    library_index.close_library_index()
+    if waveform_tick_stats["ticks"]:
+        print(f"Waveform progress ticks: {waveform_tick_stats['ticks']}, "
+              f"avg {waveform_tick_stats['total_s'] / waveform_tick_stats['ticks'] * 1000:.3f} ms, "
+              f"max {waveform_tick_stats['max_s'] * 1000:.3f} ms")
+    if mixer_initialized and audio_engine == "numpy": print("Stopping mix engine..."); mix_engine.stop_engine()
+    elif mixer_initialized: print("Stopping Pygame mixer..."); pygame.mixer.stop()
     if pygame.get_init(): print("Quitting Pygame..."); pygame.quit(); print("Pygame quit.")
     if root and root.winfo_exists(): print("Destroying Tkinter root..."); root.destroy(); print("Tkinter root destroyed.")
 
@@ -819,25 +991,89 @@ preset_menu.add_command(label="Manage Presets...", command=lambda: open_manage_p
 settings_menu = tk.Menu(menu_bar, tearoff=0)
 menu_bar.add_cascade(label="Settings", menu=settings_menu)
 settings_menu.add_command(label="Audio Settings...", command=open_settings_dialog)
+settings_menu.add_command(label="Decode Cache Stats...", command=lambda: show_pcm_cache_stats())
 # --- End Settings Menu ---
 
 # TODO: Add "Manage Presets" option later if needed
 # preset_menu.add_separator()
 # preset_menu.add_command(label="Manage Presets...", command=manage_presets_dialog) # Placeholder
 
+# --- Pygame Crossfade Channels ---
+# Under the Pygame mixer each player owns two mixer channels, like the NumPy engine's spare
+# voice: a timed transition fades the outgoing track out on one while the next track fades
+# in on the other. Stop, pause and volume act on both, everything else on the current one.
+class PygameCrossfadeChannel:
+    """Two pygame.mixer.Channels used as one player channel, with EngineChannel's fadeout_to_spare."""
+
+    def __init__(self, index, spare_index):
+        self.channels = (pygame.mixer.Channel(index), pygame.mixer.Channel(spare_index))
+        self.current = 0
+
+    def _channel(self):
+        return self.channels[self.current]
+
+    def play(self, sound, loops=0, maxtime=0, fade_ms=0):
+        self._channel().play(sound, loops, maxtime, fade_ms)
+
+    def stop(self):
+        for channel in self.channels: channel.stop() # Including a fading tail
+
+    def fadeout(self, time_ms):
+        self._channel().fadeout(time_ms)
+
+    def fadeout_to_spare(self, time_ms):
+        """Fades the current sound out (without its end event) and makes the other channel current,
+        so the next play() overlaps the fade."""
+        self._channel().set_endevent()
+        self._channel().fadeout(time_ms)
+        self.current = 1 - self.current
+
+    def pause(self):
+        for channel in self.channels: channel.pause()
+
+    def unpause(self):
+        for channel in self.channels: channel.unpause()
+
+    def set_volume(self, left, right=None):
+        for channel in self.channels:
+            if right is None: channel.set_volume(left)
+            else: channel.set_volume(left, right)
+
+    def get_busy(self):
+        return self._channel().get_busy()
+
+    def set_endevent(self, event_type=None):
+        if event_type is None: self._channel().set_endevent()
+        else: self._channel().set_endevent(event_type)
+
+    def get_endevent(self):
+        return self._channel().get_endevent()
+
 # --- Pygame Initialization ---
 mixer_initialized = False
 try:
     print("Initializing Pygame...")
     pygame.init()
-    print("Initializing Pygame Mixer...")
-    pygame.mixer.init()
-    print(f"Setting number of channels to {MAX_PLAYERS}...")
-    pygame.mixer.set_num_channels(MAX_PLAYERS)
-    print("Assigning channels...")
-    for i in range(MAX_PLAYERS):
-        players[i]["channel"] = pygame.mixer.Channel(i)
+    if audio_engine == "numpy":
+        pygame.mixer.quit() # pygame.init() opened the SDL audio device too; the engine owns the output
+        print("Starting NumPy mix engine...")
+        try:
+            mix_engine.start_engine(voices=2 * MAX_PLAYERS) # A spare voice per player for crossfades
+            for i in range(MAX_PLAYERS):
+                players[i]["channel"] = mix_engine.EngineChannel(i, MAX_PLAYERS + i) # Same calls as a pygame Channel
+        except Exception as e: # sounddevice missing, or the device would not open
+            print(f"WARNING: NumPy mix engine unavailable ({type(e).__name__}: {e}). Falling back to the Pygame mixer.")
+            audio_engine = "pygame"
+    if audio_engine != "numpy":
+        print("Initializing Pygame Mixer...")
+        pygame.mixer.init()
+        print(f"Setting number of channels to {2 * MAX_PLAYERS}...")
+        pygame.mixer.set_num_channels(2 * MAX_PLAYERS) # A spare channel per player for crossfades
+        print("Assigning channels...")
+        for i in range(MAX_PLAYERS):
+            players[i]["channel"] = PygameCrossfadeChannel(i, MAX_PLAYERS + i)
     mixer_initialized = True
+    output_samplerate = (mix_engine.get_init() if audio_engine == "numpy" else pygame.mixer.get_init())[0]
 
    # --- Set Initial Volume/Pan Directly --- <<< MODIFIED BLOCK
     print("Setting initial volume and pan for channels...")
@@ -875,6 +1111,506 @@ except Exception as e:
      messagebox.showerror("Unexpected Error", f"An unexpected error occurred during setup: {e}")
 # --- End of Pygame Initialization ---
 
+# --- Background Decode Pool ---
+# Tracks are decoded on worker threads so long FLAC/AIFF files don't freeze the UI.
+# Workers never touch Tkinter: finished jobs go into decode_results, which
+# poll_decode_results drains on the Tk thread.
+decode_executor = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="decode")
+decode_results = queue.Queue()
+header_results = queue.Queue() # (player_index, job_id, track_path, probe, window), posted before the audio is read
+decode_job_counter = itertools.count(1)
+shared_decodes = {} # Path -> (window, decode future), reused by every player holding that path (see claim_track)
+decode_share_stats = {"shared": 0} # Decodes served from another player's job instead of decoding again
+stream_stats = {"streamed": 0} # Tracks played through mix_engine.StreamSound instead of being decoded
+peak_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="peaks") # Whole-file peak passes for streamed tracks
+peak_results = queue.Queue() # (player_index, track_path, future) of finished peak passes
+
+try:
+    waveform_peaks.set_peak_cache_dir(get_waveform_cache_dir())
+    decode_executor.submit(waveform_peaks.prune_peak_cache) # Keep the cache bounded without delaying startup
+except OSError as e:
+    print(f"Waveform peak cache disabled, could not create {get_waveform_cache_dir()}: {e}")
+
+try:
+    decoding.set_resample_cache_dir(get_resample_cache_dir())
+    decode_executor.submit(decoding.prune_resample_cache)
+except OSError as e:
+    print(f"Resample cache disabled, could not create {get_resample_cache_dir()}: {e}")
+
+try: library_index.open_library_index(get_library_index_path()) # Falls back to plain folder listing if unavailable
+except OSError as e: print(f"Library index disabled: {e}")
+
+def header_duration_s(probe, window):
+    """Seconds of a track the player will play, from its header probe and decode window (None = whole track)."""
+    return probe["duration_s"] if not window else min(probe["duration_s"], window[0])
+
+def decode_track_for_playback(track_path, window=None, on_header=None):
+    """Worker: decodes a track once (via the shared PCM cache) into the Pygame sound and its waveform peak pyramid.
+
+    Runs off the Tk thread. The peaks come from the same int16 buffer used for playback.
+    window (length_s, offset) from get_decode_window decodes only that part of a long track.
+    on_header(probe) is called with the header probe before any audio is read."""
+    file_key = decoding.get_file_key(track_path)
+    probe = decoding.probe_track(track_path, file_key) # Header only; also tells whether to stream
+    if on_header: on_header(probe)
+    library_index.record_probe(track_path, file_key, probe) # The SQLite write stays off the Tk thread too
+    duration_s = header_duration_s(probe, window)
+    target_samplerate = output_samplerate if resample_quality != "off" else None # Converted once, then cached
+    if should_stream(probe, window, target_samplerate):
+        # Only the ring buffer is held; the waveform comes from the peak cache or a later pass (see request_stream_peaks)
+        stream_stats["streamed"] += 1
+        return {"sound": mix_engine.open_stream(track_path), "samplerate": probe["samplerate"], "frames": probe["frames"],
+                "shape": (probe["frames"], probe["channels"]), "from_cache": False, "streamed": True, "probe": probe,
+                "duration_s": duration_s,
+                "waveform_pyramid": waveform_peaks.load_cached_pyramid(file_key), "window_start_s": None}
+    window_start_s = None
+    if window:
+        audio_data, samplerate, from_cache, window_start_s = decoding.read_track_window(
+            track_path, file_key, window[0], window[1], target_samplerate, resample_quality)
+    else:
+        audio_data, samplerate, from_cache = decoding.read_track_int16(track_path, file_key, target_samplerate, resample_quality)
+    if audio_engine == "numpy": new_sound = mix_engine.make_sound(audio_data, samplerate) # Plays the cached array itself
+    else: # Copies the samples, the cached array stays untouched; mono must match the mixer's channels first
+        new_sound = pygame.sndarray.make_sound(decoding.match_channels(audio_data, pygame.mixer.get_init()[2]))
+    try:
+        # Peak pyramids of files played before come from the on-disk cache (it holds whole tracks, not windows)
+        pyramid = waveform_peaks.load_cached_pyramid(file_key) if window_start_s is None else None
+        if pyramid is None:
+            pyramid = waveform_peaks.build_peak_pyramid_from_pcm(audio_data)
+            if window_start_s is None: waveform_peaks.save_cached_pyramid(file_key, pyramid)
+    except Exception as e: # A missing waveform must not stop playback
+        print(f"Waveform peaks failed for '{os.path.basename(track_path)}': {e}")
+        pyramid = None
+    return {"sound": new_sound, "samplerate": samplerate, "frames": len(audio_data), "shape": audio_data.shape,
+            "from_cache": from_cache, "streamed": False, "probe": probe, "duration_s": duration_s,
+            "waveform_pyramid": pyramid, "window_start_s": window_start_s}
+
+def should_stream(probe, window, target_samplerate):
+    """True if a track is long enough to stream instead of decoding it (NumPy engine, whole-track playback only).
+
+    Tracks that need resampling are decoded, since the conversion works on the whole track."""
+    if audio_engine != "numpy" or not stream_min_duration_s or window: return False
+    if target_samplerate and probe["samplerate"] != target_samplerate: return False
+    return probe["frames"] > 0 and probe["duration_s"] >= stream_min_duration_s
+
+def is_spent_stream(decoded):
+    """True if a decode result is a stream a voice already took: replaying it means reopening the file,
+    which is done by a new decode in the pool rather than by the engine on the Tk thread."""
+    return decoded["streamed"] and decoded["sound"].started
+
+def _stream_peaks_worker(track_path):
+    """Worker: builds and caches the peak pyramid of a streamed track, reading it block by block."""
+    pyramid = waveform_peaks.build_peak_pyramid_streaming(track_path, should_stop=lambda: prescans_cancelled)
+    if pyramid is None: return None # Closing
+    waveform_peaks.save_cached_pyramid(decoding.get_file_key(track_path), pyramid)
+    return pyramid
+
+def request_stream_peaks(player_index, track_path):
+    """Starts the peak pass for a streamed track without cached peaks; the waveform is drawn when it finishes."""
+    future = peak_executor.submit(_stream_peaks_worker, track_path)
+    future.add_done_callback(lambda f, idx=player_index, path=track_path: peak_results.put((idx, path, f)))
+    print(f"Player {player_index}: Building waveform of streamed '{os.path.basename(track_path)}' in the background.")
+
+def decode_shared_with_others(player_index, future):
+    """True if another player holds the track this decode future belongs to (it must not be cancelled then)."""
+    for path, (_, shared_future) in shared_decodes.items():
+        if shared_future is future: return held_by_other_player(player_index, path)
+    return False
+
+def cancel_pending_decode(player_index):
+    """Forgets the player's in-flight decode so its result is discarded when it arrives."""
+    player_state = players[player_index]
+    future = player_state["decode_future"]
+    if future:
+        if decode_shared_with_others(player_index, future): print(f"Player {player_index}: Leaving shared decode job {player_state['decode_job_id']} to the other player.")
+        elif future.cancel(): print(f"Player {player_index}: Cancelled queued decode job {player_state['decode_job_id']}.")
+        else: print(f"Player {player_index}: Decode job {player_state['decode_job_id']} already running, result will be ignored.")
+    player_state["decode_job_id"] = None
+    player_state["decode_future"] = None
+
+def _submit_decode_job(player_index, track_path, window=None):
+    """Submits a decode to the pool and returns (job_id, future). The result arrives via decode_results.
+
+    If another player already decoded (or is decoding) the same path and window, its future is reused,
+    so both play the one read-only buffer instead of decoding the file twice. A stream that already
+    started is not shared (a stream plays once)."""
+    job_id = next(decode_job_counter)
+    shared_window, future = shared_decodes.get(track_path, (None, None))
+    if (future is None or shared_window != window or future.cancelled()
+            or (future.done() and (future.exception() is not None or is_spent_stream(future.result())))):
+        future = decode_executor.submit(decode_track_for_playback, track_path, window,
+                                        lambda probe, idx=player_index, job=job_id: header_results.put((idx, job, track_path, probe, window)))
+        if track_claims.get(track_path): shared_decodes[track_path] = (window, future) # Kept while any player holds the path
+    else:
+        decode_share_stats["shared"] += 1
+        print(f"Player {player_index}: Sharing the decode of '{os.path.basename(track_path)}' with another player.")
+    # The done callback runs on the worker thread, so it only hands the future over
+    future.add_done_callback(lambda f, idx=player_index, job=job_id, path=track_path: decode_results.put((idx, job, path, f)))
+    wake_ui_scheduler() # Poll for the result while it is in flight
+    return job_id, future
+
+def submit_decode(player_index, track_path, window=None):
+    """Queues a background decode for the player, superseding any decode it was still waiting for."""
+    player_state = players[player_index]
+    cancel_pending_decode(player_index)
+    job_id, future = _submit_decode_job(player_index, track_path, window)
+    player_state["decode_job_id"] = job_id
+    player_state["decode_future"] = future
+    print(f"Player {player_index}: Submitted decode job {job_id} for '{os.path.basename(track_path)}'")
+    return job_id
+
+def poll_decode_results():
+    """Hands finished decodes (and streamed tracks' waveforms) to their players on the Tk thread. Called from ui_tick."""
+    while True: # Headers first: they were posted before their decode finished
+        try: player_index, job_id, track_path, probe, window = header_results.get_nowait()
+        except queue.Empty: break
+        if players[player_index]["decode_job_id"] == job_id: apply_track_header(player_index, track_path, probe, window)
+    while True:
+        try: player_index, track_path, future = peak_results.get_nowait()
+        except queue.Empty: break
+        if future.cancelled(): continue
+        if future.exception(): print(f"Player {player_index}: Waveform of '{os.path.basename(track_path)}' failed: {future.exception()}")
+        else: draw_waveform_from_pyramid(player_index, track_path, future.result()) # Skipped if the track changed meanwhile
+    while True:
+        try: player_index, job_id, track_path, future = decode_results.get_nowait()
+        except queue.Empty: break
+        player_state = players[player_index]
+        prefetch = player_state["prefetch"]
+        if prefetch and prefetch["job_id"] == job_id and player_state["decode_job_id"] != job_id:
+            # Background prefetch finished - keep it until the next transition consumes it
+            prefetch["future"] = None
+            if future.cancelled(): continue
+            error = future.exception()
+            if error:
+                print(f"Player {player_index}: Prefetch of '{os.path.basename(track_path)}' failed: {error}. Will pick again at transition.")
+                player_state["prefetch"] = None
+                claim_track(player_index, "prefetch", None)
+                quarantine_track(track_path, error)
+            else:
+                prefetch["decoded"] = future.result()
+                print(f"Player {player_index}: Prefetch ready: {os.path.basename(track_path)}")
+                arm_engine_crossfade(player_index)
+            continue
+        if player_state["decode_job_id"] != job_id:
+            print(f"Player {player_index}: Discarding stale decode job {job_id} ({os.path.basename(track_path)}).")
+            continue
+        player_state["decode_job_id"] = None
+        player_state["decode_future"] = None
+        if future.cancelled(): continue
+        error = future.exception()
+        if error is None and is_spent_stream(future.result()): # Shared with a player that started it first
+            submit_decode(player_index, track_path)
+            continue
+        _start_decoded_track(player_index, track_path, None if error else future.result(), error)
+
+def decodes_in_flight():
+    """True while any player is waiting on a decode or prefetch, or results are waiting to be collected."""
+    if not decode_results.empty() or not header_results.empty(): return True
+    for player_state in players:
+        if player_state["decode_future"]: return True
+        if player_state["prefetch"] and player_state["prefetch"]["future"]: return True
+    return False
+# --- End Background Decode Pool ---
+
+# --- Background Folder Scans ---
+# Folders are scanned recursively on a worker thread. Batches of found files go into
+# scan_results and are handed to the player by poll_scan_results, so playback can start
+# before a large library has been walked completely.
+scan_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scan")
+prescan_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prescan") # Warm-up never delays a player's scan
+scan_results = queue.Queue() # (player_index, job_id, kind, payload) with kind "batch", "done", "error" or "prescan"
+scan_job_counter = itertools.count(1)
+folder_file_lists = {} # Absolute folder path -> its scanned audio files, so loading a known folder is a lookup
+FOLDER_UNCHANGED = "unchanged" # Watcher result when a folder's directory mtimes show no change
+quarantined_paths = library_index.get_quarantined_paths() # Files that failed to decode, never handed to a player
+prescans_pending = 0 # Preset warm-up scans submitted but not yet collected
+prescans_cancelled = False # Set on exit so queued warm-up scans return immediately (also stops probing and peak passes)
+watch_results = queue.Queue() # Folder watch results, same shape as scan_results; collected by the watch timer, not ui_tick
+watch_checks_pending = 0 # Folder watch checks submitted but not yet collected
+probe_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="probe") # Runs one folder's probe pool at a time
+index_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index") # Small index writes from the Tk thread, in order
+probe_folders_queued = set() # Folders waiting for or being probed (absolute paths)
+
+def _scan_folder_worker(player_index, job_id, folder_path, include, exclude):
+    """Worker: scans a folder through the library index, streaming batches into scan_results."""
+    try:
+        files = library_index.scan_folder(folder_path, SUPPORTED_FORMATS, include, exclude,
+                                          on_batch=lambda batch: scan_results.put((player_index, job_id, "batch", batch)),
+                                          should_stop=lambda: players[player_index]["scan_job_id"] != job_id)
+        scan_results.put((player_index, job_id, "done", len(files)))
+    except Exception as e:
+        scan_results.put((player_index, job_id, "error", e))
+
+def _prescan_folder_worker(folder_path, include, exclude, only_if_changed=False, results=scan_results):
+    """Worker: scans one folder for the warm-up or the watcher; the result goes into results.
+
+    With only_if_changed, an already indexed folder whose directory mtimes are all unchanged is not
+    scanned at all and the result is reported as unchanged."""
+    if prescans_cancelled: return
+    if (only_if_changed and os.path.abspath(folder_path) in folder_file_lists
+            and not library_index.folder_changed(folder_path, exclude)):
+        results.put((None, None, "prescan", (folder_path, FOLDER_UNCHANGED)))
+        return
+    try:
+        files = library_index.scan_folder(folder_path, SUPPORTED_FORMATS, include, exclude,
+                                          should_stop=lambda: prescans_cancelled)
+    except Exception as e:
+        print(f"Preset warm-up: Could not scan '{folder_path}': {e}")
+        files = None
+    results.put((None, None, "prescan", (folder_path, files)))
+
+def prescan_presets(folders=None, only_if_changed=False):
+    """Scans preset folders (all of them by default) in the background and keeps their file lists in memory."""
+    global prescans_pending
+    if folders is None:
+        folders = {data["path"] for data in folder_presets.values() if isinstance(data, dict) and data.get("path")}
+    for folder_path in sorted(folders):
+        prescans_pending += 1
+        prescan_executor.submit(_prescan_folder_worker, folder_path, list(scan_include_patterns), list(scan_exclude_patterns),
+                                only_if_changed)
+    if folders:
+        if not only_if_changed: print(f"Preset warm-up: Scanning {len(folders)} folder(s) in the background.")
+        wake_ui_scheduler()
+
+def schedule_preset_rescan():
+    """Re-checks all preset folders and quarantined files every PRESET_RESCAN_MS so the in-memory lists follow changes on disk."""
+    global prescans_pending
+    prescans_pending += 1
+    prescan_executor.submit(_release_quarantine_worker)
+    prescan_presets(only_if_changed=bool(folder_file_lists)) # First run is the full warm-up
+    root.after(PRESET_RESCAN_MS, schedule_preset_rescan)
+
+def schedule_folder_watch():
+    """Polls the folders loaded into players every WATCH_POLL_MS (directory mtimes only) and applies changes.
+
+    Polling rather than inotify/FSEvents/ReadDirectoryChangesW: it needs no extra dependency and
+    also works on network shares, where native change notifications are unreliable. The checks report
+    to watch_results on this timer's own chain, so an idle ui_tick is not woken every poll."""
+    global watch_checks_pending
+    loaded_folders = {player_state["selected_folder"] for player_state in players
+                      if player_state["selected_folder"] and player_state["scan_job_id"] is None and player_state["audio_files"]}
+    collecting = watch_checks_pending > 0 # A previous round is still being collected
+    for folder_path in sorted(loaded_folders):
+        watch_checks_pending += 1
+        prescan_executor.submit(_prescan_folder_worker, folder_path, list(scan_include_patterns), list(scan_exclude_patterns),
+                                True, watch_results)
+    if loaded_folders and not collecting: root.after(WATCH_COLLECT_MS, poll_watch_results)
+    root.after(WATCH_POLL_MS, schedule_folder_watch)
+
+def poll_watch_results():
+    """Tk thread: applies finished folder watch checks; re-arms itself while checks are outstanding."""
+    global watch_checks_pending
+    while True:
+        try: _player_index, _job_id, _kind, payload = watch_results.get_nowait()
+        except queue.Empty: break
+        watch_checks_pending -= 1
+        _store_prescan(*payload)
+    if watch_checks_pending > 0 and not prescans_cancelled: root.after(WATCH_COLLECT_MS, poll_watch_results)
+
+def _store_prescan(folder_path, files):
+    """Tk thread: keeps a warm-up/watch result and applies the added/removed files to players using the folder.
+
+    Only the changed entries are applied to each player's track list; the playing track is never interrupted."""
+    key = os.path.abspath(folder_path)
+    if files == FOLDER_UNCHANGED: return
+    if files is None: # Folder unreadable right now; a later load reports the error
+        folder_file_lists.pop(key, None)
+        return
+    files = [path for path in files if path not in quarantined_paths]
+    old_files = folder_file_lists.get(key)
+    folder_file_lists[key] = files
+    if old_files != files: queue_folder_probe(key) # Characterise new files in the background
+    if old_files is None or old_files == files: return
+    new_set, old_set = set(files), set(old_files)
+    added = [path for path in files if path not in old_set]
+    removed = old_set - new_set
+    print(f"Folder watch: '{os.path.basename(key)}' changed ({len(added)} added, {len(removed)} removed).")
+    for player_state in players:
+        selected = player_state["selected_folder"]
+        if not (selected and os.path.abspath(selected) == key and player_state["scan_job_id"] is None): continue
+        remove_player_tracks(player_state["id"], removed)
+        add_player_tracks(player_state["id"], added)
+        track_list = player_state["audio_files"]
+        prefetch = player_state["prefetch"]
+        if prefetch and prefetch["path"] in removed: discard_prefetch(player_state["id"], "file removed")
+        print(f"Player {player_state['id']+1}: Track list updated, now {len(track_list)} files.")
+        if not player_state["is_playing"] and track_list:
+            player_state["gui"]["status_label"].config(text=f"{len(track_list)} tracks loaded.")
+        update_button_states(player_state["id"])
+
+def get_probe_worker_count():
+    """Thread count for bulk probing: the configured value, or twice the CPU count (header reads mostly wait on I/O)."""
+    return probe_workers or min(32, (os.cpu_count() or 2) * 2)
+
+def _probe_folder_worker(folder_key):
+    """Worker: probes every not-yet-probed file below a folder, reporting progress through scan_results."""
+    paths = [] if prescans_cancelled else library_index.get_unprobed_files(folder_key)
+    probed = failed = 0
+    if paths:
+        print(f"Library probe: {len(paths)} file(s) in '{os.path.basename(folder_key)}' with {get_probe_worker_count()} threads...")
+        start = time.monotonic()
+        probed, failed = library_index.probe_files(
+            paths, workers=get_probe_worker_count(), should_stop=lambda: prescans_cancelled,
+            on_progress=lambda done, total, errors: scan_results.put((None, None, "probe_progress", (folder_key, done, total, errors))))
+        print(f"Library probe: '{os.path.basename(folder_key)}' done in {time.monotonic() - start:.1f}s ({probed} ok, {failed} unreadable).")
+    scan_results.put((None, None, "probe_done", (folder_key, probed, failed)))
+
+def queue_folder_probe(folder_path):
+    """Queues a background probe of a folder's new/changed files (durations, formats, decode health)."""
+    folder_key = os.path.abspath(folder_path)
+    if folder_key in probe_folders_queued: return
+    probe_folders_queued.add(folder_key)
+    probe_executor.submit(_probe_folder_worker, folder_key)
+    wake_ui_scheduler()
+
+def _handle_probe_result(kind, payload):
+    """Tk thread: shows probe progress and drops unreadable files from the track lists once a folder is done."""
+    if kind == "probe_progress":
+        folder_key, done, total, errors = payload
+        library_status_label.config(text=f"Reading track info: {os.path.basename(folder_key)} {done}/{total}"
+                                         + (f" ({errors} unreadable)" if errors else ""))
+        return
+    folder_key, probed, failed = payload
+    probe_folders_queued.discard(folder_key)
+    if probed or failed:
+        library_status_label.config(text=f"Track info read for {os.path.basename(folder_key)}: {probed} ok"
+                                         + (f", {failed} unreadable (skipped)" if failed else ""))
+    if probed and selection_weighting == "duration": # Durations are known now
+        for player_state in players:
+            if player_state["selected_folder"] and os.path.abspath(player_state["selected_folder"]) == folder_key:
+                refresh_player_weights(player_state["id"])
+    if failed:
+        quarantined_paths.update(library_index.get_quarantined_paths()) # Probe failures were quarantined by the worker
+        prescan_presets({folder_key}) # Re-list from the index, which leaves unreadable files out
+
+def start_folder_scan(player_index, folder_path):
+    """Starts a background scan that fills the player's audio_files, superseding any scan still running for it."""
+    player_state = players[player_index]
+    job_id = next(scan_job_counter)
+    player_state["scan_job_id"] = job_id # An older scan for this player notices and stops
+    set_player_tracks(player_index, [])
+    scan_executor.submit(_scan_folder_worker, player_index, job_id, folder_path,
+                         list(scan_include_patterns), list(scan_exclude_patterns))
+    wake_ui_scheduler()
+    print(f"Player {player_index+1}: Started folder scan {job_id}: {folder_path}")
+
+def poll_scan_results():
+    """Hands scanned files to their players on the Tk thread, starting playback on the first batch. Called from ui_tick."""
+    global prescans_pending
+    while True:
+        try: player_index, job_id, kind, payload = scan_results.get_nowait()
+        except queue.Empty: break
+        if kind == "prescan":
+            prescans_pending -= 1
+            _store_prescan(*payload)
+            continue
+        if kind in ("probe_progress", "probe_done"):
+            _handle_probe_result(kind, payload)
+            continue
+        if kind == "quarantine_released":
+            prescans_pending -= 1
+            _handle_quarantine_released(payload)
+            continue
+        player_state = players[player_index]
+        if player_state["scan_job_id"] != job_id: continue # Superseded by a newer folder
+        status_label = player_state["gui"]["status_label"]
+        if kind == "batch":
+            first_batch = not player_state["audio_files"]
+            add_player_tracks(player_index, [path for path in payload if path not in quarantined_paths])
+            if not player_state["is_playing"]:
+                status_label.config(text=f"{len(player_state['audio_files'])} tracks found, scanning...")
+            if first_batch and player_state["audio_files"]:
+                update_button_states(player_index)
+                print(f"Player {player_index+1}: First audio files found. Starting playback automatically...")
+                if not player_state["is_playing"]: handle_play_pause(player_index)
+        elif kind == "done":
+            player_state["scan_job_id"] = None
+            folder_file_lists[os.path.abspath(player_state["selected_folder"])] = list(player_state["audio_files"])
+            queue_folder_probe(player_state["selected_folder"])
+            print(f"Player {player_index+1}: Found {len(player_state['audio_files'])} files.")
+            if not player_state["audio_files"]:
+                messagebox.showwarning("No Audio Found", f"No supported audio files found in:\n{player_state['selected_folder']}")
+                status_label.config(text="No files found.")
+            elif not player_state["is_playing"]:
+                status_label.config(text=f"{len(player_state['audio_files'])} tracks loaded.")
+            update_button_states(player_index)
+        else: # error
+            player_state["scan_job_id"] = None
+            messagebox.showerror("Folder Error", f"Could not read folder: {player_state['selected_folder']}\nError: {payload}")
+            status_label.config(text="Folder Error.")
+            update_button_states(player_index)
+
+def scans_in_flight():
+    """True while any folder scan is running or its results are waiting to be collected."""
+    return (prescans_pending > 0 or bool(probe_folders_queued) or not scan_results.empty()
+            or any(player_state["scan_job_id"] for player_state in players))
+# --- End Background Folder Scans ---
+
+# --- Next-Track Prefetch ---
+# As soon as a track starts, each player picks its next track and decodes it in the
+# background, so the automatic/manual switch only has to start an already built sound.
+
+def get_prefetch_context(player_index):
+    """Returns the settings a prefetched track depends on (folder, preset, loop state)."""
+    player_state = players[player_index]
+    preset_name = ""
+    if dropdown := player_state["gui"].get("preset_dropdown"):
+        preset_name = dropdown.get()
+    return (player_state["selected_folder"], preset_name, player_state["current_waveform_color"], player_state["is_looping"])
+
+def discard_prefetch(player_index, reason=""):
+    """Drops the player's prefetched track (cancelling its decode if still queued)."""
+    player_state = players[player_index]
+    prefetch = player_state["prefetch"]
+    if not prefetch: return
+    disarm_engine_crossfade(player_index, reschedule=player_state["is_playing"] and not player_state["is_paused"])
+    if prefetch["future"] and not decode_shared_with_others(player_index, prefetch["future"]): prefetch["future"].cancel()
+    player_state["prefetch"] = None
+    claim_track(player_index, "prefetch", None)
+    print(f"Player {player_index}: Discarded prefetch of '{os.path.basename(prefetch['path'])}'{f' ({reason})' if reason else ''}.")
+
+def start_prefetch(player_index):
+    """Picks the player's next random track and starts decoding it in the background."""
+    player_state = players[player_index]
+    if not player_state["is_playing"] or player_state["is_looping"] or not player_state["audio_files"]:
+        return
+    current_file = player_state["filepath"]
+
+    prefetch = player_state["prefetch"]
+    if prefetch:
+        if prefetch["context"] == get_prefetch_context(player_index) and prefetch["path"] != current_file:
+            return # Still a valid pick (e.g. after Prev), keep it
+        discard_prefetch(player_index, "superseded")
+
+    # Same selection rules as a normal transition (the playing track is blocked like a history entry)
+    next_track = pick_next_track(player_index)
+
+    claim_track(player_index, "prefetch", next_track)
+    window = get_decode_window(player_index)
+    job_id, future = _submit_decode_job(player_index, next_track, window)
+    player_state["prefetch"] = {"path": next_track, "job_id": job_id, "future": future, "window": window,
+                                "decoded": None, "context": get_prefetch_context(player_index)}
+    print(f"Player {player_index}: Prefetching next track (job {job_id}): {os.path.basename(next_track)}")
+
+def take_prefetch(player_index):
+    """Returns the player's prefetch if it still matches the current settings, otherwise discards it."""
+    player_state = players[player_index]
+    prefetch = player_state["prefetch"]
+    if not prefetch: return None
+    if prefetch["context"] != get_prefetch_context(player_index):
+        discard_prefetch(player_index, "folder/preset/loop changed"); return None
+    if not track_selection.contains(player_state["track_bag"], prefetch["path"]): # Bag lookup, O(1) even for huge folders
+        discard_prefetch(player_index, "file no longer in folder"); return None
+    if prefetch["window"]: # A partial decode must still cover what will be heard
+        needed_s = get_decode_window_s(player_index)
+        if needed_s is None or prefetch["window"][0] < needed_s:
+            discard_prefetch(player_index, "interval/fade changed, decoded window too short"); return None
+    player_state["prefetch"] = None
+    claim_track(player_index, "playing", prefetch["path"]) # Hand the claim over before releasing it, keeping the shared decode
+    claim_track(player_index, "prefetch", None)
+    return prefetch
+# --- End Next-Track Prefetch ---
+
 # --- Waveform and Progress Functions ---
 
 def clear_waveform(player_index):
@@ -883,65 +1619,39 @@ def clear_waveform(player_index):
     canvas = player_state["gui"]["waveform_canvas"]
     if canvas:
         canvas.delete("waveform_bg")
-        canvas.delete("waveform_played")
+    player_state["waveform_line_ids"] = []
+    player_state["waveform_played_pixels"] = 0
     player_state["waveform_data"] = None
+    player_state["waveform_pyramid"] = None
+    player_state["waveform_view"] = None
     player_state["current_track_duration_s"] = 0.0
 
-def load_and_draw_waveform(player_index, track_path):
-    """Loads audio, processes, and draws the static waveform background."""
+def set_waveform_played_pixels(player_index, played_pixels, progress_color):
+    """Recolors waveform lines so exactly the first played_pixels show progress_color.
+
+    The lines are created once by redraw_waveform; a tick only touches the columns whose
+    state changed (usually zero or one), so its cost does not grow with the canvas width."""
     player_state = players[player_index]
     canvas = player_state["gui"]["waveform_canvas"]
-    clear_waveform(player_index) # Clear previous first
-
-    if not canvas: return # No canvas to draw on
-
-    try:
-        data, samplerate = sf.read(track_path, dtype='float32')
-        player_state["current_track_duration_s"] = len(data) / samplerate
-        print(f"Player {player_index}: Duration: {player_state['current_track_duration_s']:.2f}s, Rate: {samplerate}Hz")
-
-        if data.ndim > 1: data = data.mean(axis=1) # Make mono
-
-        samples_per_pixel = math.ceil(len(data) / WAVEFORM_WIDTH)
-        if samples_per_pixel <= 0: samples_per_pixel = 1
-
-        num_segments = WAVEFORM_WIDTH
-        processed_data = []
-        for i in range(num_segments):
-            start = i * samples_per_pixel
-            end = min((i + 1) * samples_per_pixel, len(data))
-            if start >= end:
-                processed_data.append(processed_data[-1] if processed_data else 0)
-                continue
-            segment = data[start:end]
-            processed_data.append(np.max(np.abs(segment))) # Peak amplitude
-
-        max_amp = max(processed_data) if processed_data else 1.0
-        if max_amp == 0: max_amp = 1.0
-
-        # Store normalized data (0 to 1) for progress drawing
-        player_state["waveform_data"] = [amp / max_amp for amp in processed_data]
-
-        # --- Drawing Background Waveform ---
-        center_y = WAVEFORM_HEIGHT / 2
-        half_height = WAVEFORM_HEIGHT / 2
-        for i, normalized_amp in enumerate(player_state["waveform_data"]):
-            x = i
-            line_height = max(1, normalized_amp * half_height) # Ensure minimum 1 pixel height
-            y1 = center_y - line_height
-            y2 = center_y + line_height
-            # Draw background line (e.g., grey)
-            canvas.create_line(x, y1, x, y2, fill="grey50", width=1, tags="waveform_bg")
-
-    except Exception as e:
-        print(f"Player {player_index}: Error processing waveform: {e}")
-        player_state["waveform_data"] = None
-        player_state["current_track_duration_s"] = 0.0
-        canvas.create_text(WAVEFORM_WIDTH / 2, WAVEFORM_HEIGHT / 2,
-                           text="Waveform unavailable", fill="grey", tags="waveform_bg")
+    line_ids = player_state["waveform_line_ids"]
+    played_pixels = max(0, min(played_pixels, len(line_ids)))
+    drawn = player_state["waveform_played_pixels"]
+
+    if progress_color != player_state["waveform_played_color"] and drawn > 0:
+        for item_id in line_ids[:min(drawn, played_pixels)]: canvas.itemconfigure(item_id, fill=progress_color) # Preset color changed
+    if played_pixels == 0 and drawn > 0:
+        canvas.itemconfigure("waveform_bg", fill=WAVEFORM_BG_COLOR) # Whole reset in one call
+    elif played_pixels < drawn: # Moved backwards (loop wrap, zoom)
+        for item_id in line_ids[played_pixels:drawn]: canvas.itemconfigure(item_id, fill=WAVEFORM_BG_COLOR)
+    else:
+        for item_id in line_ids[drawn:played_pixels]: canvas.itemconfigure(item_id, fill=progress_color)
+    player_state["waveform_played_pixels"] = played_pixels
+    player_state["waveform_played_color"] = progress_color
 
 def update_waveform_progress(player_index):
-    """Updates the 'played' portion of the waveform using time and the player's stored color."""
+    """Updates the 'played' portion of the waveform using time and the player's stored color.
+
+    Called for every playing player by ui_tick; it does not schedule itself."""
     player_state = players[player_index]
     canvas = player_state["gui"]["waveform_canvas"]
     duration = player_state["current_track_duration_s"]
@@ -949,12 +1659,11 @@ def update_waveform_progress(player_index):
     # <<< Get the stored color for this player >>>
     progress_color = player_state.get("current_waveform_color", DEFAULT_WAVEFORM_COLOR)
 
-    player_state["progress_update_timer_id"] = None # Clear previous timer ID
-
     if not canvas or not player_state["is_playing"] or player_state["is_paused"] or duration <= 0 or not waveform_data:
-        if canvas: canvas.delete("waveform_played")
+        if canvas: set_waveform_played_pixels(player_index, 0, progress_color)
         return
 
+    tick_start = time.perf_counter()
     try:
         elapsed_time = time.monotonic() - (player_state["playback_start_time"] + player_state["total_paused_duration"])
 
@@ -965,45 +1674,136 @@ def update_waveform_progress(player_index):
 
         progress_ratio = max(0.0, min(1.0, effective_elapsed_time / duration)) if duration > 0 else 0.0
 
-        played_pixels = int(progress_ratio * WAVEFORM_WIDTH)
-        canvas.delete("waveform_played") # Clear only the played part
-
-        center_y = WAVEFORM_HEIGHT / 2
-        half_height = WAVEFORM_HEIGHT / 2
-        for i in range(played_pixels):
-            if i < len(waveform_data):
-                normalized_amp = waveform_data[i]
-                x = i
-                line_height = max(1, normalized_amp * half_height)
-                y1 = center_y - line_height
-                y2 = center_y + line_height
-                # <<< Use the progress_color variable >>>
-                canvas.create_line(x, y1, x, y2, fill=progress_color, width=1, tags="waveform_played")
+        # Map the track position into the (possibly zoomed) view
+        view_start, view_end = player_state["waveform_view"] or (0.0, 1.0)
+        view_ratio = max(0.0, min(1.0, (progress_ratio - view_start) / (view_end - view_start)))
+        played_pixels = int(view_ratio * player_state["waveform_width"])
+        set_waveform_played_pixels(player_index, played_pixels, progress_color)
 
-        # Reschedule
-        player_state["progress_update_timer_id"] = root.after(PROGRESS_UPDATE_MS, lambda idx=player_index: update_waveform_progress(idx))
+        waveform_tick_stats["ticks"] += 1
+        tick_s = time.perf_counter() - tick_start
+        waveform_tick_stats["total_s"] += tick_s
+        if tick_s > waveform_tick_stats["max_s"]: waveform_tick_stats["max_s"] = tick_s
 
     except Exception as e:
         print(f"Player {player_index+1}: Error updating waveform progress: {e}")
-        if player_state["progress_update_timer_id"]:
-            try:
-                root.after_cancel(player_state["progress_update_timer_id"])
-            except tk.TclError: pass
-            player_state["progress_update_timer_id"] = None
 
-# --- Core Functions  ---
+def redraw_waveform(player_index):
+    """Renders the player's peak pyramid at the canvas's current width and zoom, and redraws the background."""
+    player_state = players[player_index]
+    canvas = player_state["gui"]["waveform_canvas"]
+    pyramid = player_state["waveform_pyramid"]
+    if not canvas: return
+    canvas.delete("waveform_bg")
+    player_state["waveform_line_ids"] = []
+    player_state["waveform_played_pixels"] = 0 # Progress is recolored on the next tick
+
+    if not pyramid:
+        player_state["waveform_data"] = None
+        canvas.create_text(player_state["waveform_width"] / 2, WAVEFORM_HEIGHT / 2,
+                           text="Waveform unavailable", fill="grey", tags="waveform_bg")
+        return
+
+    # Render from the pyramid - no audio is read, whatever the width or zoom
+    width = player_state["waveform_width"]
+    view_start, view_end = player_state["waveform_view"] or (0.0, 1.0)
+    summary = waveform_peaks.render_peaks(pyramid, width, int(view_start * pyramid["frames"]), int(view_end * pyramid["frames"]))
+    # Store normalized data (0 to 1) for progress drawing
+    player_state["waveform_data"] = waveform_peaks.summary_to_display_peaks(summary)
+
+    center_y = WAVEFORM_HEIGHT / 2
+    half_height = WAVEFORM_HEIGHT / 2
+    line_ids = []
+    for i, normalized_amp in enumerate(player_state["waveform_data"]):
+        x = i
+        line_height = max(1, normalized_amp * half_height)
+        y1 = center_y - line_height
+        y2 = center_y + line_height
+        line_ids.append(canvas.create_line(x, y1, x, y2, fill=WAVEFORM_BG_COLOR, width=1, tags="waveform_bg"))
+    player_state["waveform_line_ids"] = line_ids
+
+def on_waveform_resize(player_index, event):
+    """Re-renders the waveform when its canvas changes width (e.g. the window was resized)."""
+    player_state = players[player_index]
+    if event.width <= 1 or event.width == player_state["waveform_width"]: return
+    player_state["waveform_width"] = event.width
+    if player_state["waveform_pyramid"]: redraw_waveform(player_index)
 
-def find_audio_files(folder):
-    """Scans a folder for supported audio files."""
-    found_files = []
+def on_waveform_zoom(player_index, event):
+    """Zooms the waveform in/out around the mouse pointer (mouse wheel)."""
+    player_state = players[player_index]
+    pyramid = player_state["waveform_pyramid"]
+    if not pyramid or pyramid["frames"] <= 0: return
+    zoom_in = (getattr(event, "delta", 0) > 0) or getattr(event, "num", None) == 4
+    view_start, view_end = player_state["waveform_view"] or (0.0, 1.0)
+    span = view_end - view_start
+    anchor = view_start + span * max(0.0, min(1.0, event.x / max(1, player_state["waveform_width"])))
+    min_span = min(1.0, WAVEFORM_MIN_ZOOM_FRAMES / pyramid["frames"])
+    new_span = max(min_span, min(1.0, span * (0.5 if zoom_in else 2.0)))
+    new_start = max(0.0, min(1.0 - new_span, anchor - (anchor - view_start) * new_span / span))
+    player_state["waveform_view"] = None if new_span >= 1.0 else (new_start, new_start + new_span)
+    redraw_waveform(player_index)
+
+def reset_waveform_zoom(player_index, event=None):
+    """Shows the whole track again (double-click on the waveform)."""
+    player_state = players[player_index]
+    if player_state["waveform_view"] is None: return
+    player_state["waveform_view"] = None
+    redraw_waveform(player_index)
+
+# --- UI Refresh Scheduler ---
+# One root.after chain drives progress for all players, Pygame end events and decode
+# and folder-scan collection. It runs at PROGRESS_UPDATE_MS while something plays, at DECODE_POLL_MS
+# while decodes are pending, at SCAN_POLL_MS while only scans/probes are, and stops entirely when
+# idle; wake_ui_scheduler restarts it.
+ui_tick_timer_id = None
+ui_tick_due = 0.0 # time.monotonic() the pending tick is due
+ui_frame_stats = {"ticks": 0, "dropped": 0}
+
+def wake_ui_scheduler(delay_ms=0):
+    """Makes sure a UI tick runs within delay_ms. Repeated calls coalesce into a single tick."""
+    global ui_tick_timer_id, ui_tick_due
+    due = time.monotonic() + delay_ms / 1000
+    if ui_tick_timer_id is not None:
+        if ui_tick_due <= due: return # An earlier tick is already scheduled
+        try: root.after_cancel(ui_tick_timer_id)
+        except tk.TclError: pass
+    ui_tick_due = due
+    ui_tick_timer_id = root.after(delay_ms, ui_tick)
+
+def ui_tick():
+    """One UI frame: collects decodes and Pygame events, updates every visible player's progress, reschedules."""
+    global ui_tick_timer_id
+    ui_tick_timer_id = None
     try:
-        for filename in os.listdir(folder):
-            if not filename.startswith('.') and filename.lower().endswith(SUPPORTED_FORMATS):
-                full_path = os.path.join(folder, filename)
-                found_files.append(full_path)
-    except Exception as e:
-        messagebox.showerror("Folder Error", f"Could not read folder: {folder}\nError: {e}")
-    return found_files
+        if not root.winfo_exists(): return
+    except tk.TclError: return
+    frame_start = time.monotonic()
+
+    poll_decode_results()
+    poll_scan_results()
+    check_pygame_events()
+
+    active_players = [p for p in players if p["is_playing"] and not p["is_paused"]]
+    window_visible = root.state() != "iconic" # No drawing while minimized, audio keeps running
+    if window_visible:
+        for player_state in active_players:
+            if player_state["waveform_data"]: update_waveform_progress(player_state["id"])
+    ui_frame_stats["ticks"] += 1
+
+    # --- Choose the next frame (or sleep) ---
+    if active_players: interval_ms = PROGRESS_UPDATE_MS if window_visible else EVENT_CHECK_MS
+    elif decodes_in_flight(): interval_ms = DECODE_POLL_MS # A player is waiting to start
+    elif scans_in_flight(): interval_ms = SCAN_POLL_MS
+    else: return # Idle: nothing plays, decodes or scans, wait for wake_ui_scheduler
+
+    # Keep to the frame grid; if this tick overran, skip the missed frames instead of queueing them
+    elapsed_ms = (time.monotonic() - frame_start) * 1000
+    if elapsed_ms > interval_ms: ui_frame_stats["dropped"] += int(elapsed_ms // interval_ms)
+    wake_ui_scheduler(max(1, int(interval_ms - elapsed_ms % interval_ms)))
+# --- End UI Refresh Scheduler ---
+
+# --- Core Functions  ---
 
 # multi_player.py
 
@@ -1054,13 +1854,7 @@ def handle_play_pause(player_index):
                 except tk.TclError: pass
                 player_state["playback_timer_id"] = None
 
-            # Cancel the progress visualization timer
-            if player_state["progress_update_timer_id"]:
-                try:
-                    root.after_cancel(player_state["progress_update_timer_id"])
-                    print(f"  Player {player_index+1}: Cancelled progress_update_timer_id on pause.")
-                except tk.TclError: pass
-                player_state["progress_update_timer_id"] = None
+            # Progress stops by itself: ui_tick skips paused players (and sleeps if nothing else plays)
 
             update_button_states(player_index) # Update GUI now
         else:
@@ -1146,12 +1940,16 @@ def handle_play_pause(player_index):
                  print(f"  Player {player_index+1}: Resuming loop - no transition timer needed.")
                  player_state["playback_timer_id"] = None # Ensure no timer
                  channel.set_endevent() # Ensure no end event
+            if player_state["crossfade"]: # The engine switches at the armed frame instead
+                if player_state["playback_timer_id"]:
+                    try: root.after_cancel(player_state["playback_timer_id"])
+                    except tk.TclError: pass
+                    player_state["playback_timer_id"] = None
+                channel.set_endevent()
             # --- End Reschedule Block ---
 
-            # Restart progress timer only if duration is known
-            if track_duration_s > 0:
-                 player_state["progress_update_timer_id"] = root.after(PROGRESS_UPDATE_MS, lambda idx=player_index: update_waveform_progress(idx))
-                 print(f"  Player {player_index+1}: Restarted progress update timer.")
+            # Progress resumes on the next UI tick
+            wake_ui_scheduler()
 
             update_button_states(player_index) # Update GUI now
         else:
@@ -1197,24 +1995,24 @@ def process_folder(player_index, folder_path):
     player_state["selected_folder"] = folder_path
     player_state["filepath"] = None
     player_state["sound"] = None
-    player_state["play_history"].clear()
+    clear_history(player_index)
     player_state["gui"]["folder_label"].config(text=f"Folder: {os.path.basename(folder_path)}")
     player_state["gui"]["status_label"].config(text="Scanning...")
     clear_waveform(player_index) # Clear waveform *before* loading new one
     root.update_idletasks()
     print(f"Player {player_index+1}: Processing folder: {folder_path}")
-    player_state["audio_files"] = find_audio_files(folder_path)
-    print(f"Player {player_index+1}: Found {len(player_state['audio_files'])} files.")
-
-    if not player_state["audio_files"]:
-        messagebox.showwarning("No Audio Found", f"No supported audio files found in:\n{folder_path}")
-        player_state["gui"]["status_label"].config(text="No files found.")
-        update_button_states(player_index)
-    else:
-        player_state["gui"]["status_label"].config(text=f"{len(player_state['audio_files'])} tracks loaded.")
+    known_files = folder_file_lists.get(os.path.abspath(folder_path))
+    if known_files:
+        # Already scanned (preset warm-up or an earlier load) - no disk access needed
+        player_state["scan_job_id"] = None
+        set_player_tracks(player_index, known_files)
+        player_state["gui"]["status_label"].config(text=f"{len(known_files)} tracks loaded.")
         update_button_states(player_index)
-        print(f"Player {player_index+1}: Audio files found. Starting playback automatically...")
-        root.after(10, lambda idx=player_index: handle_play_pause(idx))
+        print(f"Player {player_index+1}: {len(known_files)} files known from the library index. Starting playback automatically...")
+        handle_play_pause(player_index)
+        return
+    start_folder_scan(player_index, folder_path) # Playback starts from poll_scan_results once the first files are found
+    update_button_states(player_index)
 
 def select_folder(player_index):
     """Opens dialog to select folder for a player."""
@@ -1238,9 +2036,329 @@ def get_interval_ms(player_index):
         print(f"Player {player_index}: Invalid interval '{seconds_str}'. Will play full track.")
         return None
 
+def get_decode_window_s(player_index):
+    """Seconds of the next track that can be heard under partial_decode (interval + fade-out + margin), or None for all of it."""
+    player_state = players[player_index]
+    if partial_decode == "off" or player_state["is_looping"]: return None # A looping track is heard whole
+    interval_ms = get_interval_ms(player_index)
+    if interval_ms is None: return None
+    return (interval_ms + player_state.get("fade_duration_ms", 0) + PARTIAL_DECODE_MARGIN_MS) / 1000
+
+def get_decode_window(player_index):
+    """Window (length_s, offset) to decode for the player's next track, or None to decode the whole track."""
+    length_s = get_decode_window_s(player_index)
+    if length_s is None: return None
+    return (length_s, players[player_index]["offset_rng"].random() if partial_decode == "random" else 0.0)
+
+# --- Helper: Track Lists, History and Selection ---
+# audio_files (ordered list, used for display/counts) and track_bag (O(1) picks) are
+# always changed together through these helpers.
+def get_track_weights(paths):
+    """Selection weights for tracks under the configured weighting, from the library index. None when uniform."""
+    if selection_weighting == "uniform": return None
+    now = time.time()
+    info = library_index.get_selection_info(paths)
+    return {path: track_selection.compute_weight(selection_weighting, *info.get(path, (None, None)), now=now) for path in paths}
+
+def set_player_tracks(player_index, paths):
+    """Replaces the player's track list, keeping the current history blocked."""
+    player_state = players[player_index]
+    player_state["audio_files"] = list(paths)
+    bag = track_selection.new_bag(player_state["audio_files"], get_track_weights(player_state["audio_files"]))
+    for path in player_state["play_history"]: track_selection.block(bag, path)
+    track_selection.set_current(bag, player_state["filepath"])
+    player_state["track_bag"] = bag
+
+def add_player_tracks(player_index, paths):
+    """Appends tracks the player doesn't have yet."""
+    player_state = players[player_index]
+    bag = player_state["track_bag"]
+    new_paths = [path for path in dict.fromkeys(paths) if not track_selection.contains(bag, path)]
+    player_state["audio_files"].extend(new_paths)
+    track_selection.add_tracks(bag, new_paths, get_track_weights(new_paths) if new_paths else None)
+
+def remove_player_tracks(player_index, paths):
+    """Removes tracks from the player (paths it doesn't have are ignored)."""
+    player_state = players[player_index]
+    bag = player_state["track_bag"]
+    gone = {path for path in paths if track_selection.contains(bag, path)}
+    if not gone: return
+    player_state["audio_files"][:] = [path for path in player_state["audio_files"] if path not in gone]
+    track_selection.remove_tracks(bag, gone)
+
+def push_history(player_index, path):
+    """Adds a played track to the history (blocking it from selection); the oldest entry is released when full."""
+    player_state = players[player_index]
+    history, bag = player_state["play_history"], player_state["track_bag"]
+    if history and history[-1] == path: return
+    if len(history) == history.maxlen: track_selection.unblock(bag, history[0]) # About to drop off the left end
+    history.append(path)
+    track_selection.block(bag, path)
+
+def pop_history(player_index):
+    """Removes and returns the most recent history entry."""
+    player_state = players[player_index]
+    path = player_state["play_history"].pop()
+    track_selection.unblock(player_state["track_bag"], path)
+    return path
+
+def clear_history(player_index):
+    """Empties the player's history."""
+    player_state = players[player_index]
+    player_state["play_history"].clear()
+    track_selection.clear_blocks(player_state["track_bag"])
+
+def refresh_player_weights(player_index):
+    """Re-reads the weights of all the player's tracks (e.g. once their durations are known). O(n log n)."""
+    player_state = players[player_index]
+    weights = get_track_weights(player_state["audio_files"])
+    if weights is None: return
+    for path, weight in weights.items(): track_selection.set_weight(player_state["track_bag"], path, weight)
+
+def note_track_played(player_index, path):
+    """Records a play in the index (on a worker, the index lock may be held by a probe batch); under
+    "least_recent" the track's weight drops back to the minimum."""
+    index_write_executor.submit(library_index.record_played, path, time.time())
+    if selection_weighting == "least_recent":
+        track_selection.set_weight(players[player_index]["track_bag"], path,
+                                   track_selection.compute_weight("least_recent", None, time.time()))
+
+def pick_next_track(player_index):
+    """Picks a random track not in the recent history (nor playing); falls back to any track. None if no tracks.
+
+    The first draw always comes from the player's own stream, whatever the other players hold, so a
+    seeded session keeps its sequence. Only a track held by another player is re-drawn, from a separate stream."""
+    player_state = players[player_index]
+    path = track_selection.pick(player_state["track_bag"], player_state["rng"])
+    for _ in range(MAX_CLAIM_REDRAWS):
+        if path is None or not held_by_other_player(player_index, path): break
+        path = track_selection.pick(player_state["track_bag"], player_state["redraw_rng"])
+    return path
+
+# --- Helper: Cross-Player Track Registry ---
+# Tracks a player is playing (or loading) or has prefetched are re-drawn when another player
+# on an overlapping folder picks them (pick_next_track), so players don't pick the same file
+# at once. The bags themselves don't depend on the claims, which keeps each player's seeded
+# draws independent of decode and timer timing. If the re-draws keep hitting held tracks the
+# pick keeps a held one, and _submit_decode_job then shares the decode instead of reading the file again.
+track_claims = {} # Path -> {player index: number of roles it holds the path in}
+
+def claim_track(player_index, role, path):
+    """Records path as the player's "playing" or "prefetch" track; None releases the role."""
+    claims = players[player_index]["claims"]
+    old_path = claims.get(role)
+    if old_path == path: return
+    if path is None: del claims[role]
+    else: claims[role] = path
+    if path is not None:
+        holders = track_claims.setdefault(path, {})
+        holders[player_index] = holders.get(player_index, 0) + 1
+    if old_path is not None:
+        holders = track_claims[old_path]
+        holders[player_index] -= 1
+        if holders[player_index] == 0: del holders[player_index]
+        if not holders: # Nobody holds it any more; a later decode starts fresh (the PCM cache still helps)
+            del track_claims[old_path]
+            shared_decodes.pop(old_path, None)
+
+def held_by_other_player(player_index, path):
+    """True if a player other than player_index is playing, loading or has prefetched path."""
+    return any(holder != player_index for holder in track_claims.get(path, ()))
+
+# --- Helper: Quarantine of Unreadable Tracks ---
+def quarantine_track(track_path, reason):
+    """Removes a file that failed to load from every track list, so it isn't picked again.
+
+    Real decode errors (see decoding.is_persistent_decode_error) are quarantined in the library index
+    and retried once the file changes on disk; anything else only skips the file for this session."""
+    if isinstance(reason, Exception) and not decoding.is_persistent_decode_error(reason):
+        print(f"Skipping '{os.path.basename(track_path)}' for this session: {type(reason).__name__}: {reason}")
+    else:
+        library_index.quarantine_file(track_path, f"{type(reason).__name__}: {reason}" if isinstance(reason, Exception) else reason)
+    quarantined_paths.add(track_path)
+    for track_list in folder_file_lists.values():
+        if track_path in track_list: track_list.remove(track_path)
+    for player_state in players:
+        remove_player_tracks(player_state["id"], [track_path])
+        prefetch = player_state["prefetch"]
+        if prefetch and prefetch["path"] == track_path: discard_prefetch(player_state["id"], "track quarantined")
+
+def skip_unreadable_track(player_index, track_path, error):
+    """Quarantines (or skips) a track that failed to load and plays the next one instead of showing a dialog.
+
+    Stops the player (status message only) after MAX_CONSECUTIVE_DECODE_FAILURES failures in a row."""
+    player_state = players[player_index]
+    quarantine_track(track_path, error)
+    player_state["decode_failures"] += 1
+    status_label = player_state["gui"]["status_label"]
+    if player_state["decode_failures"] >= MAX_CONSECUTIVE_DECODE_FAILURES or not player_state["audio_files"]:
+        print(f"Player {player_index}: {player_state['decode_failures']} unreadable track(s) in a row, stopping.")
+        stop_playback(player_index)
+        status_label.config(text=f"Stopped: {player_state['decode_failures']} unreadable file(s).")
+        player_state["decode_failures"] = 0
+        return
+    status_label.config(text=f"Skipped unreadable: {os.path.basename(track_path)}")
+    _play_next_after_fade(player_index)
+
+def _release_quarantine_worker():
+    """Worker: releases quarantined files that changed on disk; the result goes into scan_results."""
+    released = [] if prescans_cancelled else library_index.release_changed_quarantine()
+    scan_results.put((None, None, "quarantine_released", released))
+
+def _handle_quarantine_released(released):
+    """Tk thread: lets released files back in by re-listing the known folders that contain them."""
+    if not released: return
+    quarantined_paths.difference_update(released)
+    folders = {folder for folder in folder_file_lists
+               if any(path.startswith(folder + os.sep) for path in released)}
+    prescan_presets(folders)
+
+# --- Helper: Header Probe and Transition Planning ---
+def format_duration(seconds):
+    """Formats seconds as m:ss."""
+    seconds = int(round(seconds))
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def get_output_init():
+    """Output format (samplerate, format, channels) of the active audio engine, or None if it isn't running."""
+    if not mixer_initialized: return None
+    return mix_engine.get_init() if audio_engine == "numpy" else pygame.mixer.get_init()
+
+def get_transition_settings(player_index):
+    """The settings plan_next_transition depends on besides the duration, to tell whether a plan is still current."""
+    player_state = players[player_index]
+    return player_state.get("fade_duration_ms", 0), get_interval_ms(player_index), player_state["is_looping"]
+
+def apply_track_header(player_index, track_path, probe, window):
+    """Tk thread: the header of the track a player is loading has been read, before its audio. Shows the length,
+    warns about a sample-rate mismatch and plans the transition, so starting the decoded track only schedules it."""
+    player_state = players[player_index]
+    duration_s = header_duration_s(probe, window)
+    player_state["current_track_duration_s"] = duration_s
+    report_samplerate_mismatch(player_index, probe)
+    player_state["loading_header"] = (track_path, get_transition_settings(player_index),
+                                      plan_next_transition(player_index, int(duration_s * 1000)))
+    player_state["gui"]["status_label"].config(text=f"Loading: {os.path.basename(track_path)} ({format_duration(duration_s)})")
+
+def report_samplerate_mismatch(player_index, probe):
+    """Warns if a track's header sample rate (probed by the decode worker) doesn't match the mixer."""
+    mismatch = decoding.get_samplerate_mismatch(probe, get_output_init())
+    if mismatch and resample_quality == "off": print(f"  Player {player_index}: WARNING - {mismatch}")
+    elif mismatch: print(f"  Player {player_index}: {probe['samplerate']}Hz track, resampled to {output_samplerate}Hz on load ({resample_quality}).")
+
+def plan_next_transition(player_index, track_duration_ms):
+    """Works out how the player hands over to its next track, from the track duration and current settings.
+
+    Only needs the duration, so it works from a header probe as well as from decoded audio.
+    Returns (action, delay_ms): ("fade", ms) to start the fade-out, ("next", ms) to switch without fading,
+    ("end_event", None) to wait for the channel's end event, or (None, None) for no automatic transition."""
+    player_state = players[player_index]
+    fade_ms = player_state.get("fade_duration_ms", 0)
+    user_interval_ms = get_interval_ms(player_index)
+    print(f"Player {player_index}: Settings: loop={player_state['is_looping']}, fade={fade_ms}ms, interval={user_interval_ms}ms, duration={track_duration_ms}ms")
+
+    if player_state["is_looping"]:
+        print(f"Player {player_index}: Looping enabled, no automatic transition scheduled.")
+        return None, None
+    if fade_ms > 0 and track_duration_ms > fade_ms:
+        natural_end_fade_start_time_ms = max(1, track_duration_ms - fade_ms)
+        fade_trigger_time_ms = natural_end_fade_start_time_ms
+        if user_interval_ms is not None and user_interval_ms < natural_end_fade_start_time_ms:
+            fade_trigger_time_ms = user_interval_ms
+            print(f"Player {player_index}: User interval ({user_interval_ms}ms) is earlier than natural fade start.")
+        print(f"Player {player_index}: Scheduling fade-out initiation in {fade_trigger_time_ms / 1000:.2f}s.")
+        return "fade", fade_trigger_time_ms
+    if fade_ms == 0:
+        if user_interval_ms is not None:
+            print(f"Player {player_index}: Scheduling next track (no fade) in {user_interval_ms / 1000:.2f}s.")
+            return "next", user_interval_ms
+        if track_duration_ms > 0:
+            print(f"Player {player_index}: Playing full track (no fade). Setting end event.")
+            return "end_event", None
+        print(f"Player {player_index}: No duration, interval, or fade. Playing until stopped.")
+        return None, None
+    # Fade > 0 but duration too short
+    print(f"Player {player_index}: Track duration ({track_duration_ms}ms) too short for fade-out ({fade_ms}ms). Playing full track.")
+    return ("end_event", None) if track_duration_ms > 0 else (None, None)
+
+def schedule_transition(player_index, action, delay_ms):
+    """Arms the Tk timer or end event for a planned transition (see plan_next_transition), delay_ms from now."""
+    player_state = players[player_index]
+    channel = player_state["channel"]
+    player_state["playback_timer_id"] = None
+    channel.set_endevent()
+    if action == "fade":
+        player_state["playback_timer_id"] = root.after(delay_ms, lambda idx=player_index: initiate_fadeout_and_schedule_next(idx))
+    elif action == "next":
+        player_state["playback_timer_id"] = root.after(delay_ms, lambda idx=player_index: _play_next_after_fade(idx))
+    elif action == "end_event":
+        channel.set_endevent(PLAYER_END_EVENTS[player_index])
+
+# --- Helper: Engine Crossfades ---
+# With the NumPy engine a ready prefetch is armed on the player's channel, and the engine
+# starts it at the planned frame with an equal-power crossfade (or a gapless cut when there
+# is no fade). The Tk timer / end event then isn't needed; it remains the fallback when the
+# prefetch isn't decoded in time, and is restored if the armed crossfade is dropped.
+def arm_engine_crossfade(player_index):
+    """Arms the player's ready prefetch as an engine crossfade at the planned transition. Returns True if armed."""
+    player_state = players[player_index]
+    channel, prefetch = player_state["channel"], player_state["prefetch"]
+    if audio_engine != "numpy" or not player_state["is_playing"] or player_state["crossfade"] or not player_state["sound"]: return False
+    if not prefetch or prefetch["decoded"] is None or prefetch["context"] != get_prefetch_context(player_index): return False
+    if is_spent_stream(prefetch["decoded"]): return False # Another player started it; the transition decodes anew
+    action, delay_ms = player_state["transition"]
+    if action not in ("fade", "next", "end_event"): return False
+    fade_ms = player_state.get("fade_duration_ms", 0) if action == "fade" else 0
+    # Positions count frames of the playing track, so pauses don't shift the switch point
+    at_position = sys.maxsize if action == "end_event" else int(delay_ms * player_state["sound"].samplerate / 1000)
+    position = channel.get_position()
+    if position is None or at_position < position + mix_engine.DEFAULT_BLOCK_FRAMES: return False # Too close, leave it to the timer
+    if not channel.arm_crossfade(prefetch["decoded"]["sound"], at_position, fade_ms): return False
+    if player_state["playback_timer_id"]:
+        try: root.after_cancel(player_state["playback_timer_id"])
+        except tk.TclError: pass
+        player_state["playback_timer_id"] = None
+    channel.set_endevent() # The outgoing track's end is not a transition any more
+    player_state["crossfade"] = {"path": prefetch["path"], "action": action, "at_position": at_position}
+    print(f"Player {player_index}: Armed engine {'crossfade' if fade_ms else 'cut'} to '{os.path.basename(prefetch['path'])}'"
+          + (" at the end of the track." if action == "end_event" else f" at {delay_ms / 1000:.2f}s ({fade_ms}ms)."))
+    return True
+
+def disarm_engine_crossfade(player_index, reschedule=True):
+    """Drops the player's armed crossfade; with reschedule, the timer/end event takes over the transition again."""
+    player_state = players[player_index]
+    crossfade = player_state["crossfade"]
+    if not crossfade: return
+    player_state["crossfade"] = None
+    channel = player_state["channel"]
+    channel.cancel_crossfade()
+    if not reschedule: return
+    position = channel.get_position() or 0
+    remaining_ms = (crossfade["at_position"] - position) * 1000 // player_state["sound"].samplerate
+    schedule_transition(player_index, crossfade["action"], max(1, remaining_ms))
+    print(f"Player {player_index}: Disarmed engine crossfade, transition back on the timer.")
+
+def _on_engine_crossfade(player_index):
+    """Tk side of a crossfade the engine started: the prefetched track now plays, so update the player like a normal start."""
+    player_state = players[player_index]
+    crossfade, prefetch = player_state["crossfade"], player_state["prefetch"]
+    if not crossfade or not prefetch or prefetch["path"] != crossfade["path"]:
+        print(f"Player {player_index}: Ignoring stale engine crossfade."); return
+    player_state["crossfade"] = None
+    print(f"Player {player_index}: Engine crossfaded to '{os.path.basename(prefetch['path'])}'.")
+    if player_state["filepath"]: push_history(player_index, player_state["filepath"])
+    player_state["prefetch"] = None
+    claim_track(player_index, "playing", prefetch["path"])
+    claim_track(player_index, "prefetch", None)
+    player_state["total_paused_duration"] = 0.0
+    clear_waveform(player_index)
+    _start_decoded_track(player_index, prefetch["path"], prefetch["decoded"], already_playing=True)
+
 # --- Helper: Selects and plays next track after fade/end ---
-def _play_next_after_fade(player_index):
-     """Helper to select and play the next random track *after* a fadeout/end completes."""
+def _play_next_after_fade(player_index, overlap=False):
+     """Helper to select and play the next random track *after* a fadeout/end completes.
+
+     overlap: the outgoing track is still fading out on the spare channel (see fadeout_to_spare)."""
      player_state = players[player_index]
      print(f"Player {player_index}: Selecting next track after fade/end.")
 
@@ -1254,23 +2372,24 @@ def _play_next_after_fade(player_index):
          return
 
      # Add the track that just finished/faded out to history
-     current_file = player_state["filepath"]
-     if current_file and (not player_state["play_history"] or player_state["play_history"][-1] != current_file):
-          player_state["play_history"].append(current_file)
-
-     # Select next random track (same logic as before)
-     possible_tracks = list(player_state["audio_files"])
-     next_track = None
-     non_history_tracks = [t for t in possible_tracks if t not in player_state["play_history"]]
-     if non_history_tracks: next_track = random.choice(non_history_tracks)
-     elif possible_tracks: next_track = random.choice(possible_tracks)
-     else:
+     if player_state["filepath"]: push_history(player_index, player_state["filepath"])
+
+     # Use the prefetched track if it is still valid
+     prefetch = take_prefetch(player_index)
+     if prefetch:
+         print(f"Player {player_index}: Playing prefetched next: {os.path.basename(prefetch['path'])}")
+         _play_track(player_index, prefetch["path"], prefetch, overlap)
+         return
+
+     # Select next random track
+     next_track = pick_next_track(player_index)
+     if next_track is None:
          print(f"Player {player_index}: Error selecting next. Stopping.")
          stop_playback(player_index)
          return
 
      print(f"Player {player_index}: Playing next: {os.path.basename(next_track)}")
-     _play_track(player_index, next_track) # Play directly, _play_track handles fade-in
+     _play_track(player_index, next_track, overlap=overlap) # Play directly, _play_track handles fade-in
 
 # --- Callback: Initiates fade-out and schedules next track ---
 def initiate_fadeout_and_schedule_next(player_index):
@@ -1285,10 +2404,9 @@ def initiate_fadeout_and_schedule_next(player_index):
     # Check if still playing and channel is valid/busy
     if player_state["is_playing"] and channel and channel.get_busy():
         if fade_ms > 0:
-            print(f"Player {player_index}: Fading out ({fade_ms}ms)...")
-            channel.fadeout(fade_ms)
-            # Schedule the actual track selection *after* the fade completes
-            root.after(fade_ms + 50, lambda idx=player_index: _play_next_after_fade(idx))
+            print(f"Player {player_index}: Crossfading ({fade_ms}ms)...")
+            channel.fadeout_to_spare(fade_ms) # The next track fades in over the tail
+            _play_next_after_fade(player_index, overlap=True)
         else:
             # This case shouldn't happen if fade_ms was > 0 when timer was set,
             # but handle it defensively: stop and play next immediately.
@@ -1304,11 +2422,12 @@ def initiate_fadeout_and_schedule_next(player_index):
 
 
 
-# --- Inside _play_track function ---
-# --- Inside _play_track function ---
-# --- Inside _play_track function ---
-def _play_track(player_index, track_path):
-    """Internal: Loads, plays a specific track, handles fade-in, and schedules fade-out/next."""
+def _play_track(player_index, track_path, prefetch=None, overlap=False):
+    """Internal: Stops the current track and queues a background decode of the requested one.
+
+    Playback itself starts in _start_decoded_track once the decode pool hands back the sound.
+    If a prefetch (from take_prefetch) is given, its ready sound or in-flight decode is used instead.
+    overlap: the previous track is fading out on the spare channel and is left to finish."""
     player_state = players[player_index]
     channel = player_state["channel"]
     if not channel:
@@ -1316,128 +2435,126 @@ def _play_track(player_index, track_path):
 
     # --- Stop previous state ---
     print(f"Player {player_index}: Stopping previous state before playing '{os.path.basename(track_path)}'")
-    channel.stop(); channel.set_endevent()
+    if not overlap: channel.stop()
+    channel.set_endevent()
+    player_state["crossfade"] = None # channel.stop() dropped any armed engine crossfade (none is armed with overlap)
     if player_state["playback_timer_id"]:
         try: root.after_cancel(player_state["playback_timer_id"])
         except tk.TclError: pass
         player_state["playback_timer_id"] = None
         print(f"  Cancelled previous playback_timer_id.")
-    if player_state["progress_update_timer_id"]:
-        try: root.after_cancel(player_state["progress_update_timer_id"])
-        except tk.TclError: pass
-        player_state["progress_update_timer_id"] = None
-        print(f"  Cancelled previous progress_update_timer_id.")
     player_state["is_paused"] = False; player_state["total_paused_duration"] = 0.0
     clear_waveform(player_index)
     # --- End stop previous state ---
 
     print(f"Player {player_index}: Attempting to play: {track_path}")
+    claim_track(player_index, "playing", track_path) # Loading counts as playing for the other players' picks
+    player_state["loading_header"] = None
+    # The header probe runs in the decode worker and comes back before the audio (see apply_track_header)
+
+    if prefetch and prefetch["decoded"] is not None and not is_spent_stream(prefetch["decoded"]):
+        # Already decoded in the background - start immediately
+        cancel_pending_decode(player_index)
+        _start_decoded_track(player_index, track_path, prefetch["decoded"])
+        return
+    player_state["gui"]["status_label"].config(text=f"Loading: {os.path.basename(track_path)}")
+    if prefetch and prefetch["future"] is not None:
+        # Prefetch still decoding - adopt its job instead of decoding the file again
+        cancel_pending_decode(player_index)
+        player_state["decode_job_id"] = prefetch["job_id"]
+        player_state["decode_future"] = prefetch["future"]
+        print(f"Player {player_index}: Waiting for prefetch decode job {prefetch['job_id']}.")
+    else:
+        submit_decode(player_index, track_path, get_decode_window(player_index)) # Supersedes any decode still pending for this player
+    update_button_states(player_index)
+
+
+def _start_decoded_track(player_index, track_path, decoded, error=None, already_playing=False):
+    """Internal: Plays a track once its decode finished, handles fade-in, and schedules fade-out/next.
+
+    already_playing: the mix engine already started it (crossfade), only the player state is updated."""
+    player_state = players[player_index]
+    channel = player_state["channel"]
+
+    if not player_state["is_playing"]:
+        print(f"Player {player_index}: Decode finished but player stopped. Not starting '{os.path.basename(track_path)}'.")
+        return
+    if not channel:
+        print(f"Player {player_index}: Error - Channel not available."); stop_playback(player_index); return
+
     try:
-        # --- Load sound using soundfile (convert to int16) and get accurate duration --- <<< MODIFIED BLOCK
-        print(f"  Player {player_index}: Loading with soundfile (dtype='int16')...")
-        try:
-            # Read as int16, ensure 2D array for sndarray
-            audio_data, samplerate = sf.read(track_path, dtype='int16', always_2d=True)
-            track_duration_s = len(audio_data) / samplerate
-            player_state["current_track_duration_s"] = track_duration_s # Store accurate duration now
-            track_duration_ms = int(track_duration_s * 1000) if track_duration_s > 0 else 0
-            print(f"  Player {player_index}: Loaded via soundfile. Rate={samplerate}Hz, Duration={track_duration_s:.2f}s, Shape={audio_data.shape}")
-
-            # Check if mixer sample rate matches (Pygame often uses 44100 or 22050)
-            mixer_freq, mixer_format, mixer_channels = pygame.mixer.get_init()
-            if samplerate != mixer_freq:
-                # This is a bigger issue - ideally, Pygame mixer should be initialized
-                # at a common rate, or resampling would be needed here (complex).
-                # For now, just warn. Playback might be speed-shifted.
-                print(f"  Player {player_index}: WARNING - Track sample rate ({samplerate}Hz) differs from mixer ({mixer_freq}Hz). Playback speed may be incorrect.")
-                # If this becomes a common problem, resampling audio_data here before make_sound
-                # using librosa.resample would be the proper fix.
-
-            # Create Pygame sound object from the NumPy array
-            print(f"  Player {player_index}: Creating sound object using pygame.sndarray.make_sound...")
-            new_sound = pygame.sndarray.make_sound(audio_data)
-            print(f"  Player {player_index}: Sound object created successfully.")
-
-        except Exception as sf_err:
-            # Handle errors during soundfile read or make_sound
-            print(f"  Player {player_index}: Error loading/converting audio with soundfile/sndarray: {sf_err}")
-            raise sf_err # Re-raise to be caught by the outer try/except
-
-        # --- End Sound Loading Block ---
+        if error is not None:
+            # Handle errors during soundfile read or make_sound in the worker
+            print(f"  Player {player_index}: Error loading/converting audio with soundfile/sndarray: {error}")
+            skip_unreadable_track(player_index, track_path, error) # Quarantine it and move on, no dialog
+            return
+
+        new_sound = decoded["sound"]
+        samplerate = decoded["samplerate"]
+        track_duration_s = decoded["duration_s"] # From the header probe (and decode window), not the decoded buffer
+        player_state["current_track_duration_s"] = track_duration_s
+        track_duration_ms = int(track_duration_s * 1000) if track_duration_s > 0 else 0
+        print(f"  Player {player_index}: {'Streaming from disk' if decoded['streamed'] else 'Served from PCM cache' if decoded['from_cache'] else 'Decoded in background'}. Rate={samplerate}Hz, Duration={track_duration_s:.2f}s, Shape={decoded['shape']}"
+              + ("" if decoded["window_start_s"] is None else f", window from {decoded['window_start_s']:.2f}s"))
+        header = player_state["loading_header"]
+        player_state["loading_header"] = None
+        if not header or header[0] != track_path: # Prefetched or shared decode: no header was seen while loading
+            header = None
+            report_samplerate_mismatch(player_index, decoded["probe"])
 
         player_state["sound"] = new_sound
         player_state["filepath"] = track_path
-        player_state["gui"]["status_label"].config(text=f"Playing: {os.path.basename(track_path)}")
+        track_selection.set_current(player_state["track_bag"], track_path) # Not picked again while it plays
+        note_track_played(player_index, track_path)
+        status_text = f"Playing: {os.path.basename(track_path)}"
+        if decoded["window_start_s"]: status_text += f" (from {format_duration(decoded['window_start_s'])})"
+        player_state["gui"]["status_label"].config(text=status_text)
 
-        # Get current settings (fade, loop, interval)
+        # Get current settings (fade, loop)
         is_currently_looping = player_state["is_looping"]
         fade_ms = player_state.get("fade_duration_ms", 0)
-        user_interval_ms = get_interval_ms(player_index)
-
-        print(f"Player {player_index}: Settings: loop={is_currently_looping}, fade={fade_ms}ms, interval={user_interval_ms}ms, duration={track_duration_ms}ms")
 
         # --- Play the sound with Fade-In ---
         play_args = {}
         if is_currently_looping: play_args["loops"] = -1
-        if fade_ms > 0: play_args["fade_ms"] = fade_ms; print(f"Player {player_index}: Playing with {fade_ms}ms fade-in.")
+        if fade_ms > 0: play_args["fade_ms"] = fade_ms
 
-        channel.play(new_sound, **play_args) # <<< PLAY AUDIO NOW
+        elapsed_s = 0.0
+        if already_playing: # Started by the engine at the crossfade frame, possibly a UI tick ago
+            elapsed_s = (channel.get_position() or 0) / samplerate
+        else:
+            if fade_ms > 0: print(f"Player {player_index}: Playing with {fade_ms}ms fade-in.")
+            channel.play(new_sound, **play_args) # <<< PLAY AUDIO NOW
         player_state["is_playing"] = True
-        player_state["playback_start_time"] = time.monotonic()
+        player_state["playback_start_time"] = time.monotonic() - elapsed_s
         update_channel_audio_settings(player_index) # Apply volume/pan immediately
+        player_state["decode_failures"] = 0
+        wake_ui_scheduler() # Progress and end events for this player
 
-        # --- Schedule Waveform Generation AFTER starting playback ---
-        # (Waveform function still reads the file itself to get float32 data)
-        print(f"Player {player_index}: Scheduling waveform load/draw.")
-        root.after(10, lambda p_idx=player_index, t_path=track_path: load_and_draw_waveform_async(p_idx, t_path))
+        # --- Draw Waveform from the peaks the decode worker computed (no second file read) ---
+        draw_waveform_from_pyramid(player_index, track_path, decoded["waveform_pyramid"])
+        if decoded["streamed"] and decoded["waveform_pyramid"] is None: request_stream_peaks(player_index, track_path)
 
         # --- Scheduling Logic for Next Track (Only if NOT looping) ---
-        # (This logic remains the same, using the accurate duration obtained from soundfile)
-        if not is_currently_looping:
-             if fade_ms > 0 and track_duration_ms > fade_ms:
-                natural_end_fade_start_time_ms = max(1, track_duration_ms - fade_ms)
-                fade_trigger_time_ms = natural_end_fade_start_time_ms
-                if user_interval_ms is not None and user_interval_ms < natural_end_fade_start_time_ms:
-                    fade_trigger_time_ms = user_interval_ms
-                    print(f"Player {player_index}: User interval ({user_interval_ms}ms) is earlier than natural fade start.")
-                print(f"Player {player_index}: Scheduling fade-out initiation in {fade_trigger_time_ms / 1000:.2f}s.")
-                timer_id = root.after(fade_trigger_time_ms, lambda idx=player_index: initiate_fadeout_and_schedule_next(idx))
-                player_state["playback_timer_id"] = timer_id
-                channel.set_endevent()
-             elif fade_ms == 0:
-                if user_interval_ms is not None:
-                    print(f"Player {player_index}: Scheduling next track (no fade) in {user_interval_ms / 1000:.2f}s.")
-                    timer_id = root.after(user_interval_ms, lambda idx=player_index: _play_next_after_fade(idx))
-                    player_state["playback_timer_id"] = timer_id
-                    channel.set_endevent()
-                elif track_duration_ms > 0:
-                    print(f"Player {player_index}: Playing full track (no fade). Setting end event.")
-                    channel.set_endevent(PLAYER_END_EVENTS[player_index])
-                    player_state["playback_timer_id"] = None
-                else:
-                     print(f"Player {player_index}: No duration, interval, or fade. Playing until stopped.")
-                     player_state["playback_timer_id"] = None
-                     channel.set_endevent()
-             else: # Fade > 0 but duration too short
-                 print(f"Player {player_index}: Track duration ({track_duration_ms}ms) too short for fade-out ({fade_ms}ms). Playing full track.")
-                 if track_duration_ms > 0: channel.set_endevent(PLAYER_END_EVENTS[player_index])
-                 else: channel.set_endevent()
-                 player_state["playback_timer_id"] = None
-        else: # Looping
-            print(f"Player {player_index}: Looping enabled, no automatic transition scheduled.")
-            player_state["playback_timer_id"] = None
-            channel.set_endevent()
+        if header and header[1] == get_transition_settings(player_index): action, delay_ms = header[2] # Planned from the header
+        else: action, delay_ms = plan_next_transition(player_index, track_duration_ms)
+        player_state["transition"] = (action, delay_ms)
+        schedule_transition(player_index, action, None if delay_ms is None else max(1, delay_ms - int(elapsed_s * 1000)))
 
-        # Progress timer is started by load_and_draw_waveform_async
+        # Progress is drawn by ui_tick, woken by wake_ui_scheduler above
         print(f"Player {player_index}: Playback started successfully.")
 
+        # --- Pick and decode the following track while this one plays ---
+        if not is_currently_looping: start_prefetch(player_index)
+        else: discard_prefetch(player_index, "looping")
+
     # --- Outer Error Handling ---
     except pygame.error as e: # Catch Pygame errors (e.g., from channel.play)
         messagebox.showerror("Playback Error", f"Player {player_index}: Pygame error during playback setup:\n{os.path.basename(track_path)}\nError: {e}")
         player_state["sound"] = None; player_state["filepath"] = None; player_state["is_playing"] = False
         player_state["gui"]["status_label"].config(text="Playback Error.")
         clear_waveform(player_index)
-    except Exception as e: # Catch other errors (e.g., from soundfile read)
+    except Exception as e: # Catch other errors
          messagebox.showerror("File Error", f"Player {player_index}: Could not process file:\n{os.path.basename(track_path)}\nError: {e}")
          player_state["sound"] = None; player_state["filepath"] = None; player_state["is_playing"] = False
          player_state["gui"]["status_label"].config(text="File Error.")
@@ -1446,82 +2563,22 @@ def _play_track(player_index, track_path):
     update_button_states(player_index)
 
 
-# --- NEW Helper function to load/draw waveform asynchronously ---
-def load_and_draw_waveform_async(player_index, track_path):
-    """Loads audio data, processes, draws waveform, and starts progress updates. Called via root.after."""
+# --- Helper: draws the waveform from the peak pyramid computed by the decode worker ---
+def draw_waveform_from_pyramid(player_index, track_path, pyramid):
+    """Stores the track's peak pyramid and draws the static waveform; ui_tick draws the progress over it."""
     player_state = players[player_index]
     canvas = player_state["gui"]["waveform_canvas"]
 
     # Check if the track currently playing is still the one we intended to draw
     if not player_state["is_playing"] or player_state["filepath"] != track_path:
-        print(f"Player {player_index}: Skipping async waveform draw (track changed or stopped).")
+        print(f"Player {player_index}: Skipping waveform draw (track changed or stopped).")
         return
 
     if not canvas: return # No canvas
 
-    print(f"Player {player_index}: Async waveform: Starting load/process for {os.path.basename(track_path)}")
-    try:
-        # --- Perform the potentially slow operations ---
-        data, samplerate = sf.read(track_path, dtype='float32')
-        # Use the more accurate duration from sf.read now
-        accurate_duration_s = len(data) / samplerate
-        player_state["current_track_duration_s"] = accurate_duration_s # Update duration
-        print(f"Player {player_index}: Async waveform: Accurate Duration: {accurate_duration_s:.2f}s, Rate: {samplerate}Hz")
-
-        if data.ndim > 1: data = data.mean(axis=1) # Make mono
-
-        samples_per_pixel = math.ceil(len(data) / WAVEFORM_WIDTH)
-        if samples_per_pixel <= 0: samples_per_pixel = 1
-
-        num_segments = WAVEFORM_WIDTH
-        processed_data = []
-        for i in range(num_segments):
-            start = i * samples_per_pixel
-            end = min((i + 1) * samples_per_pixel, len(data))
-            if start >= end:
-                processed_data.append(processed_data[-1] if processed_data else 0)
-                continue
-            segment = data[start:end]
-            processed_data.append(np.max(np.abs(segment))) # Peak amplitude
-
-        max_amp = max(processed_data) if processed_data else 1.0
-        if max_amp == 0: max_amp = 1.0
-
-        # Store normalized data (0 to 1)
-        player_state["waveform_data"] = [amp / max_amp for amp in processed_data]
-        # --- End slow operations ---
-
-        # --- Drawing Background Waveform (on the main thread via canvas) ---
-        canvas.delete("waveform_bg") # Clear any previous "unavailable" message
-        center_y = WAVEFORM_HEIGHT / 2
-        half_height = WAVEFORM_HEIGHT / 2
-        for i, normalized_amp in enumerate(player_state["waveform_data"]):
-            x = i
-            line_height = max(1, normalized_amp * half_height)
-            y1 = center_y - line_height
-            y2 = center_y + line_height
-            canvas.create_line(x, y1, x, y2, fill="grey50", width=1, tags="waveform_bg")
-        print(f"Player {player_index}: Async waveform: Drawing complete.")
-
-        # --- Start Progress Visualization NOW that waveform data exists ---
-        if accurate_duration_s > 0:
-            # Cancel any lingering progress timer just in case
-            if player_state["progress_update_timer_id"]:
-                try: root.after_cancel(player_state["progress_update_timer_id"])
-                except tk.TclError: pass
-            player_state["progress_update_timer_id"] = root.after(PROGRESS_UPDATE_MS, lambda idx=player_index: update_waveform_progress(idx))
-            print(f"Player {player_index}: Async waveform: Started progress updates.")
-        # --- End Start Progress ---
-
-    except Exception as e:
-        print(f"Player {player_index}: Async waveform: Error processing: {e}")
-        player_state["waveform_data"] = None
-        # Don't reset duration here, keep the approximate one from get_length if possible
-        # player_state["current_track_duration_s"] = 0.0
-        if canvas:
-             canvas.delete("waveform_bg") # Clear potential partial drawing
-             canvas.create_text(WAVEFORM_WIDTH / 2, WAVEFORM_HEIGHT / 2,
-                                text="Waveform unavailable", fill="grey", tags="waveform_bg")
+    player_state["waveform_pyramid"] = pyramid
+    player_state["waveform_view"] = None
+    redraw_waveform(player_index) # Progress is drawn by the next UI tick
 
 
 def play_next_random_track(player_index):
@@ -1537,16 +2594,15 @@ def play_next_random_track(player_index):
     if not player_state["is_playing"]: print(f"Player {player_index}: Play next called but not playing."); stop_playback(player_index); return
     if not player_state["audio_files"]: print(f"Player {player_index}: No files."); stop_playback(player_index); messagebox.showwarning("No Files", f"Player {player_index}: No audio files."); return
 
-    current_file = player_state["filepath"]
-    if current_file and (not player_state["play_history"] or player_state["play_history"][-1] != current_file):
-         player_state["play_history"].append(current_file)
+    if player_state["filepath"]: push_history(player_index, player_state["filepath"])
+
+    prefetch = take_prefetch(player_index)
+    if prefetch:
+        print(f"Player {player_index}: Selected prefetched next: {os.path.basename(prefetch['path'])}")
+        _play_track(player_index, prefetch["path"], prefetch); return
 
-    possible_tracks = list(player_state["audio_files"])
-    next_track = None
-    non_history_tracks = [t for t in possible_tracks if t not in player_state["play_history"]]
-    if non_history_tracks: next_track = random.choice(non_history_tracks)
-    elif possible_tracks: next_track = random.choice(possible_tracks)
-    else: print(f"Player {player_index}: Error selecting next. Stopping."); stop_playback(player_index); return
+    next_track = pick_next_track(player_index)
+    if next_track is None: print(f"Player {player_index}: Error selecting next. Stopping."); stop_playback(player_index); return
 
     print(f"Player {player_index}: Selected next: {os.path.basename(next_track)}")
     _play_track(player_index, next_track)
@@ -1624,7 +2680,7 @@ def play_previous_track(player_index):
     if len(player_state["play_history"]) < 1: print(f"Player {player_index}: No history."); return
 
     # Get previous track path *before* fading
-    previous_track_path = player_state["play_history"].pop() # Pop it now
+    previous_track_path = pop_history(player_index) # Pop it now
 
     # --- Cancel any scheduled automatic transition ---
     if player_state["playback_timer_id"]:
@@ -1635,10 +2691,9 @@ def play_previous_track(player_index):
 
     # --- Fadeout Logic ---
     if channel and channel.get_busy() and fade_ms > 0:
-        print(f"Player {player_index}: Fading out ({fade_ms}ms) for previous track.")
-        channel.fadeout(fade_ms)
-        # Schedule playing the previous track *after* the fade
-        root.after(fade_ms + 50, lambda idx=player_index, path=previous_track_path: _play_track(idx, path))
+        print(f"Player {player_index}: Crossfading ({fade_ms}ms) to the previous track.")
+        channel.fadeout_to_spare(fade_ms) # The previous track fades in over the tail
+        _play_track(player_index, previous_track_path, overlap=True)
     else:
         # No fade or channel not busy, play immediately
         print(f"Player {player_index}: No fade, playing previous track immediately.")
@@ -1689,10 +2744,12 @@ def stop_playback(player_index):
     player_state["is_playing"] = False; player_state["is_paused"] = False; player_state["is_looping"] = False
 
     if player_state["playback_timer_id"]: root.after_cancel(player_state["playback_timer_id"]); player_state["playback_timer_id"] = None
-    # <<< Cancel progress timer on stop >>>
-    if player_state["progress_update_timer_id"]: root.after_cancel(player_state["progress_update_timer_id"]); player_state["progress_update_timer_id"] = None
+    cancel_pending_decode(player_index) # Don't start a track that is still decoding
+    discard_prefetch(player_index, "stopped")
+    claim_track(player_index, "playing", None)
 
     if channel: print(f"Player {player_index}: Stopping channel."); channel.stop(); channel.set_endevent()
+    player_state["crossfade"] = None
     if was_playing: player_state["gui"]["status_label"].config(text=f"Stopped: {os.path.basename(player_state['filepath'] or 'N/A')}")
 
     clear_waveform(player_index) # <<< Clear waveform on stop
@@ -1759,30 +2816,35 @@ def handle_player_end(player_index):
         print(f"Player {player_index}: End event received but not in playing state. Updating buttons.")
         update_button_states(player_index)
 
+def _on_player_end_event(i):
+    """Handles one player's end event, ignoring stale ones."""
+    print(f"Player {i}: Received END event ({PLAYER_END_EVENTS[i]})")
+    player_state = players[i]; channel = player_state["channel"]
+    is_busy = False
+    try:
+        if channel: is_busy = channel.get_busy()
+        print(f"  Player {i}: Channel busy status on event: {is_busy}")
+    except pygame.error as busy_e: print(f"  Warning: Error checking busy status for Player {i}: {busy_e}"); return
+    if player_state["is_playing"] and not is_busy: handle_player_end(i)
+    elif player_state["is_playing"] and is_busy: print(f"  Player {i}: Ignoring END event (channel busy - likely stale).")
+    elif not player_state["is_playing"]: print(f"  Player {i}: Ignoring END event (player not playing).")
+
 def check_pygame_events():
-    """Periodically check for Pygame events."""
-    if not root.winfo_exists(): return
+    """Handles pending Pygame events and mix engine voice ends (player end events). Called from ui_tick."""
+    if not mixer_initialized: return
+    if audio_engine == "numpy":
+        for i in mix_engine.poll_crossfades(): _on_engine_crossfade(i) # Channel index = player index
+        for i in mix_engine.poll_ended_channels():
+            if players[i]["channel"].get_endevent() is not None: _on_player_end_event(i)
     try:
         for event in pygame.event.get():
             for i in range(MAX_PLAYERS):
                 if event.type == PLAYER_END_EVENTS[i]:
-                    print(f"Player {i}: Received END event ({PLAYER_END_EVENTS[i]})")
-                    player_state = players[i]; channel = player_state["channel"]
-                    is_busy = False
-                    try:
-                        if channel: is_busy = channel.get_busy()
-                        print(f"  Player {i}: Channel busy status on event: {is_busy}")
-                    except pygame.error as busy_e: print(f"  Warning: Error checking busy status for Player {i}: {busy_e}"); continue
-                    if player_state["is_playing"] and not is_busy: handle_player_end(i)
-                    elif player_state["is_playing"] and is_busy: print(f"  Player {i}: Ignoring END event (channel busy - likely stale).")
-                    elif not player_state["is_playing"]: print(f"  Player {i}: Ignoring END event (player not playing).")
+                    _on_player_end_event(i)
                     break
     except pygame.error as e:
         if "mixer system not initialized" not in str(e): print(f"Pygame error during event check: {e}")
     except Exception as e: print(f"Unexpected error during event check: {e}")
-    try:
-        if root.winfo_exists(): root.after(EVENT_CHECK_MS, check_pygame_events)
-    except tk.TclError: print("Event check scheduling stopped: Tkinter root destroyed.")
 
 # --- Reveal File Function ---
 def reveal_current_track(player_index):
@@ -2443,6 +3505,11 @@ for i in range(MAX_PLAYERS):
     waveform_canvas = tk.Canvas(player_frame, width=WAVEFORM_WIDTH, height=WAVEFORM_HEIGHT, bg="black", highlightthickness=0)
     waveform_canvas.pack(pady=5, fill=tk.X, padx=5)
     player_state["gui"]["waveform_canvas"] = waveform_canvas # Store reference
+    waveform_canvas.bind("<Configure>", lambda event, idx=i: on_waveform_resize(idx, event))
+    waveform_canvas.bind("<MouseWheel>", lambda event, idx=i: on_waveform_zoom(idx, event)) # Windows/macOS
+    waveform_canvas.bind("<Button-4>", lambda event, idx=i: on_waveform_zoom(idx, event)) # Linux wheel up
+    waveform_canvas.bind("<Button-5>", lambda event, idx=i: on_waveform_zoom(idx, event)) # Linux wheel down
+    waveform_canvas.bind("<Double-Button-1>", lambda event, idx=i: reset_waveform_zoom(idx, event))
     # --- End Waveform Canvas ---
 
     # --- Inside the player GUI loop ---
@@ -2533,10 +3600,10 @@ def stop_and_clear_player(player_index):
 
     # 2. Clear core state variables not handled by stop_playback
     player_state["selected_folder"] = None
-    player_state["audio_files"] = []
     player_state["filepath"] = None
     player_state["sound"] = None
-    player_state["play_history"].clear()
+    clear_history(player_index)
+    set_player_tracks(player_index, [])
     # waveform_data and current_track_duration_s are cleared by clear_waveform
 
     # 3. Reset GUI elements not fully handled by update_button_states/clear_waveform
@@ -2574,10 +3641,10 @@ def stop_and_clear_all():
 
         # 2. Clear core state variables not handled by stop_playback
         player_state["selected_folder"] = None
-        player_state["audio_files"] = []
         player_state["filepath"] = None
         player_state["sound"] = None
-        player_state["play_history"].clear()
+        clear_history(i)
+        set_player_tracks(i, [])
         # waveform_data and current_track_duration_s are cleared by clear_waveform called within stop_playback
 
         # 3. Reset GUI elements not fully handled by update_button_states/clear_waveform
@@ -2794,7 +3861,7 @@ def load_random_presets_all():
         try:
             # ... (rest of the preset loading logic for player i remains the same) ...
              if not preset_names: break
-             chosen_preset_name = random.choice(preset_names)
+             chosen_preset_name = preset_rng.choice(preset_names)
              preset_data = folder_presets.get(chosen_preset_name)
              if not preset_data or not isinstance(preset_data, dict):
                  print(f"  Error: Invalid data for preset '{chosen_preset_name}'. Skipping Player {i+1}.")
@@ -2847,6 +3914,9 @@ tk.Label(global_controls_frame, text="Global Controls", font=('Helvetica', 10, '
 global_button_subframe = tk.Frame(global_controls_frame)
 global_button_subframe.pack(pady=5)
 
+library_status_label = tk.Label(global_controls_frame, text="", anchor='w', fg="grey") # Background library scan/probe progress
+library_status_label.pack(fill=tk.X, padx=10)
+
 # --- NEW: Recording Controls ---
 # <<< Pack below the players_area_frame, above global controls using side=tk.BOTTOM >>>
 recording_frame = tk.Frame(root, relief=tk.RAISED, borderwidth=1)
@@ -2938,8 +4008,11 @@ root.after_idle(center_window)
 update_all_button_states()
 
 # --- Start Event Checking ---
-if mixer_initialized: print("Starting Pygame event checking loop..."); root.after(EVENT_CHECK_MS, check_pygame_events)
-else: messagebox.showwarning("Mixer Not Ready", "Audio mixer failed to initialize. Event checking disabled.")
+if not mixer_initialized: messagebox.showwarning("Mixer Not Ready", "Audio mixer failed to initialize. Event checking disabled.")
+print("Starting UI refresh scheduler...")
+wake_ui_scheduler() # Pygame events, decode results and progress all run from ui_tick
+schedule_preset_rescan() # Index every preset folder in the background so shuffling is a memory lookup
+root.after(WATCH_POLL_MS, schedule_folder_watch) # Pick up files added to/removed from loaded folders
 
 # --- Window Closing Protocol ---
 root.protocol("WM_DELETE_WINDOW", on_closing)
@@ -0,0 +1,40 @@
+# tests/test_decoding.py
+# Decode error classification and channel matching for the pygame engine.
+# Run from the repository root: python -m pytest -q tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import decoding
+
+def test_mono_track_is_upmixed_for_a_stereo_mixer(tmp_path):
+    path = str(tmp_path / "mono.wav")
+    sf.write(path, (np.sin(np.arange(4410) / 10) * 0.5).astype(np.float32), 44100, subtype="PCM_16")
+    audio_data, samplerate, _ = decoding.read_track_int16(path)
+    assert audio_data.shape == (4410, 1) and samplerate == 44100
+
+    stereo = decoding.match_channels(audio_data, 2)
+    assert stereo.shape == (4410, 2)
+    assert np.array_equal(stereo[:, 0], audio_data[:, 0]) and np.array_equal(stereo[:, 1], audio_data[:, 0])
+    assert decoding.match_channels(stereo, 2) is stereo # Already matching, no copy
+
+def test_playback_value_error_is_not_persistent():
+    # What pygame.sndarray.make_sound raises for a mono array on a stereo mixer
+    assert not decoding.is_persistent_decode_error(ValueError("Array depth must match number of mixer channels"))
+
+def test_empty_track_is_persistent(tmp_path):
+    path = str(tmp_path / "empty.wav")
+    sf.write(path, np.zeros((0, 2), dtype=np.int16), 44100)
+    with pytest.raises(decoding.UndecodableTrackError) as excinfo:
+        decoding.read_track_int16(path)
+    assert decoding.is_persistent_decode_error(excinfo.value)
+
+def test_missing_file_is_not_persistent(tmp_path):
+    with pytest.raises(Exception) as excinfo:
+        sf.read(str(tmp_path / "missing.wav"))
+    assert not decoding.is_persistent_decode_error(excinfo.value)
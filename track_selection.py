@@ -0,0 +1,218 @@
+# track_selection.py
+# Random track selection without repeats from the recent history, in O(1) per pick.
+#
+# A player's "bag" keeps its tracks in a single list split into two regions: tracks that
+# may be picked sit in front of bag["available"], recently played ("blocked") ones behind
+# it. A pick is one random index; blocking, unblocking, adding or removing a track is a
+# swap, so nothing is copied or scanned per switch, whatever the folder size.
+#
+# Optionally the bag is weighted: a Fenwick (binary indexed) tree over the list slots holds
+# each track's weight, so a weighted pick and a weight change are O(log n). Swaps move the
+# weights with the tracks, and since blocked tracks sit behind the pickable region, a pick
+# only has to search the prefix sum of that region.
+
+import random
+import time
+
+# --- Constants ---
+DEFAULT_WEIGHT = 1.0 # Weight of a track with no information (weighted bags only)
+WEIGHTING_MODES = ("uniform", "duration", "least_recent")
+DURATION_WEIGHT_RANGE_S = (5.0, 900.0) # "duration" mode: durations are clamped to this range (unknown = 60 s)
+LEAST_RECENT_MAX_DAYS = 7.0 # "least_recent" mode: weight grows by 1 per day since last played, up to this
+
+# --- Bag Construction ---
+
+def new_bag(tracks=(), weights=None):
+    """Returns a bag holding the given tracks, with nothing blocked.
+
+    weights (track -> weight, missing = DEFAULT_WEIGHT) makes it a weighted bag; None picks uniformly."""
+    bag = {
+        "tracks": [], # All tracks; [0:available] may be picked, the rest are blocked
+        "positions": {}, # Track -> index in tracks
+        "available": 0, # Number of pickable tracks at the front of the list
+        "blocked": {}, # Track -> block count (it can be in the history more than once)
+        "current": None, # Track currently playing (blocked while it plays)
+        "weights": None, # Weighted bags: track -> weight
+        "tree": None, # Weighted bags: Fenwick tree over slots of tracks (1-based, tree[0] unused)
+    }
+    if weights is not None:
+        bag["weights"] = {}
+        bag["tree"] = [0.0]
+    add_tracks(bag, tracks, weights)
+    return bag
+
+# --- Fenwick Tree (weighted bags) ---
+
+def _tree_add(tree, slot, delta):
+    """Adds delta to the weight of a 0-based slot."""
+    i = slot + 1
+    while i < len(tree):
+        tree[i] += delta
+        i += i & -i
+
+def _tree_prefix(tree, count):
+    """Sum of the weights of the first count slots."""
+    total = 0.0
+    i = count
+    while i > 0:
+        total += tree[i]
+        i -= i & -i
+    return total
+
+def _tree_append(tree, weight):
+    """Adds a slot at the end holding weight."""
+    i = len(tree)
+    tree.append(weight + _tree_prefix(tree, i - 1) - _tree_prefix(tree, i - (i & -i)))
+
+def _tree_find(tree, target):
+    """Returns the 0-based slot where the running weight sum first exceeds target."""
+    slot, step = 0, 1 << (len(tree) - 1).bit_length()
+    while step:
+        nxt = slot + step
+        if nxt < len(tree) and tree[nxt] <= target:
+            slot = nxt
+            target -= tree[nxt]
+        step >>= 1
+    return min(slot, len(tree) - 2) # Guards against float rounding at the very end
+
+def _swap(bag, i, j):
+    """Swaps two list slots and keeps the position map in step."""
+    if i == j: return
+    tracks, positions = bag["tracks"], bag["positions"]
+    tracks[i], tracks[j] = tracks[j], tracks[i]
+    positions[tracks[i]] = i
+    positions[tracks[j]] = j
+    if bag["tree"] is not None: # Weights move with their tracks
+        delta = bag["weights"][tracks[i]] - bag["weights"][tracks[j]]
+        _tree_add(bag["tree"], i, delta)
+        _tree_add(bag["tree"], j, -delta)
+
+# --- Track Set Changes ---
+
+def add_tracks(bag, paths, weights=None):
+    """Adds tracks (already known ones are ignored). Tracks that are currently blocked stay unpickable.
+
+    weights (track -> weight) is used by weighted bags; missing tracks get DEFAULT_WEIGHT."""
+    tracks, positions = bag["tracks"], bag["positions"]
+    for path in paths:
+        if path in positions: continue
+        positions[path] = len(tracks)
+        tracks.append(path)
+        if bag["tree"] is not None:
+            weight = max(0.0, float(weights.get(path, DEFAULT_WEIGHT) if weights else DEFAULT_WEIGHT))
+            bag["weights"][path] = weight
+            _tree_append(bag["tree"], weight)
+        if path not in bag["blocked"]: # Move it into the pickable region
+            _swap(bag, positions[path], bag["available"])
+            bag["available"] += 1
+
+def remove_tracks(bag, paths):
+    """Removes tracks (unknown ones are ignored). Their history blocks are kept in case they come back."""
+    tracks, positions = bag["tracks"], bag["positions"]
+    for path in paths:
+        index = positions.get(path)
+        if index is None: continue
+        if index < bag["available"]: # Keep the pickable region contiguous
+            _swap(bag, index, bag["available"] - 1)
+            bag["available"] -= 1
+            index = bag["available"]
+        _swap(bag, index, len(tracks) - 1)
+        tracks.pop()
+        del positions[path]
+        if bag["tree"] is not None: # The last Fenwick node covers no other slot, so it can simply go
+            bag["tree"].pop()
+            del bag["weights"][path]
+
+def contains(bag, path):
+    """True if the track is in the bag."""
+    return path in bag["positions"]
+
+def size(bag):
+    """Number of tracks in the bag."""
+    return len(bag["tracks"])
+
+def set_weight(bag, path, weight):
+    """Changes one track's weight in a weighted bag (O(log n)). Ignored for uniform bags and unknown tracks."""
+    index = bag["positions"].get(path)
+    if bag["tree"] is None or index is None: return
+    weight = max(0.0, float(weight))
+    _tree_add(bag["tree"], index, weight - bag["weights"][path])
+    bag["weights"][path] = weight
+
+def compute_weight(mode, duration_s=None, last_played_at=None, now=None):
+    """Selection weight of a track for a weighting mode ("uniform" always gives DEFAULT_WEIGHT).
+
+    "duration": proportional to the track length (clamped), so long pieces come up more often.
+    "least_recent": 1 + days since the track was last played (capped), never played = the cap."""
+    if mode == "duration":
+        low, high = DURATION_WEIGHT_RANGE_S
+        return min(high, max(low, duration_s if duration_s else 60.0)) / 60.0
+    if mode == "least_recent":
+        if last_played_at is None: return 1.0 + LEAST_RECENT_MAX_DAYS
+        age_days = ((now if now is not None else time.time()) - last_played_at) / 86400.0
+        return 1.0 + min(LEAST_RECENT_MAX_DAYS, max(0.0, age_days))
+    return DEFAULT_WEIGHT
+
+# --- History Blocks ---
+
+def block(bag, path):
+    """Marks a track as recently played, so it is not picked while any block on it remains."""
+    count = bag["blocked"].get(path, 0) + 1
+    bag["blocked"][path] = count
+    index = bag["positions"].get(path)
+    if count == 1 and index is not None and index < bag["available"]:
+        _swap(bag, index, bag["available"] - 1)
+        bag["available"] -= 1
+
+def unblock(bag, path):
+    """Releases one block on a track; it becomes pickable again when no blocks remain."""
+    count = bag["blocked"].get(path, 0) - 1
+    if count > 0:
+        bag["blocked"][path] = count
+        return
+    bag["blocked"].pop(path, None)
+    index = bag["positions"].get(path)
+    if index is not None and index >= bag["available"]:
+        _swap(bag, index, bag["available"])
+        bag["available"] += 1
+
+def set_current(bag, path):
+    """Records the track now playing: it is blocked while it plays, the previous one is released."""
+    if bag["current"] == path: return
+    if bag["current"] is not None: unblock(bag, bag["current"])
+    bag["current"] = path
+    if path is not None: block(bag, path)
+
+def clear_blocks(bag):
+    """Forgets all history blocks (the current track stays blocked)."""
+    bag["blocked"].clear()
+    bag["available"] = len(bag["tracks"])
+    current = bag["current"]
+    bag["current"] = None
+    if current is not None: set_current(bag, current)
+
+# --- Seeded Streams ---
+
+def new_session_seed():
+    """Returns a fresh session seed (a plain integer, easy to note down and replay)."""
+    return random.SystemRandom().randrange(10 ** 9)
+
+def session_rng(seed, stream):
+    """Returns the reproducible random stream for one part of a session, e.g. "player:0" or "presets".
+
+    Streams are independent, so one player's picks don't shift another's when their timing differs."""
+    return random.Random(f"{seed}:{stream}")
+
+# --- Picking ---
+
+def pick(bag, rng=random):
+    """Returns a random track that is not blocked, or any track if all are blocked (None if the bag is empty).
+
+    Weighted bags pick in proportion to the track weights (uniformly if all candidate weights are 0)."""
+    tracks = bag["tracks"]
+    if not tracks: return None
+    count = bag["available"] if bag["available"] > 0 else len(tracks) # All played recently - allow repeats
+    if bag["tree"] is not None:
+        total = _tree_prefix(bag["tree"], count)
+        if total > 0: return tracks[min(count - 1, _tree_find(bag["tree"], rng.random() * total))]
+    return tracks[rng.randrange(count)]
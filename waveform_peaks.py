@@ -0,0 +1,222 @@
+# waveform_peaks.py
+# Peak summaries for the waveform display. Like decoding.py this module has no
+# Tkinter/Pygame dependencies, so it can run on the background decode pool.
+
+import os
+
+import numpy as np
+import soundfile as sf
+
+import cache_files
+
+# --- Constants ---
+PEAK_CACHE_VERSION = 3 # Bump when the stored peak format changes (old files are then ignored)
+PEAK_CACHE_MAX_FILES = 20000 # prune_peak_cache keeps at most this many cached tracks
+PYRAMID_BASE_SHIFT = 10 # Pyramid level 0 has one bucket per 2**10 = 1024 samples (~23 ms at 44.1 kHz)
+PYRAMID_MIN_BUCKETS = 64 # Stop halving once a pyramid level is this small
+PYRAMID_BUCKETS_PER_PIXEL = 4 # render_peaks uses the coarsest level with at least this many buckets per pixel
+
+# --- Peak Cache State ---
+peak_cache_dir = None # Set by set_peak_cache_dir; None disables the on-disk cache
+
+# --- Peak Functions ---
+# A peak summary is a (num_buckets, 3) float32 array of [min, max, rms] of the mono mix per
+# pixel bucket, in -1..1 sample units. It is built block by block with NumPy reductions, so
+# memory stays constant no matter how long the track is - whether the blocks come from a
+# buffer already in memory or are streamed from disk with sf.blocks.
+
+def _new_summary_state(num_buckets, samples_per_bucket):
+    """Returns the running accumulators for a peak summary."""
+    return {"min": np.full(num_buckets, np.inf), "max": np.full(num_buckets, -np.inf),
+            "sumsq": np.zeros(num_buckets), "count": np.zeros(num_buckets, dtype=np.int64),
+            "samples_per_bucket": samples_per_bucket, "pos": 0}
+
+def _accumulate_block(state, mono):
+    """Folds one block of mono float samples into the summary accumulators."""
+    n = len(mono)
+    if n == 0: return
+    spb = state["samples_per_bucket"]
+    num_buckets = len(state["min"])
+    pos = state["pos"]
+    first = pos // spb
+    if first >= num_buckets:
+        # More samples than the header promised - fold the excess into the last bucket
+        buckets = np.array([num_buckets - 1])
+        starts = np.array([0])
+    else:
+        last = min((pos + n - 1) // spb, num_buckets - 1)
+        buckets = np.arange(first, last + 1)
+        starts = buckets * spb - pos
+        starts[0] = 0 # First bucket may have started in the previous block
+
+    state["min"][buckets] = np.minimum(state["min"][buckets], np.minimum.reduceat(mono, starts))
+    state["max"][buckets] = np.maximum(state["max"][buckets], np.maximum.reduceat(mono, starts))
+    state["sumsq"][buckets] += np.add.reduceat(np.square(mono), starts, dtype=np.float64)
+    state["count"][buckets] += np.diff(np.append(starts, n))
+    state["pos"] = pos + n
+
+def _finish_summary(state):
+    """Turns the accumulators into the (num_buckets, 3) [min, max, rms] float32 summary."""
+    count = state["count"]
+    summary = np.zeros((len(count), 3), dtype=np.float32)
+    filled = count > 0
+    summary[filled, 0] = state["min"][filled]
+    summary[filled, 1] = state["max"][filled]
+    summary[filled, 2] = np.sqrt(state["sumsq"][filled] / count[filled])
+    # Tracks shorter than the width leave empty buckets: repeat the last filled one
+    if not filled.all() and filled.any():
+        last_filled = np.maximum.accumulate(np.where(filled, np.arange(len(count)), 0))
+        summary = summary[last_filled]
+    return summary
+
+def _mono_mix(block, scale):
+    """Mixes a (frames, channels) block to mono float32, scaled by scale.
+
+    Adding channel columns is much faster than block.mean(axis=1) on a narrow axis,
+    and exact for int16 input (float32 holds sums of a few int16 values exactly)."""
+    mono = block[:, 0].astype(np.float32)
+    for channel in range(1, block.shape[1]):
+        mono += block[:, channel]
+    mono *= scale
+    return mono
+
+def summary_to_display_peaks(summary):
+    """Converts a peak summary to the normalized (0 to 1) absolute peaks the waveform canvas draws."""
+    peaks = np.maximum(np.abs(summary[:, 0]), np.abs(summary[:, 1])).astype(np.float64)
+    max_amp = peaks.max() if len(peaks) else 0.0
+    if max_amp == 0: max_amp = 1.0
+    return (peaks / max_amp).tolist()
+
+# --- Peak Pyramid ---
+# A mip-map of peak summaries: level k has one [min, max, rms] bucket per 2**(PYRAMID_BASE_SHIFT + k)
+# samples. It is built once per track, after which the waveform can be rendered at any canvas
+# width, or for any zoomed region, by reducing the closest level - without touching the audio.
+# A pyramid is a dict: {"frames": int, "base_shift": int, "levels": [(n_k, 3) float32 arrays]}.
+
+def _build_pyramid_levels(level0, frames, base_shift):
+    """Halves level 0 repeatedly (combining min/max/rms of bucket pairs) into the full pyramid."""
+    levels = [level0]
+    samples_per_bucket = 1 << base_shift
+    while len(levels[-1]) > PYRAMID_MIN_BUCKETS:
+        prev = levels[-1]
+        n = len(prev)
+        counts = np.full(n, float(samples_per_bucket))
+        counts[-1] = max(1, frames - (n - 1) * samples_per_bucket) # Last bucket is usually partial
+        sumsq = prev[:, 2].astype(np.float64) ** 2 * counts
+        pairs = n - (n % 2)
+        level = np.empty(((n + 1) // 2, 3), dtype=np.float32)
+        level[:pairs // 2, 0] = np.minimum(prev[0:pairs:2, 0], prev[1:pairs:2, 0])
+        level[:pairs // 2, 1] = np.maximum(prev[0:pairs:2, 1], prev[1:pairs:2, 1])
+        level[:pairs // 2, 2] = np.sqrt((sumsq[0:pairs:2] + sumsq[1:pairs:2]) / (counts[0:pairs:2] + counts[1:pairs:2]))
+        if n % 2: level[-1] = prev[-1] # Odd bucket out carries over unchanged
+        levels.append(level)
+        samples_per_bucket *= 2
+    return levels
+
+def _pyramid_from_state(state, base_shift):
+    """Finishes level-0 accumulators into a pyramid dict."""
+    frames = state["pos"]
+    if frames == 0:
+        return {"frames": 0, "base_shift": base_shift, "levels": [np.zeros((1, 3), dtype=np.float32)]}
+    level0 = _finish_summary(state)[:max(1, -(-frames // (1 << base_shift)))]
+    return {"frames": frames, "base_shift": base_shift, "levels": _build_pyramid_levels(level0, frames, base_shift)}
+
+def build_peak_pyramid_from_pcm(audio_data, blocksize=65536, base_shift=PYRAMID_BASE_SHIFT):
+    """Builds the peak pyramid from a 2D (frames, channels) buffer already in memory (e.g. int16 playback PCM)."""
+    frames = len(audio_data)
+    spb = 1 << base_shift
+    state = _new_summary_state(max(1, -(-frames // spb)), spb)
+    full_scale = float(np.iinfo(audio_data.dtype).max + 1) if np.issubdtype(audio_data.dtype, np.integer) else 1.0
+    scale = np.float32(1.0 / (full_scale * audio_data.shape[1]))
+    for start in range(0, frames, blocksize):
+        _accumulate_block(state, _mono_mix(audio_data[start:start + blocksize], scale))
+    return _pyramid_from_state(state, base_shift)
+
+def build_peak_pyramid_streaming(track_path, blocksize=65536, base_shift=PYRAMID_BASE_SHIFT, should_stop=None):
+    """Builds the peak pyramid by streaming the file with sf.blocks (memory independent of track length).
+
+    should_stop() is polled between blocks; the pass is then abandoned and None returned."""
+    info = sf.info(track_path)
+    spb = 1 << base_shift
+    # Excess frames beyond the header's count are folded into the last bucket
+    state = _new_summary_state(max(1, -(-max(0, info.frames) // spb)), spb)
+    scale = np.float32(1.0 / info.channels)
+    for block in sf.blocks(track_path, blocksize=blocksize, dtype='float32', always_2d=True):
+        if should_stop and should_stop(): return None
+        _accumulate_block(state, _mono_mix(block, scale))
+    return _pyramid_from_state(state, base_shift)
+
+def pixel_buckets(pyramid, num_pixels, start_frame=0, end_frame=None):
+    """Chooses the level and bucket spans render_peaks reduces for each pixel.
+
+    Picks the coarsest level that still has PYRAMID_BUCKETS_PER_PIXEL buckets per pixel, so pixel i
+    covers buckets [starts[i], starts[i + 1]) (the last one up to end_bucket): its edges are the exact
+    pixel edges rounded down to a bucket. Returns (level_index, samples_per_bucket, starts, end_bucket)."""
+    frames = pyramid["frames"]
+    if end_frame is None: end_frame = frames
+    start_frame = max(0, min(start_frame, frames))
+    end_frame = max(start_frame + 1, min(end_frame, max(frames, 1)))
+    frames_per_pixel = (end_frame - start_frame) / max(1, num_pixels)
+
+    level_index = 0
+    while (level_index + 1 < len(pyramid["levels"])
+           and (1 << (pyramid["base_shift"] + level_index + 1)) * PYRAMID_BUCKETS_PER_PIXEL <= frames_per_pixel):
+        level_index += 1
+    spb = 1 << (pyramid["base_shift"] + level_index)
+    end_bucket = min(len(pyramid["levels"][level_index]), max(1, -(-end_frame // spb)))
+    pixel_starts = start_frame + np.arange(num_pixels) * frames_per_pixel
+    starts = np.minimum((pixel_starts // spb).astype(np.int64), end_bucket - 1)
+    return level_index, spb, starts, end_bucket
+
+def render_peaks(pyramid, num_pixels, start_frame=0, end_frame=None):
+    """Renders a (num_pixels, 3) [min, max, rms] summary of frames [start_frame, end_frame) from a pyramid,
+    reducing the buckets pixel_buckets picks for each pixel."""
+    level_index, _, starts, end_bucket = pixel_buckets(pyramid, num_pixels, start_frame, end_frame)
+    view = pyramid["levels"][level_index][:end_bucket]
+    # Zoomed deeper than level 0: neighbouring pixels share a bucket (reduceat then returns it as-is)
+    counts = np.maximum(1, np.diff(np.append(starts, end_bucket)))
+    summary = np.empty((num_pixels, 3), dtype=np.float32)
+    summary[:, 0] = np.minimum.reduceat(view[:, 0], starts)
+    summary[:, 1] = np.maximum.reduceat(view[:, 1], starts)
+    summary[:, 2] = np.sqrt(np.add.reduceat(view[:, 2].astype(np.float64) ** 2, starts) / counts)
+    return summary
+
+# --- On-Disk Peak Cache ---
+# One .npz file per track holding its peak pyramid (float32, roughly 2 MB per hour of audio),
+# named by a hash of the file key from decoding.get_file_key, so an edited file simply misses.
+
+def set_peak_cache_dir(path):
+    """Sets (and creates) the directory for cached peaks. Pass None to disable the cache."""
+    global peak_cache_dir
+    if path is not None:
+        os.makedirs(path, exist_ok=True)
+    peak_cache_dir = path
+
+def _read_pyramid(path):
+    """Reads a cached pyramid file (see save_cached_pyramid)."""
+    with np.load(path, allow_pickle=False) as stored:
+        frames, base_shift, num_levels = (int(v) for v in stored["meta"])
+        return {"frames": frames, "base_shift": base_shift, "levels": [stored[f"level{k}"] for k in range(num_levels)]}
+
+def load_cached_pyramid(file_key):
+    """Returns the cached peak pyramid, or None if not cached (or cache disabled/unreadable, then it is rebuilt)."""
+    if peak_cache_dir is None: return None
+    path = cache_files.cache_path(peak_cache_dir, PEAK_CACHE_VERSION, file_key, ".npz")
+    pyramid = cache_files.load_cache_file(path, _read_pyramid, "Peak cache")
+    if pyramid is None: return None
+    levels = pyramid["levels"]
+    if not levels or any(level.ndim != 2 or level.shape[1] != 3 for level in levels): return None
+    return pyramid
+
+def save_cached_pyramid(file_key, pyramid):
+    """Writes a peak pyramid to the cache."""
+    if peak_cache_dir is None or pyramid is None: return
+    arrays = {f"level{k}": np.asarray(level, dtype=np.float32) for k, level in enumerate(pyramid["levels"])}
+    arrays["meta"] = np.array([pyramid["frames"], pyramid["base_shift"], len(pyramid["levels"])], dtype=np.int64)
+    path = cache_files.cache_path(peak_cache_dir, PEAK_CACHE_VERSION, file_key, ".npz")
+    cache_files.save_cache_file(path, lambda f: np.savez(f, **arrays), "Peak cache")
+
+def prune_peak_cache(max_files=PEAK_CACHE_MAX_FILES):
+    """Deletes the least recently written cache files beyond max_files."""
+    if peak_cache_dir is None: return 0
+    return cache_files.prune_cache_dir(peak_cache_dir, (".npz", ".npy"), "Peak cache", max_files=max_files)